@@ -0,0 +1,89 @@
+"""
+Rebuild time against disk space of the codecs the tarball cache can keep its fast copies in.
+
+Synthetic base, src and lib32 tarballs are compressed with xz, like the ones
+of the mirrors, and re-encoded with every codec. For each of them, the table
+shows the size on disk, the time it took to re-encode it (paid once, when the
+tarball is added to the cache) and the time to extract it (paid on every
+rebuild). The sizes of the tarballs are given as uncompressed MiB; src is
+text, lib32 binaries, and base a mix of both.
+
+Usage: python -m benchmarks.cache_codecs [--size 64] [--workers 1]
+"""
+import argparse
+import io
+import os
+import random
+import tarfile
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from jmanager.utils.file_utils import extract_tarball_into
+from jmanager.utils.print_utils import get_human_readable_size
+from jmanager.utils.tarball_codec import TarballCodec, encode_tarball
+
+MEBIBYTE = 1024 ** 2
+FILE_SIZE = 64 * 1024
+TEXT_RATIO = {'base': 0.5, 'src': 1.0, 'lib32': 0.0}
+
+
+def create_text(size: int, words: list) -> bytes:
+    return b' '.join(random.choices(words, k=size // 6))[:size]
+
+
+def create_binary(size: int) -> bytes:
+    """
+    Half random, half repeated bytes, which compresses about as well as executables.
+    """
+    return (os.urandom(size // 4) + bytes(size // 4)) * 2
+
+
+def create_tarball(path_to_tarball: PosixPath, size: int, text_ratio: float):
+    words = [os.urandom(random.randint(2, 6)).hex().encode() for _ in range(4096)]
+    with tarfile.open(path_to_tarball.as_posix(), mode='w:xz', preset=6) as tar_file:
+        for index in range(size // FILE_SIZE):
+            is_text = index < text_ratio * size // FILE_SIZE
+            content = create_text(FILE_SIZE, words) if is_text else create_binary(FILE_SIZE)
+            member = tarfile.TarInfo(name=f"usr/folder_{index // 100}/file_{index}")
+            member.size = len(content)
+            member.mode = 0o644
+            tar_file.addfile(member, fileobj=io.BytesIO(content))
+
+
+def measure_extraction(path_to_tarball: PosixPath, workers: int) -> float:
+    with TemporaryDirectory(prefix="jmanager_benchmark_", dir=path_to_tarball.parent.as_posix()) as jail_dir:
+        start = perf_counter()
+        extract_tarball_into(jail_path=PosixPath(jail_dir), path_to_tarball=path_to_tarball, callback=None,
+                             workers=workers)
+        return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=64, help="uncompressed size of every tarball, in MiB")
+    parser.add_argument('--workers', type=int, default=1, help="number of extraction workers")
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="jmanager_benchmark_") as temp_dir:
+        print(f"{args.size} MiB per tarball, {args.workers} extraction workers")
+        print("TARBALL\tCODEC\tSIZE\t\tENCODING\tEXTRACTION")
+        for component, text_ratio in TEXT_RATIO.items():
+            path_to_tarball = PosixPath(temp_dir).joinpath(f"{component}.txz")
+            create_tarball(path_to_tarball, size=args.size * MEBIBYTE, text_ratio=text_ratio)
+
+            for codec in TarballCodec:
+                path_to_encoded_tarball = path_to_tarball.with_suffix(f".{codec.extension}")
+                encoding_time = 0.0
+                if codec != TarballCodec.XZ:
+                    start = perf_counter()
+                    encode_tarball(path_to_tarball, path_to_encoded_tarball, codec=codec)
+                    encoding_time = perf_counter() - start
+
+                extraction_time = measure_extraction(path_to_encoded_tarball, workers=args.workers)
+                size = get_human_readable_size(path_to_encoded_tarball.stat().st_size)
+                print(f"{component}\t{codec.value}\t{size}\t\t{encoding_time:.2f} s\t\t{extraction_time:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Per-call overhead of the ways the command runner can start a process.
+
+The same short command, 'true' by default, is run the given number of times
+with every spawn strategy. The shell column quotes the arguments and runs
+them through /bin/sh, which is how the ZFS, jail and ansible commands used to
+be run; the argv columns execute the program directly, with and without
+close_fds (without it, subprocess may use posix_spawn). Each column shows
+the mean time per call. --ballast grows the memory of the benchmark first,
+since the cost of forking grows with the size of the parent process, and
+jmanager keeps decompression buffers and ZFS views in memory.
+
+Usage: python -m benchmarks.command_runner [--calls 500] [--ballast 0] [--command true]
+"""
+import argparse
+import shlex
+import subprocess
+from time import perf_counter
+from typing import List, Dict, Optional
+
+from jmanager.utils.command_runner import CommandRunner, SubprocessSpawnStrategy, CommandResult, split_command
+
+MEBIBYTE = 1024 ** 2
+
+
+class ShellSpawnStrategy(SubprocessSpawnStrategy):
+    """
+    Quotes the arguments and runs them through /bin/sh, as the commands used to be run.
+    """
+
+    def spawn(self, args: List[str], capture: bool, environment: Optional[Dict[str, str]]) -> CommandResult:
+        output = subprocess.PIPE if capture else None
+        process = subprocess.run(' '.join([shlex.quote(arg) for arg in args]), shell=True, stdout=output,
+                                 stderr=output, env=environment, close_fds=self.close_fds, universal_newlines=True)
+        return CommandResult(args=args, return_code=process.returncode, stdout=process.stdout,
+                             stderr=process.stderr)
+
+
+def measure_calls(command_runner: CommandRunner, args, calls: int) -> float:
+    command_runner.run(args)
+    start = perf_counter()
+    for _ in range(calls):
+        command_runner.run(args)
+    return (perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=500, help="number of calls per spawn strategy")
+    parser.add_argument('--ballast', type=int, default=0, help="MiB of memory to allocate before measuring")
+    parser.add_argument('--command', type=str, default='true', help="command to run on every call")
+    args = parser.parse_args()
+
+    ballast = bytearray(args.ballast * MEBIBYTE)
+    for index in range(0, len(ballast), 4096):
+        ballast[index] = 1
+
+    command = split_command(args.command)
+    spawn_strategies = {
+        'SHELL': ShellSpawnStrategy(),
+        'ARGV': SubprocessSpawnStrategy(),
+        'ARGV NO CLOSE_FDS': SubprocessSpawnStrategy(close_fds=False)
+    }
+    timings = [measure_calls(CommandRunner(spawn_strategy), command, args.calls)
+               for spawn_strategy in spawn_strategies.values()]
+
+    print(f"{args.calls} calls of '{args.command}', {args.ballast} MiB of ballast")
+    print('\t'.join(spawn_strategies.keys()))
+    print('\t'.join([f"{timing * 1000:.2f} ms" for timing in timings]))
+
+
+if __name__ == '__main__':
+    main()
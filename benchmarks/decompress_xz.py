@@ -0,0 +1,60 @@
+"""
+Decompression time of a synthetic multi-block xz archive, single-threaded against parallel.
+
+The archive is made of independently compressed blocks, as produced by
+'xz -T' or by concatenating xz streams. The single-threaded column uses
+lzma, the other columns XZBlockReader with the given number of workers.
+
+Usage: python -m benchmarks.decompress_xz [--size 256] [--block-size 8] [--workers 2,4,8]
+"""
+import argparse
+import lzma
+import os
+import random
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from jmanager.utils.xz import open_xz_file
+
+MEBIBYTE = 1024 ** 2
+READ_SIZE = MEBIBYTE
+
+
+def create_multi_block_archive(path_to_archive: PosixPath, size: int, block_size: int):
+    words = [os.urandom(random.randint(2, 10)).hex().encode() for _ in range(4096)]
+    with open(path_to_archive.as_posix(), 'wb') as archive_file:
+        for offset in range(0, size, block_size):
+            block = b' '.join(random.choices(words, k=block_size // 8))[:min(block_size, size - offset)]
+            archive_file.write(lzma.compress(block, preset=1))
+
+
+def measure_decompression(path_to_archive: PosixPath, workers: int) -> float:
+    start = perf_counter()
+    with open_xz_file(path_to_archive, workers=workers) as xz_file:
+        while xz_file.read(READ_SIZE):
+            pass
+    return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=256, help="uncompressed size of the archive, in MiB")
+    parser.add_argument('--block-size', type=int, default=8, help="uncompressed size of every block, in MiB")
+    parser.add_argument('--workers', type=str, default='2,4,8', help="comma separated numbers of workers")
+    args = parser.parse_args()
+
+    workers_list = [int(workers) for workers in args.workers.split(',')]
+    with TemporaryDirectory(prefix="jmanager_benchmark_") as temp_dir:
+        path_to_archive = PosixPath(temp_dir).joinpath('base.txz')
+        create_multi_block_archive(path_to_archive, args.size * MEBIBYTE, args.block_size * MEBIBYTE)
+
+        print(f"{args.size} MiB in blocks of {args.block_size} MiB, {os.cpu_count()} CPUs")
+        print('\t'.join(["SINGLE-THREADED"] + [f"{workers} WORKERS" for workers in workers_list]))
+        timings = [measure_decompression(path_to_archive, workers=1)]
+        timings += [measure_decompression(path_to_archive, workers=workers) for workers in workers_list]
+        print('\t'.join([f"{timing:.2f} s\t" for timing in timings]))
+
+
+if __name__ == '__main__':
+    main()
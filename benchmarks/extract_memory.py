@@ -0,0 +1,93 @@
+"""
+Peak resident memory of extract_tarball_into for tarballs of growing size.
+
+Every extraction runs in a fresh interpreter, so its ru_maxrss only accounts
+for that extraction. The previous implementation, which decompressed the
+whole tarball in memory, is measured alongside for comparison.
+
+Usage: python -m benchmarks.extract_memory [--sizes 32,128,256]
+"""
+import argparse
+import io
+import subprocess
+import sys
+import tarfile
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+
+MEBIBYTE = 1024 ** 2
+FILE_SIZE = 16 * MEBIBYTE
+
+STREAMING_EXTRACTION = """
+import resource, sys
+from pathlib import PosixPath
+from jmanager.utils.file_utils import extract_tarball_into
+
+extract_tarball_into(jail_path=PosixPath(sys.argv[2]), path_to_tarball=PosixPath(sys.argv[1]), callback=None)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+IN_MEMORY_EXTRACTION = """
+import lzma, resource, sys, tarfile
+from tempfile import TemporaryDirectory
+
+with TemporaryDirectory() as temp_dir:
+    with lzma.open(sys.argv[1], 'r') as lz_file, open(f"{temp_dir}/tarball.tar", 'wb') as temp_file:
+        temp_file.write(lz_file.read())
+    with tarfile.open(f"{temp_dir}/tarball.tar", mode='r') as tar_file:
+        for member in tar_file.getmembers():
+            tar_file.extract(member, path=sys.argv[2])
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+class PatternReader(io.RawIOBase):
+    PATTERN = bytes(range(256)) * 64
+
+    def __init__(self, size: int):
+        super().__init__()
+        self._remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        read_bytes = min(len(buffer), self._remaining, len(self.PATTERN))
+        buffer[:read_bytes] = self.PATTERN[:read_bytes]
+        self._remaining -= read_bytes
+        return read_bytes
+
+
+def create_tarball(path_to_tarball: PosixPath, size: int):
+    with tarfile.open(path_to_tarball.as_posix(), mode='w:xz', preset=0) as tar_file:
+        for index in range(max(1, size // FILE_SIZE)):
+            member = tarfile.TarInfo(name=f"usr/share/file_{index}")
+            member.size = min(FILE_SIZE, size)
+            tar_file.addfile(member, fileobj=io.BufferedReader(PatternReader(member.size)))
+
+
+def measure_peak_rss(script: str, path_to_tarball: PosixPath) -> float:
+    with TemporaryDirectory(prefix="jmanager_benchmark_") as jail_dir:
+        output = subprocess.run([sys.executable, '-c', script, path_to_tarball.as_posix(), jail_dir],
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return int(output.split()[-1]) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=str, default='32,128,256',
+                        help="comma separated uncompressed tarball sizes, in MiB")
+    args = parser.parse_args()
+
+    print("UNCOMPRESSED\tSTREAMING PEAK RSS\tIN-MEMORY PEAK RSS")
+    for size in [int(size) * MEBIBYTE for size in args.sizes.split(',')]:
+        with TemporaryDirectory(prefix="jmanager_benchmark_") as temp_dir:
+            path_to_tarball = PosixPath(temp_dir).joinpath('base.txz')
+            create_tarball(path_to_tarball, size)
+            streaming_rss = measure_peak_rss(STREAMING_EXTRACTION, path_to_tarball)
+            in_memory_rss = measure_peak_rss(IN_MEMORY_EXTRACTION, path_to_tarball)
+        print(f"{size // MEBIBYTE} MiB\t\t{streaming_rss:.1f} MiB\t\t{in_memory_rss:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
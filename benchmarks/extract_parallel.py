@@ -0,0 +1,58 @@
+"""
+Extraction time of a tarball with many small files, sequential against parallel.
+
+The sequential column is the streaming extract_tarball_into; the other
+columns use ParallelTarExtractor with the given number of workers.
+
+Usage: python -m benchmarks.extract_parallel [--files 30000] [--workers 2,4,8]
+"""
+import argparse
+import io
+import os
+import tarfile
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from jmanager.utils.file_utils import extract_tarball_into
+
+FILES_PER_FOLDER = 200
+
+
+def create_tarball(path_to_tarball: PosixPath, files: int):
+    with tarfile.open(path_to_tarball.as_posix(), mode='w:xz', preset=0) as tar_file:
+        for index in range(files):
+            member = tarfile.TarInfo(name=f"usr/share/folder_{index // FILES_PER_FOLDER}/file_{index}")
+            content = os.urandom(256 + index % 8192)
+            member.size = len(content)
+            member.mode = 0o644
+            tar_file.addfile(member, fileobj=io.BytesIO(content))
+
+
+def measure_extraction(path_to_tarball: PosixPath, workers: int) -> float:
+    with TemporaryDirectory(prefix="jmanager_benchmark_", dir=path_to_tarball.parent.as_posix()) as jail_dir:
+        start = perf_counter()
+        extract_tarball_into(jail_path=PosixPath(jail_dir), path_to_tarball=path_to_tarball, callback=None,
+                             workers=workers)
+        return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=30000, help="number of files in the tarball")
+    parser.add_argument('--workers', type=str, default='2,4,8', help="comma separated numbers of workers")
+    args = parser.parse_args()
+
+    workers_list = [int(workers) for workers in args.workers.split(',')]
+    with TemporaryDirectory(prefix="jmanager_benchmark_") as temp_dir:
+        path_to_tarball = PosixPath(temp_dir).joinpath('base.txz')
+        create_tarball(path_to_tarball, args.files)
+
+        print('\t'.join(["SEQUENTIAL"] + [f"{workers} WORKERS" for workers in workers_list]))
+        timings = [measure_extraction(path_to_tarball, workers=1)]
+        timings += [measure_extraction(path_to_tarball, workers=workers) for workers in workers_list]
+        print('\t'.join([f"{timing:.2f} s\t" for timing in timings]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Download throughput from a local HTTP server, fixed-size reads against adaptive readinto blocks.
+
+The LEGACY column reads the response 8 KiB at a time, updating the throughput
+meter and calling the progress callback on every block, as fetch_file used to.
+The ADAPTIVE column is HTTPFetcher.fetch_file, reading into a reused buffer whose
+size follows the throughput and throttling the callback. Both write to disk and
+the server uses sendfile, so the client loop is what is being measured.
+
+Usage: python -m benchmarks.fetch_throughput [--size 512] [--runs 3]
+"""
+import argparse
+import os
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter
+from urllib.request import urlopen
+
+from jmanager.utils.fetch import HTTPFetcher
+from jmanager.utils.print_utils import ThroughputMeter
+
+MEBIBYTE = 1024 ** 2
+LEGACY_BLOCK_SIZE = 8192
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def copyfile(self, source, outputfile):
+        outputfile.flush()
+        self.connection.sendfile(source)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def progress_callback(msg: str, received_bytes: int, total_bytes: int, speed: float):
+    pass
+
+
+def legacy_fetch(url: str, destination: PosixPath):
+    with urlopen(url) as fetcher, open(destination.as_posix(), 'wb') as destination_file:
+        file_size = int(fetcher.headers['content-length'])
+        received_bytes = 0
+        throughput_meter = ThroughputMeter()
+        while True:
+            buffer = fetcher.read(LEGACY_BLOCK_SIZE)
+            if not buffer:
+                break
+            received_bytes += len(buffer)
+            throughput_meter.update(received_bytes)
+            progress_callback(destination.name, received_bytes, file_size, throughput_meter.rate)
+            destination_file.write(buffer)
+
+
+def adaptive_fetch(url: str, destination: PosixPath):
+    http_fetcher = HTTPFetcher(segments=1)
+    http_fetcher.fetch_file(url=url, destination=destination, callback=progress_callback)
+
+
+def measure_throughput(fetch, url: str, destination: PosixPath, size: int, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = perf_counter()
+        fetch(url, destination)
+        timings.append(perf_counter() - start)
+        destination.unlink()
+    return size / min(timings) / MEBIBYTE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=512, help="size of the downloaded file, in MiB")
+    parser.add_argument('--runs', type=int, default=3, help="downloads per loop, the fastest one is kept")
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="jmanager_benchmark_") as temp_dir:
+        served_dir = PosixPath(temp_dir).joinpath('served')
+        served_dir.mkdir()
+        with open(served_dir.joinpath('base.txz').as_posix(), 'wb') as served_file:
+            for _ in range(args.size):
+                served_file.write(os.urandom(MEBIBYTE))
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                     partial(QuietHTTPRequestHandler, directory=served_dir.as_posix()))
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/base.txz"
+            destination = PosixPath(temp_dir).joinpath('base.txz')
+            size = args.size * MEBIBYTE
+
+            print(f"{args.size} MiB from {url}")
+            print("LEGACY\t\t\tADAPTIVE")
+            legacy = measure_throughput(legacy_fetch, url, destination, size, args.runs)
+            adaptive = measure_throughput(adaptive_fetch, url, destination, size, args.runs)
+            print(f"{legacy:.1f} MiB/s\t\t{adaptive:.1f} MiB/s\t\t({adaptive / legacy:.2f}x)")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Time to empty a populated base jail before rebuilding it.
+
+The recursive column is the former per-node PosixPath walk followed by
+shutil.rmtree; the scandir column is remove_immutable_path, the fallback
+used when the snapshots of other base jails have to be kept. With
+--data-set, the tree is also created in a ZFS data set of that name (it
+must not exist, and it is destroyed afterwards) and reset by rolling it
+back to an empty snapshot, like BaseJailFactory.reset_base_data_set does.
+That needs a system with ZFS and enough privileges.
+
+Usage: python -m benchmarks.reset_base [--files 100000] [--data-set zroot/jmanager_benchmark]
+"""
+import argparse
+import os
+import shutil
+import sys
+from pathlib import PosixPath
+from stat import SF_IMMUTABLE
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from jmanager.utils.file_utils import remove_immutable_path
+from jmanager.utils.zfs import ZFS
+
+FILES_PER_FOLDER = 100
+EMPTY_SNAPSHOT_NAME = "jmanager_empty"
+
+
+def create_tree(path: PosixPath, files: int):
+    for index in range(files):
+        folder = path.joinpath('usr', 'share', f"folder_{index // (FILES_PER_FOLDER ** 2)}",
+                               f"folder_{index // FILES_PER_FOLDER}")
+        if index % FILES_PER_FOLDER == 0:
+            os.makedirs(folder.as_posix(), exist_ok=True)
+        with open(folder.joinpath(f"file_{index}").as_posix(), 'wb') as file:
+            file.write(b'0' * (index % 512))
+
+
+def set_flags_recursively(path: PosixPath, flags: int):
+    if not path.is_dir() and not path.is_symlink():
+        if sys.platform.startswith('freebsd'):
+            os.chflags(path.as_posix(), flags)
+        return
+
+    if path.is_symlink():
+        return
+
+    for node in path.iterdir():
+        set_flags_recursively(path=node, flags=flags)
+
+
+def remove_recursively(path: PosixPath):
+    set_flags_recursively(path, not SF_IMMUTABLE)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def measure_removal(temp_dir: str, files: int, remove) -> float:
+    tree_path = PosixPath(temp_dir).joinpath('base')
+    create_tree(tree_path, files)
+    start = perf_counter()
+    remove(tree_path)
+    return perf_counter() - start
+
+
+def measure_rollback(data_set: str, files: int) -> float:
+    zfs = ZFS()
+    with TemporaryDirectory(prefix="jmanager_benchmark_") as mountpoint:
+        zfs.zfs_create(data_set=data_set, options={'mountpoint': mountpoint})
+        try:
+            zfs.zfs_snapshot(data_set=data_set, snapshot_name=EMPTY_SNAPSHOT_NAME)
+            create_tree(PosixPath(mountpoint), files)
+            start = perf_counter()
+            zfs.zfs_rollback(data_set=data_set, snapshot_name=EMPTY_SNAPSHOT_NAME)
+            return perf_counter() - start
+        finally:
+            zfs.zfs_destroy(data_set=data_set, arguments=['-r'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=100000, help="number of files in the base jail")
+    parser.add_argument('--data-set', type=str, default=None, help="ZFS data set to measure the rollback with")
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="jmanager_benchmark_") as temp_dir:
+        timings = [measure_removal(temp_dir, args.files, remove_recursively),
+                   measure_removal(temp_dir, args.files, remove_immutable_path)]
+    columns = ["RECURSIVE", "SCANDIR"]
+    if args.data_set is not None:
+        timings.append(measure_rollback(args.data_set, args.files))
+        columns.append("ROLLBACK")
+
+    print(f"{args.files} files")
+    print('\t'.join(columns))
+    print('\t'.join([f"{timing:.2f} s" for timing in timings]))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,14 +4,21 @@ from argparse import Namespace
 from pathlib import PosixPath
 from typing import Dict
 
+from jmanager.commands.base import base_command
+from jmanager.commands.cache import cache_command
 from jmanager.commands.create import create_command
 from jmanager.commands.list import print_list_of_jails, list_command
 from jmanager.factories.base_jail_factory import BaseJailFactory
 from jmanager.factories.data_set_factory import DataSetFactory
 from jmanager.factories.jail_factory import JailFactory
 from jmanager.jail_manager import JailManager
-from jmanager.utils.configuration import read_configuration_file
+from jmanager.utils.bandwidth import BandwidthScheduler
+from jmanager.utils.configuration import read_configuration_file, parse_size, parse_extraction_profiles
+from jmanager.utils.distribution_source import create_distribution_source
 from jmanager.utils.fetch import HTTPFetcher
+from jmanager.utils.mirrors import MirrorSelector
+from jmanager.utils.tarball_cache import TarballCache
+from jmanager.utils.tarball_codec import TarballCodec
 
 
 def execute_commands(args: Namespace):
@@ -24,17 +31,60 @@ def execute_commands(args: Namespace):
 
     data_set_factory = DataSetFactory(zfs_root_data_set=configuration['zfs_root_dataset'])
     base_jail_factory = BaseJailFactory(jail_root_path=jail_root_path,
-                                        data_set_factory=data_set_factory)
+                                        data_set_factory=data_set_factory,
+                                        extraction_workers=int(configuration.get('extraction_workers', 1)),
+                                        decompression_workers=int(configuration.get('decompression_workers', 1)))
     jail_factory = JailFactory(
         base_jail_factory=base_jail_factory,
         jail_config_folder=jail_config_folder
     )
 
-    jail_manager = JailManager(http_fetcher=HTTPFetcher(),
-                               jail_factory=jail_factory)
+    tarball_cache = None
+    if 'tarball_cache_dir' in configuration:
+        tarball_cache = TarballCache(
+            cache_dir=PosixPath(configuration['tarball_cache_dir']),
+            max_size=parse_size(configuration.get('tarball_cache_max_size', TarballCache.DEFAULT_MAX_SIZE)),
+            codec=TarballCodec(configuration.get('tarball_cache_codec', TarballCodec.XZ.value))
+        )
+
+    mirror_selector = None
+    if configuration.get('mirrors'):
+        mirror_selector = MirrorSelector(
+            mirrors=configuration['mirrors'],
+            ranking_ttl=float(configuration.get('mirror_ranking_ttl', MirrorSelector.RANKING_TTL)),
+            ranking_file=jail_config_folder.joinpath('mirrors.yaml')
+        )
+
+    bandwidth_flow = None
+    if configuration.get('bandwidth_limit'):
+        bandwidth_scheduler = BandwidthScheduler(rate=parse_size(configuration['bandwidth_limit']),
+                                                 state_file=jail_config_folder.joinpath('bandwidth.state'))
+        bandwidth_flow = bandwidth_scheduler.get_flow(weight=float(configuration.get('bandwidth_weight', 1)))
+
+    http_fetcher = HTTPFetcher(
+        max_workers=int(configuration.get('fetch_workers', HTTPFetcher.MAX_WORKERS)),
+        tarball_cache=tarball_cache,
+        segments=int(configuration.get('fetch_segments', HTTPFetcher.SEGMENTS)),
+        segment_threshold=parse_size(configuration.get('fetch_segment_threshold', HTTPFetcher.SEGMENT_THRESHOLD)),
+        mirror_selector=mirror_selector,
+        bandwidth_flow=bandwidth_flow,
+        download_dir=PosixPath(configuration.get('download_dir', jail_config_folder.joinpath('downloads')))
+    )
+    verify_source = bool(configuration.get('distribution_source_verify', False))
+    distribution_source = create_distribution_source(
+        location=configuration.get('distribution_source', 'http'),
+        http_fetcher=http_fetcher,
+        verify=verify_source
+    )
+    jail_manager = JailManager(distribution_source=distribution_source,
+                               jail_factory=jail_factory,
+                               stream_tarballs=bool(configuration.get('stream_tarballs', False)))
+
+    extraction_profiles = parse_extraction_profiles(configuration)
 
     if args.command == 'create':
-        create_command(jail_manager=jail_manager, jmanagerfile=args.jmanagerfile)
+        create_command(jail_manager=jail_manager, jmanagerfile=args.jmanagerfile, http_fetcher=http_fetcher,
+                       extraction_profiles=extraction_profiles, verify_source=verify_source)
     elif args.command == 'destroy':
         jail_manager.destroy_jail(args.jail_name)
     elif args.command == 'list':
@@ -45,6 +95,14 @@ def execute_commands(args: Namespace):
         jail_manager.stop(jail_name=args.jail_name)
     elif args.command == 'configure':
         jail_manager.configure_jail(jail_name=args.jail_name)
+    elif args.command == 'cache':
+        cache_command(action=args.action, http_fetcher=http_fetcher,
+                      jmanagerfile=args.jmanagerfile, max_size=args.max_size,
+                      extraction_profiles=extraction_profiles)
+    elif args.command == 'base':
+        base_command(action=args.action, jail_manager=jail_manager, jmanagerfile=args.jmanagerfile,
+                     from_version=args.from_version, http_fetcher=http_fetcher,
+                     extraction_profiles=extraction_profiles, verify_source=verify_source)
     elif args.command == 'provision':
         jail_manager.provision_jail(jail_name=args.jail_name,
                                     provision_file=PosixPath(args.provision_file))
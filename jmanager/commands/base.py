@@ -0,0 +1,72 @@
+from enum import Enum
+from pathlib import PosixPath
+from typing import Dict, List
+
+from jmanager.jail_manager import JailManager
+from jmanager.models.distribution import Distribution, Version
+from jmanager.models.extraction_profile import ExtractionProfile
+from jmanager.utils.configuration import parse_jmanagerfile, read_configuration_file
+from jmanager.utils.distribution_source import create_distribution_source
+from jmanager.utils.fetch import HTTPFetcher
+from jmanager.utils.print_utils import get_human_readable_size
+
+BASE_STATUS_HEADER = "VERSION\t\tARCH\tCOMPONENTS\tSTATUS"
+
+
+class BaseAction(Enum):
+    STATUS = 'status'
+    UPDATE = 'update'
+
+
+def print_base_jail_status(jail_manager: JailManager):
+    print(BASE_STATUS_HEADER)
+    for distribution in jail_manager.list_base_jails():
+        components = ','.join([component.value for component in distribution.components])
+        status = jail_manager.get_base_jail_status(distribution)
+        print(f"{distribution.version}\t{distribution.architecture.value}\t{components}\t{status.value}")
+
+
+def update_base_jails(jail_manager: JailManager, jmanagerfile: str, from_version: str = None,
+                      http_fetcher: HTTPFetcher = None, extraction_profiles: Dict[str, ExtractionProfile] = None,
+                      verify_source: bool = False):
+    """
+    Updates the base jails to the distributions of the Jmanagerfile.
+    :param from_version: The version of the base jails to be updated, or None to refresh the ones
+    of the same version.
+    :param verify_source: Whether to verify the tarballs of the sources set in the Jmanagerfile.
+    """
+    jmanagerfile_list = parse_jmanagerfile(read_configuration_file(PosixPath(jmanagerfile)),
+                                           extraction_profiles=extraction_profiles)
+
+    updated_distributions: List[Distribution] = []
+    for jmanagerfile in jmanagerfile_list:
+        new_distribution = jmanagerfile.distribution
+        if new_distribution in updated_distributions:
+            continue
+        version = new_distribution.version if from_version is None else Version.from_string(from_version)
+        distribution = Distribution(version=version, architecture=new_distribution.architecture,
+                                    components=new_distribution.components, profile=new_distribution.profile)
+
+        distribution_source = None
+        if jmanagerfile.source is not None:
+            distribution_source = create_distribution_source(jmanagerfile.source, http_fetcher=http_fetcher,
+                                                             verify=verify_source)
+        summary = jail_manager.update_base_jail(distribution=distribution, version=new_distribution.version,
+                                                distribution_source=distribution_source)
+        print(f"{summary.written_files} files written ({get_human_readable_size(summary.written_bytes)}), "
+              f"{summary.unchanged_files} unchanged, {summary.removed_files} removed")
+        updated_distributions.append(new_distribution)
+
+
+def base_command(action: str, jail_manager: JailManager, jmanagerfile: str = None, from_version: str = None,
+                 http_fetcher: HTTPFetcher = None, extraction_profiles: Dict[str, ExtractionProfile] = None,
+                 verify_source: bool = False):
+    base_action = BaseAction(action)
+    if base_action == BaseAction.STATUS:
+        print_base_jail_status(jail_manager)
+    elif base_action == BaseAction.UPDATE:
+        if jmanagerfile is None:
+            raise ValueError("error: A Jmanagerfile is needed to update the base jails")
+        update_base_jails(jail_manager, jmanagerfile=jmanagerfile, from_version=from_version,
+                          http_fetcher=http_fetcher, extraction_profiles=extraction_profiles,
+                          verify_source=verify_source)
@@ -0,0 +1,71 @@
+from datetime import datetime
+from enum import Enum
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from typing import Dict
+
+from jmanager.console_utils import print_progress_bar_fetch
+from jmanager.models.extraction_profile import ExtractionProfile
+from jmanager.utils.configuration import parse_jmanagerfile, read_configuration_file, parse_size
+from jmanager.utils.fetch import HTTPFetcher
+from jmanager.utils.print_utils import get_human_readable_size
+from jmanager.utils.tarball_cache import TarballCache
+
+CACHE_HEADER = "VERSION\t\tARCH\tCOMPONENT\tSIZE\t\tLAST USED"
+
+
+class CacheAction(Enum):
+    LIST = 'list'
+    PRUNE = 'prune'
+    WARM = 'warm'
+
+
+def print_cache_entries(tarball_cache: TarballCache):
+    print(CACHE_HEADER)
+    for entry in tarball_cache.list_entries():
+        last_access = datetime.fromtimestamp(entry.last_access).strftime('%Y-%m-%d %H:%M')
+        print(f"{entry.version}\t{entry.architecture.value}\t{entry.component.value}\t\t"
+              f"{get_human_readable_size(entry.size)}\t{last_access}")
+    print(f"Total: {get_human_readable_size(tarball_cache.size)} of "
+          f"{get_human_readable_size(tarball_cache.max_size)}")
+
+
+def prune_cache(tarball_cache: TarballCache, max_size: str = None):
+    evicted_entries = tarball_cache.prune(max_size=None if max_size is None else parse_size(max_size))
+    for entry in evicted_entries:
+        print(f"Removed {entry.version}/{entry.architecture.value}/{entry.component.value}")
+
+
+def warm_cache(http_fetcher: HTTPFetcher, jmanagerfile: str,
+               extraction_profiles: Dict[str, ExtractionProfile] = None):
+    jmanagerfile_list = parse_jmanagerfile(read_configuration_file(PosixPath(jmanagerfile)),
+                                           extraction_profiles=extraction_profiles)
+
+    for jmanagerfile in jmanagerfile_list:
+        distribution = jmanagerfile.distribution
+        with TemporaryDirectory(prefix="jmanager_", suffix="_tarballs") as temp_dir:
+            print(f"Warming the cache for {distribution.version}/{distribution.architecture.value} ...")
+            http_fetcher.fetch_tarballs_into(version=distribution.version,
+                                             architecture=distribution.architecture,
+                                             components=distribution.components,
+                                             temp_dir=PosixPath(temp_dir),
+                                             callback=print_progress_bar_fetch)
+    http_fetcher.tarball_cache.wait_for_fast_copies()
+
+
+def cache_command(action: str, http_fetcher: HTTPFetcher, jmanagerfile: str = None, max_size: str = None,
+                  extraction_profiles: Dict[str, ExtractionProfile] = None):
+    tarball_cache = http_fetcher.tarball_cache
+    if tarball_cache is None:
+        raise ValueError("error: The tarball cache is not configured, set 'tarball_cache_dir' in the configuration")
+
+    cache_action = CacheAction(action)
+    if cache_action == CacheAction.LIST:
+        print_cache_entries(tarball_cache)
+    elif cache_action == CacheAction.PRUNE:
+        prune_cache(tarball_cache, max_size=max_size)
+    elif cache_action == CacheAction.WARM:
+        if jmanagerfile is None:
+            raise ValueError("error: A Jmanagerfile is needed to warm the cache")
+        warm_cache(http_fetcher, jmanagerfile=jmanagerfile, extraction_profiles=extraction_profiles)
+
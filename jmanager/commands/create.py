@@ -1,15 +1,26 @@
 from pathlib import PosixPath
+from typing import Dict
 
 from jmanager.jail_manager import JailManager
+from jmanager.models.extraction_profile import ExtractionProfile
 from jmanager.utils.configuration import parse_jmanagerfile, read_configuration_file
+from jmanager.utils.distribution_source import create_distribution_source
+from jmanager.utils.fetch import HTTPFetcher
 
 
-def create_command(jmanagerfile: str, jail_manager: JailManager):
+def create_command(jmanagerfile: str, jail_manager: JailManager, http_fetcher: HTTPFetcher,
+                   extraction_profiles: Dict[str, ExtractionProfile] = None, verify_source: bool = False):
     jmanagerfile_path = PosixPath(jmanagerfile)
-    jmanagerfile_list = parse_jmanagerfile(read_configuration_file(jmanagerfile_path))
+    jmanagerfile_list = parse_jmanagerfile(read_configuration_file(jmanagerfile_path),
+                                           extraction_profiles=extraction_profiles)
 
     for jmanagerfile in jmanagerfile_list:
-        jail_manager.create_jail(jail_data=jmanagerfile.jail, distribution=jmanagerfile.distribution)
+        distribution_source = None
+        if jmanagerfile.source is not None:
+            distribution_source = create_distribution_source(jmanagerfile.source, http_fetcher=http_fetcher,
+                                                             verify=verify_source)
+        jail_manager.create_jail(jail_data=jmanagerfile.jail, distribution=jmanagerfile.distribution,
+                                 distribution_source=distribution_source)
         jail_manager.configure_jail(jail_name=jmanagerfile.jail.name)
         jail_manager.start(jail_name=jmanagerfile.jail.name)
         jail_manager.provision_jail(jail_name=jmanagerfile.jail.name, provision_file=jmanagerfile.provision_file_path)
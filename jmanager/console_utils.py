@@ -1,17 +1,94 @@
-from jmanager.utils.print_utils import get_progress_text
+import sys
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Callable, List, TextIO, Dict, Tuple, Optional
 
+from jmanager.utils.print_utils import get_progress_text, get_human_readable_size
 
-def print_progress_bar_extract(msg: str, iteration: int, total: int):
-    progress_text = get_progress_text(msg, iteration, total)
+CURSOR_UP = '\x1b[%dF'
+CLEAR_LINE = '\x1b[K'
 
-    print('\r%s ' % progress_text, end='\r')
-    if iteration == total:
-        print()
 
+class ProgressDisplay:
+    """
+    Draws one progress bar per task, e.g. per download running at the same time.
 
-def print_progress_bar_fetch(msg, iteration, total, speed):
-    progress_text = get_progress_text(msg, iteration, total)
+    Updates are only stored, the bars are redrawn at most FRAME_RATE times per second
+    and whenever a task finishes. Finished bars are left on the screen above the ones
+    still running. Nothing is drawn when the output is not a terminal.
+    """
+    FRAME_RATE = 10
+
+    def __init__(self, stream: TextIO = None, frame_rate: int = FRAME_RATE, enabled: bool = None,
+                 clock: Callable[[], float] = monotonic):
+        self._stream = stream
+        self._frame_interval = 1.0 / frame_rate
+        self._enabled = enabled
+        self._clock = clock
+        self._lock = Lock()
+        self._active_bars: Dict[str, Tuple[int, int, Optional[float]]] = OrderedDict()
+        self._finished_bars: List[str] = []
+        self._drawn_lines = 0
+        self._last_frame = None
+        self._checked_stream = None
+        self._is_terminal = False
+
+    @property
+    def stream(self) -> TextIO:
+        return self._stream if self._stream is not None else sys.stdout
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is not None:
+            return self._enabled
+        stream = self.stream
+        if self._checked_stream is not stream:
+            self._checked_stream, self._is_terminal = stream, stream.isatty()
+        return self._is_terminal
+
+    def update(self, msg: str, iteration: int, total: int, speed: float = None):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if iteration >= total:
+                self._active_bars.pop(msg, None)
+                self._finished_bars.append(self.get_bar_text(msg, iteration, total, speed))
+            else:
+                self._active_bars[msg] = (iteration, total, speed)
+
+            now = self._clock()
+            if iteration < total and self._last_frame is not None and now - self._last_frame < self._frame_interval:
+                return
+            self._last_frame = now
+            self._draw()
+
+    @staticmethod
+    def get_bar_text(msg: str, iteration: int, total: int, speed: float = None) -> str:
+        progress_text = get_progress_text(msg, iteration, total)
+        if speed is not None:
+            progress_text = f"{progress_text} {get_human_readable_size(speed)}/s"
+        return progress_text
 
-    print('\r%s %2.2f Mbps  ' % (progress_text, speed / 1e6), end='\r')
-    if iteration == total:
-        print()
+    def _draw(self):
+        lines = self._finished_bars + [self.get_bar_text(msg, *progress)
+                                       for msg, progress in self._active_bars.items()]
+        frame = CURSOR_UP % self._drawn_lines if self._drawn_lines else ''
+        frame += ''.join([f"{line}{CLEAR_LINE}\n" for line in lines])
+        self._finished_bars = []
+        self._drawn_lines = len(self._active_bars)
+
+        self.stream.write(frame)
+        self.stream.flush()
+
+
+PROGRESS_DISPLAY = ProgressDisplay()
+
+
+def print_progress_bar_extract(msg: str, iteration: int, total: int):
+    PROGRESS_DISPLAY.update(msg, iteration, total)
+
+
+def print_progress_bar_fetch(msg, iteration, total, speed):
+    PROGRESS_DISPLAY.update(msg, iteration, total, speed=speed)
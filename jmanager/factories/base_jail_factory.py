@@ -1,18 +1,30 @@
 from pathlib import PosixPath
-from typing import List, Callable
+from typing import List, Callable, ContextManager, Optional
 
 from jmanager.factories.data_set_factory import DataSetFactory
 from jmanager.models.distribution import Distribution, Component, Version, Architecture
+from jmanager.models.extraction_profile import ExtractionProfile
 from jmanager.models.jail import JailError
-from jmanager.utils.file_utils import remove_immutable_path, extract_tarball_into
+from jmanager.utils.base_update import BaseUpdateSummary, update_tree_from_tarballs, restore_tree_from_snapshot, \
+    ZFS_CONTROL_FOLDER
+from jmanager.utils.file_utils import remove_immutable_path, extract_tarball_into, extract_tarball_stream_into, \
+    TarballStream
+from jmanager.utils.tarball_codec import get_tarball_path
 
 
 class BaseJailFactory:
     SNAPSHOT_NAME = "jmanager_base_jail"
+    EMPTY_SNAPSHOT_NAME = "jmanager_empty"
+    UPSTREAM_MODIFIED_PROPERTY = "jmanager:upstream_modified"
+    EXTRACTION_PROFILE_PROPERTY = "jmanager:extraction_profile"
+    PROFILE_SEPARATOR = "__profile_"
 
-    def __init__(self, jail_root_path: PosixPath, data_set_factory: DataSetFactory):
+    def __init__(self, jail_root_path: PosixPath, data_set_factory: DataSetFactory, extraction_workers: int = 1,
+                 decompression_workers: int = 1):
         self._jail_root_path = jail_root_path
         self._data_set_factory = data_set_factory
+        self._extraction_workers = extraction_workers
+        self._decompression_workers = decompression_workers
 
         if jail_root_path.exists() and not jail_root_path.is_dir():
             raise PermissionError("The jail root path exists and it is not a directory")
@@ -23,6 +35,14 @@ class BaseJailFactory:
     def data_set_factory(self) -> DataSetFactory:
         return self._data_set_factory
 
+    @property
+    def extraction_workers(self) -> int:
+        return self._extraction_workers
+
+    @property
+    def decompression_workers(self) -> int:
+        return self._decompression_workers
+
     def get_jail_mountpoint(self, jail_data_set_name: str) -> PosixPath:
         jail_path = self._jail_root_path.joinpath(jail_data_set_name)
         return jail_path
@@ -31,84 +51,387 @@ class BaseJailFactory:
     def get_data_set_name(distribution) -> str:
         return f"{distribution.version}_{distribution.architecture.value}"
 
-    def get_snapshot_name(self, component_list: List[Component]):
+    def get_snapshot_name(self, component_list: List[Component], profile: ExtractionProfile = None):
+        """
+        Base jails extracted with a profile get its name as a suffix, e.g.
+        jmanager_base_jail_lib32__profile_minimal, so they can live next to the complete ones. The
+        components are joined with single underscores, so the first double underscore always starts
+        the separator, whatever the name of the profile is.
+        """
         components = component_list.copy()
         if Component.BASE in components:
             components.remove(Component.BASE)
 
         components.sort()
-        if not components:
-            return self.SNAPSHOT_NAME
-        component_extension = '_'.join([dist.value for dist in components])
-        return f"{self.SNAPSHOT_NAME}_{component_extension}"
+        snapshot_name = self.SNAPSHOT_NAME
+        if components:
+            component_extension = '_'.join([dist.value for dist in components])
+            snapshot_name = f"{self.SNAPSHOT_NAME}_{component_extension}"
+        if profile is not None:
+            snapshot_name = f"{snapshot_name}{self.PROFILE_SEPARATOR}{profile.name}"
+        return snapshot_name
+
+    def get_snapshot_components(self, snapshot_name: str) -> List[Component]:
+        components = [Component.BASE]
+        snapshot_name = snapshot_name.partition(self.PROFILE_SEPARATOR)[0]
+        for component in snapshot_name.replace(self.SNAPSHOT_NAME, '').split('_'):
+            if component:
+                components.append(Component(component))
+        return components
+
+    def get_snapshot_profile_name(self, snapshot_name: str) -> Optional[str]:
+        snapshot_name, separator, profile_name = snapshot_name.partition(self.PROFILE_SEPARATOR)
+        return profile_name if separator else None
 
     def base_jail_exists(self, distribution: Distribution):
         base_jail_name = self.get_data_set_name(distribution)
-        snapshot_name = self.get_snapshot_name(component_list=distribution.components)
+        snapshot_name = self.get_snapshot_name(component_list=distribution.components, profile=distribution.profile)
         return self._data_set_factory.snapshot_exists(base_jail_name, snapshot_name)
 
+    def profile_matches(self, distribution: Distribution, snapshot_name: str = None) -> bool:
+        """
+        :return: Whether the snapshot, the one of the base jail by default, was extracted with the
+        same rules as the profile of the distribution, which may have changed under the same name.
+        """
+        if distribution.profile is None:
+            return True
+        if snapshot_name is None:
+            snapshot_name = self.get_snapshot_name(distribution.components, profile=distribution.profile)
+        digest = self._data_set_factory.get_snapshot_property(data_set_name=self.get_data_set_name(distribution),
+                                                              snapshot_name=snapshot_name,
+                                                              property_name=self.EXTRACTION_PROFILE_PROPERTY)
+        return digest == distribution.profile.digest
+
     def create_base_jail(self, distribution: Distribution, path_to_tarballs: PosixPath,
-                         callback: Callable[[str, int, int], None] = None):
+                         callback: Callable[[str, int, int], None] = None, upstream_modified: float = None,
+                         wait_for_tarball: Callable[[Component], None] = None):
+        """
+        :param wait_for_tarball: Blocks until the tarball of a component is in the folder, so components
+        can be extracted while the next ones are still being fetched. Without it, the tarballs of all the
+        components must be in the folder already.
+        """
         if self.base_jail_exists(distribution):
             raise JailError(f"The base jail for '{distribution.version}/{distribution.architecture.value}' exists")
 
-        for component in distribution.components:
-            if not path_to_tarballs.joinpath(f"{component.value}.txz").is_file():
+        installed_components = self.get_installed_components(distribution)
+        missing_components = [component for component in distribution.components
+                               if component not in installed_components]
+        for component in missing_components:
+            if wait_for_tarball is None and get_tarball_path(path_to_tarballs, component) is None:
                 raise FileNotFoundError(f"Component '{component.value}' not found in {path_to_tarballs}")
 
-        jail_data_set_name = f"{distribution.version}_{distribution.architecture.value}"
-        jail_path = self.get_jail_mountpoint(jail_data_set_name=jail_data_set_name)
-        if not self._data_set_factory.base_data_set_exists(data_set_name=self.get_data_set_name(distribution)):
-            self._data_set_factory.create_base_data_set(self.get_data_set_name(distribution), jail_path)
-        else:
-            remove_immutable_path(jail_path)
-
-        self.extract_components_into_base_jail(components=distribution.components,
+        jail_path = self.prepare_base_data_set(distribution, installed_components=installed_components)
+        self.extract_components_into_base_jail(components=missing_components,
                                                jail_path=jail_path,
                                                path_to_tarballs=path_to_tarballs,
                                                data_set_name=self.get_data_set_name(distribution=distribution),
-                                               callback=callback)
+                                               callback=callback,
+                                               installed_components=installed_components,
+                                               upstream_modified=upstream_modified,
+                                               wait_for_tarball=wait_for_tarball,
+                                               profile=distribution.profile)
+
+    def create_base_jail_from_streams(self, distribution: Distribution,
+                                      open_tarball: Callable[[Component], ContextManager[TarballStream]],
+                                      callback: Callable[[str, int, int], None] = None,
+                                      upstream_modified: float = None):
+        if self.base_jail_exists(distribution):
+            raise JailError(f"The base jail for '{distribution.version}/{distribution.architecture.value}' exists")
+
+        installed_components = self.get_installed_components(distribution)
+        missing_components = [component for component in distribution.components
+                               if component not in installed_components]
+        jail_path = self.prepare_base_data_set(distribution, installed_components=installed_components)
+        self.extract_component_streams_into_base_jail(components=missing_components,
+                                                      jail_path=jail_path,
+                                                      open_tarball=open_tarball,
+                                                      data_set_name=self.get_data_set_name(distribution=distribution),
+                                                      callback=callback,
+                                                      installed_components=installed_components,
+                                                      upstream_modified=upstream_modified,
+                                                      profile=distribution.profile)
+
+    def update_base_jail(self, distribution: Distribution, version: Version, path_to_tarballs: PosixPath,
+                         callback: Callable[[str, int, int], None] = None, upstream_modified: float = None,
+                         wait_for_tarball: Callable[[Component], None] = None) -> BaseUpdateSummary:
+        """
+        Brings a base jail to another version, or refreshes it with the current tarballs of its own
+        version, writing only the files that differ between the existing base and the new tarballs.
+
+        A base jail moving to another version is cloned into the data set of the new version, which
+        must not exist yet, so unchanged files share their blocks with the previous base. A refreshed
+        base jail is updated in place and its snapshot taken again, so it must be the latest snapshot
+        of its data set and no jail may be cloned from it. Either way, only the snapshot of the whole
+        set of components is taken. If the update fails, the new data set is destroyed, or the
+        refreshed base jail rolled back to its snapshot, so it is never left half updated.
+        :param distribution: The existing base jail.
+        :param version: The version to update it to.
+        """
+        if not self.base_jail_exists(distribution):
+            raise JailError(f"The base jail for '{distribution.version}/{distribution.architecture.value}' "
+                            f"does not exist")
+        new_distribution = Distribution(version=version, architecture=distribution.architecture,
+                                        components=distribution.components, profile=distribution.profile)
+        data_set_name = self.get_data_set_name(distribution)
+        new_data_set_name = self.get_data_set_name(new_distribution)
+        snapshot_name = self.get_snapshot_name(distribution.components, profile=distribution.profile)
+        jail_path = self.get_jail_mountpoint(new_data_set_name)
+
+        if new_data_set_name != data_set_name:
+            if self._data_set_factory.base_data_set_exists(data_set_name=new_data_set_name):
+                raise JailError(f"The data set for '{version}/{distribution.architecture.value}' exists, "
+                                f"destroy its base jails first")
+            self._data_set_factory.clone(data_set_name=data_set_name, snapshot_name=snapshot_name,
+                                         clone_data_set_name=new_data_set_name,
+                                         options={"mountpoint": jail_path.as_posix()})
+        else:
+            if self._data_set_factory.get_latest_snapshot(data_set_name=data_set_name) != snapshot_name:
+                raise JailError(f"The base jail for '{distribution}' is not the latest snapshot of its data set")
+            if self._data_set_factory.list_clones(data_set_name=data_set_name, snapshot_name=snapshot_name):
+                raise JailError(f"There are jails cloned from the base jail for '{distribution}', "
+                                f"destroy them first")
+            self._data_set_factory.rollback(data_set_name=data_set_name, snapshot_name=snapshot_name)
+
+        def _get_tarball_paths():
+            for component in distribution.components:
+                if wait_for_tarball is not None:
+                    wait_for_tarball(component)
+                path_to_tarball = get_tarball_path(path_to_tarballs, component)
+                if path_to_tarball is None:
+                    raise FileNotFoundError(f"Component '{component.value}' not found in {path_to_tarballs}")
+                yield path_to_tarball
+
+        try:
+            summary = update_tree_from_tarballs(jail_path=jail_path, paths_to_tarballs=_get_tarball_paths(),
+                                                callback=callback, profile=distribution.profile)
+        except BaseException:
+            if new_data_set_name != data_set_name:
+                self._data_set_factory.delete_data_set(data_set_name=new_data_set_name)
+            else:
+                self._data_set_factory.rollback(data_set_name=data_set_name, snapshot_name=snapshot_name)
+            raise
+
+        properties = {}
+        if upstream_modified is not None:
+            properties[self.UPSTREAM_MODIFIED_PROPERTY] = str(int(upstream_modified))
+        if distribution.profile is not None:
+            properties[self.EXTRACTION_PROFILE_PROPERTY] = distribution.profile.digest
+        if new_data_set_name == data_set_name:
+            self._data_set_factory.delete_snapshot(data_set_name=data_set_name, snapshot_name=snapshot_name)
+        self._data_set_factory.create_snapshot(data_set_name=new_data_set_name, snapshot=snapshot_name,
+                                               properties=properties)
+        return summary
+
+    @staticmethod
+    def get_snapshot_path(jail_path: PosixPath, snapshot_name: str) -> PosixPath:
+        """
+        :return: The folder where ZFS shows the files of a snapshot of the data set mounted at jail_path.
+        """
+        return jail_path.joinpath(ZFS_CONTROL_FOLDER, 'snapshot', snapshot_name)
+
+    def get_reusable_snapshot(self, distribution: Distribution) -> Optional[str]:
+        """
+        The snapshot of the base data set with the most components, all of them part of the distribution,
+        extracted with the same profile. The newest one wins a tie. Reusing the latest snapshot is a
+        rollback, while an older one is restored from its .zfs/snapshot folder, so it is only considered
+        when that folder can be read.
+        :return: The name of the snapshot, or None if no snapshot can be reused.
+        """
+        data_set_name = self.get_data_set_name(distribution)
+        if not self._data_set_factory.base_data_set_exists(data_set_name=data_set_name):
+            return None
+
+        jail_path = self.get_jail_mountpoint(jail_data_set_name=data_set_name)
+        snapshots = self._data_set_factory.list_snapshots(data_set_name=data_set_name)
+        reusable_snapshot = None
+        reusable_components = 0
+        for position, snapshot_name in enumerate(reversed(snapshots)):
+            if not snapshot_name.startswith(self.SNAPSHOT_NAME) or \
+                    self.get_snapshot_profile_name(snapshot_name) != distribution.profile_name:
+                continue
+            components = self.get_snapshot_components(snapshot_name=snapshot_name)
+            if len(components) <= reusable_components or not set(components).issubset(distribution.components):
+                continue
+            if position > 0 and not self.get_snapshot_path(jail_path, snapshot_name).is_dir():
+                continue
+            if not self.profile_matches(distribution, snapshot_name=snapshot_name):
+                continue
+            reusable_snapshot = snapshot_name
+            reusable_components = len(components)
+        return reusable_snapshot
+
+    def get_installed_components(self, distribution: Distribution) -> List[Component]:
+        """
+        Components of the snapshot of the base data set that can be reused to create the distribution.
+        :param distribution: The distribution to be created.
+        :return: The components that do not need to be extracted again, or an empty list.
+        """
+        reusable_snapshot = self.get_reusable_snapshot(distribution)
+        if reusable_snapshot is None:
+            return []
+        installed_components = self.get_snapshot_components(snapshot_name=reusable_snapshot)
+        return [component for component in distribution.components if component in installed_components]
+
+    def get_missing_components(self, distribution: Distribution) -> List[Component]:
+        installed_components = self.get_installed_components(distribution)
+        return [component for component in distribution.components if component not in installed_components]
+
+    def prepare_base_data_set(self, distribution: Distribution,
+                              installed_components: List[Component] = ()) -> PosixPath:
+        """
+        Leaves the base data set with the installed components only. When their snapshot is the latest
+        one, the data set is rolled back to it. Otherwise, a rollback would destroy the newer snapshots,
+        which other base jails and their clones depend on, so the tree is restored from the older
+        snapshot instead.
+        """
+        data_set_name = self.get_data_set_name(distribution)
+        jail_path = self.get_jail_mountpoint(jail_data_set_name=data_set_name)
+        if not self._data_set_factory.base_data_set_exists(data_set_name=data_set_name):
+            self.create_base_data_set(data_set_name=data_set_name, jail_path=jail_path)
+        elif installed_components:
+            snapshot_name = self.get_snapshot_name(list(installed_components), profile=distribution.profile)
+            if self._data_set_factory.get_latest_snapshot(data_set_name=data_set_name) == snapshot_name:
+                self._data_set_factory.rollback(data_set_name=data_set_name, snapshot_name=snapshot_name)
+            else:
+                restore_tree_from_snapshot(jail_path=jail_path,
+                                           snapshot_path=self.get_snapshot_path(jail_path, snapshot_name))
+        else:
+            self.reset_base_data_set(data_set_name=data_set_name, jail_path=jail_path)
+        return jail_path
+
+    def create_base_data_set(self, data_set_name: str, jail_path: PosixPath):
+        """
+        Creates the base data set with an empty snapshot, so it can be reset by rolling back to it.
+        """
+        self._data_set_factory.create_base_data_set(data_set_name, jail_path)
+        self._data_set_factory.create_snapshot(data_set_name=data_set_name, snapshot=self.EMPTY_SNAPSHOT_NAME)
+
+    def reset_base_data_set(self, data_set_name: str, jail_path: PosixPath):
+        """
+        Empties the base data set before extracting all the components again. It is rolled back to
+        its empty snapshot when that is the latest one, or destroyed and created again when it has no
+        snapshots, which are constant-time operations. Otherwise, the snapshots of other base jails
+        and the jails cloned from them must be kept, and the files are removed one by one.
+        """
+        latest_snapshot = self._data_set_factory.get_latest_snapshot(data_set_name=data_set_name)
+        if latest_snapshot == self.EMPTY_SNAPSHOT_NAME:
+            self._data_set_factory.rollback(data_set_name=data_set_name, snapshot_name=self.EMPTY_SNAPSHOT_NAME)
+        elif latest_snapshot is None:
+            self._data_set_factory.delete_data_set(data_set_name=data_set_name)
+            self.create_base_data_set(data_set_name=data_set_name, jail_path=jail_path)
+        else:
+            remove_immutable_path(jail_path)
 
     def extract_components_into_base_jail(self, components: List[Component], jail_path: PosixPath,
                                           path_to_tarballs: PosixPath, data_set_name: str,
-                                          callback: Callable[[str, int, int], None]):
-        processed_components = []
-        for component in components:
+                                          callback: Callable[[str, int, int], None],
+                                          installed_components: List[Component] = (),
+                                          upstream_modified: float = None,
+                                          wait_for_tarball: Callable[[Component], None] = None,
+                                          profile: ExtractionProfile = None):
+        def _extract_component(component: Component):
+            if wait_for_tarball is not None:
+                wait_for_tarball(component)
+            path_to_tarball = get_tarball_path(path_to_tarballs, component)
+            if path_to_tarball is None:
+                raise FileNotFoundError(f"Component '{component.value}' not found in {path_to_tarballs}")
             extract_tarball_into(
                 jail_path=jail_path,
-                path_to_tarball=path_to_tarballs.joinpath(f"{component.value}.txz"),
-                callback=callback
+                path_to_tarball=path_to_tarball,
+                callback=callback,
+                workers=self._extraction_workers,
+                decompression_workers=self._decompression_workers,
+                profile=profile
             )
+
+        self.snapshot_components(components=components, data_set_name=data_set_name,
+                                 extract_component=_extract_component, installed_components=installed_components,
+                                 upstream_modified=upstream_modified, profile=profile)
+
+    def extract_component_streams_into_base_jail(self, components: List[Component], jail_path: PosixPath,
+                                                 open_tarball: Callable[[Component], ContextManager[TarballStream]],
+                                                 data_set_name: str, callback: Callable[[str, int, int], None],
+                                                 installed_components: List[Component] = (),
+                                                 upstream_modified: float = None,
+                                                 profile: ExtractionProfile = None):
+        def _extract_component(component: Component):
+            with open_tarball(component) as tarball_stream:
+                extract_tarball_stream_into(jail_path=jail_path, tarball_stream=tarball_stream,
+                                            tarball_name=f"{component.value}.{tarball_stream.codec.extension}",
+                                            callback=callback, profile=profile)
+
+        self.snapshot_components(components=components, data_set_name=data_set_name,
+                                 extract_component=_extract_component, installed_components=installed_components,
+                                 upstream_modified=upstream_modified, profile=profile)
+
+    def snapshot_components(self, components: List[Component], data_set_name: str,
+                            extract_component: Callable[[Component], None],
+                            installed_components: List[Component] = (), upstream_modified: float = None,
+                            profile: ExtractionProfile = None):
+        """
+        Extracts the components one by one, taking a snapshot after each of them. The snapshots
+        record when the upstream distribution was last modified, or when the oldest of the
+        components reused from a previous snapshot was, and the digest of the extraction profile.
+        """
+        if upstream_modified is not None and installed_components:
+            installed_modified = self.get_upstream_modification_time(
+                data_set_name=data_set_name,
+                snapshot_name=self.get_snapshot_name(list(installed_components), profile=profile))
+            upstream_modified = None if installed_modified is None else min(installed_modified, upstream_modified)
+
+        properties = {}
+        if upstream_modified is not None:
+            properties[self.UPSTREAM_MODIFIED_PROPERTY] = str(int(upstream_modified))
+        if profile is not None:
+            properties[self.EXTRACTION_PROFILE_PROPERTY] = profile.digest
+
+        processed_components = list(installed_components)
+        for component in components:
+            extract_component(component)
             processed_components.append(component)
-            snapshot_name = self.get_snapshot_name(component_list=processed_components)
+            snapshot_name = self.get_snapshot_name(component_list=processed_components, profile=profile)
 
             if not self._data_set_factory.snapshot_exists(data_set_name=data_set_name, snapshot=snapshot_name):
-                self._data_set_factory.create_snapshot(data_set_name=data_set_name, snapshot=snapshot_name)
+                self._data_set_factory.create_snapshot(data_set_name=data_set_name, snapshot=snapshot_name,
+                                                       properties=properties)
+
+    def get_upstream_modification_time(self, data_set_name: str, snapshot_name: str) -> Optional[float]:
+        value = self._data_set_factory.get_snapshot_property(data_set_name=data_set_name,
+                                                             snapshot_name=snapshot_name,
+                                                             property_name=self.UPSTREAM_MODIFIED_PROPERTY)
+        return None if value is None else float(value)
 
     def destroy_base_jail(self, distribution: Distribution):
         base_jail_data_set_name = self.get_data_set_name(distribution)
         if self.base_jail_exists(distribution=distribution):
-            snapshot_name = self.get_snapshot_name(component_list=distribution.components)
+            snapshot_name = self.get_snapshot_name(component_list=distribution.components,
+                                                   profile=distribution.profile)
             self._data_set_factory.delete_snapshot(data_set_name=base_jail_data_set_name,
                                                    snapshot_name=snapshot_name)
 
         if not len(self.list_base_jails()):
+            if self._data_set_factory.snapshot_exists(data_set_name=base_jail_data_set_name,
+                                                      snapshot=self.EMPTY_SNAPSHOT_NAME):
+                self._data_set_factory.delete_snapshot(data_set_name=base_jail_data_set_name,
+                                                       snapshot_name=self.EMPTY_SNAPSHOT_NAME)
             self._data_set_factory.delete_data_set(data_set_name=f"{base_jail_data_set_name}")
 
     def list_base_jails(self) -> List[Distribution]:
         distribution_list = []
         for snapshot in self._data_set_factory.list_of_snapshots():
-            snapshot_name = snapshot.split('@')[1].replace(f"{self.SNAPSHOT_NAME}", '')
+            snapshot_name = snapshot.split('@')[1]
             data_set = snapshot.split('@')[0].replace(f"{self._data_set_factory}/", '')
+            if not snapshot_name.startswith(self.SNAPSHOT_NAME):
+                continue
 
-            components = []
-            for component in snapshot_name.split('_'):
-                if component:
-                    components.append(Component(component))
+            components = self.get_snapshot_components(snapshot_name=snapshot_name)
+            profile_name = self.get_snapshot_profile_name(snapshot_name=snapshot_name)
             version = Version.from_string(data_set.split('_')[0])
             architecture = Architecture(data_set.split('_')[1])
             distribution_list.append(Distribution(version=version, architecture=architecture,
-                                                  components=components))
+                                                  components=components,
+                                                  profile=None if profile_name is None else
+                                                  ExtractionProfile(name=profile_name)))
         return distribution_list
 
     def __eq__(self, other: 'BaseJailFactory') -> bool:
@@ -1,7 +1,8 @@
 from pathlib import PosixPath
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-from jmanager.utils.zfs import ZFS, ZFSProperty, ZFSType
+from jmanager.utils.zfs import ZFS, ZFSError
+from jmanager.utils.zfs_cache import ZFSStateCache
 
 
 class DataSetFactory:
@@ -9,21 +10,56 @@ class DataSetFactory:
 
     def __init__(self, zfs_root_data_set: str):
         self._zfs_root_data_set = zfs_root_data_set
+        self._zfs_state = ZFSStateCache(zfs=self.ZFS_FACTORY, root_data_set=zfs_root_data_set)
+
+    @property
+    def zfs_state(self) -> ZFSStateCache:
+        return self._zfs_state
+
+    def refresh(self):
+        """
+        Reloads the state of the data sets, to see the changes made by other programs.
+        """
+        self._zfs_state.refresh()
 
     def get_data_set_path(self, data_set_name: str):
         return f"{self._zfs_root_data_set}/{data_set_name}"
 
-    def base_data_set_exists(self, data_set_name: str):
-        data_set = self.get_data_set_path(data_set_name=data_set_name)
-        return len(self.ZFS_FACTORY.zfs_list(data_set=data_set))
+    def base_data_set_exists(self, data_set_name: str) -> bool:
+        return self._zfs_state.data_set_exists(self.get_data_set_path(data_set_name=data_set_name))
+
+    def snapshot_exists(self, data_set_name: str, snapshot: str) -> bool:
+        return self._zfs_state.snapshot_exists(self.get_data_set_path(data_set_name=data_set_name), snapshot)
 
-    def snapshot_exists(self, data_set_name: str, snapshot: str):
+    def create_snapshot(self, data_set_name: str, snapshot: str, properties: Dict[str, str] = None):
         data_set = self.get_data_set_path(data_set_name=data_set_name)
-        return len(self.ZFS_FACTORY.zfs_list(f"{data_set}@{snapshot}"))
+        self.ZFS_FACTORY.zfs_snapshot(data_set=data_set, snapshot_name=snapshot, options=properties)
+        self._zfs_state.add_snapshot(data_set, snapshot)
 
-    def create_snapshot(self, data_set_name: str, snapshot: str):
+    def get_snapshot_property(self, data_set_name: str, snapshot_name: str, property_name: str) -> Optional[str]:
+        snapshot = f"{self.get_data_set_path(data_set_name=data_set_name)}@{snapshot_name}"
+        try:
+            properties = self.ZFS_FACTORY.zfs_get(data_set=snapshot, properties=[property_name])
+        except ZFSError:
+            return None
+        value = properties.get(snapshot, {}).get(property_name)
+        return None if value in (None, '-') else value
+
+    def rollback(self, data_set_name: str, snapshot_name: str):
         data_set = self.get_data_set_path(data_set_name=data_set_name)
-        self.ZFS_FACTORY.zfs_snapshot(data_set=data_set, snapshot_name=snapshot)
+        self.ZFS_FACTORY.zfs_rollback(data_set=data_set, snapshot_name=snapshot_name)
+
+    def list_snapshots(self, data_set_name: str) -> List[str]:
+        """
+        :return: The names of the snapshots of the data set, from the oldest to the newest.
+        """
+        return self._zfs_state.list_snapshots(self.get_data_set_path(data_set_name=data_set_name))
+
+    def get_latest_snapshot(self, data_set_name: str) -> Optional[str]:
+        snapshots = self.list_snapshots(data_set_name=data_set_name)
+        if not snapshots:
+            return None
+        return snapshots[-1]
 
     def create_base_data_set(self, data_set_name: str, mountpoint: PosixPath):
         data_set = self.get_data_set_path(data_set_name=data_set_name)
@@ -33,22 +69,22 @@ class DataSetFactory:
                      "dedup": "sha512",
                      "atime": "off"}
         )
+        self._zfs_state.add_data_set(data_set)
 
     def delete_snapshot(self, data_set_name: str, snapshot_name: str):
         data_set = self.get_data_set_path(data_set_name=data_set_name)
         self.ZFS_FACTORY.zfs_destroy(data_set=f"{data_set}@{snapshot_name}")
+        self._zfs_state.remove_snapshot(data_set, snapshot_name)
 
     def delete_data_set(self, data_set_name: str):
         data_set = self.get_data_set_path(data_set_name=data_set_name)
         self.ZFS_FACTORY.zfs_destroy(data_set=data_set)
+        self._zfs_state.remove_data_set(data_set)
 
     def list_of_snapshots(self) -> List[str]:
-        items = self.ZFS_FACTORY.zfs_list(data_set=self._zfs_root_data_set, depth=-1,
-                                          properties=[ZFSProperty.NAME],
-                                          types=[ZFSType.SNAPSHOT])
         list_of_snapshots: List[str] = []
-        for item in items:
-            data_set_name = item[ZFSProperty.NAME].replace(f"{self._zfs_root_data_set}/", '')
+        for snapshot in self._zfs_state.list_all_snapshots():
+            data_set_name = snapshot.replace(f"{self._zfs_root_data_set}/", '')
             list_of_snapshots.append(data_set_name)
         return list_of_snapshots
 
@@ -58,6 +94,16 @@ class DataSetFactory:
             data_set=self.get_data_set_path(clone_data_set_name),
             options=options
         )
+        self._zfs_state.add_data_set(self.get_data_set_path(clone_data_set_name))
+
+    def list_clones(self, data_set_name: str, snapshot_name: str) -> List[str]:
+        """
+        :return: The names of the data sets cloned from the snapshot.
+        """
+        snapshot = f"{self.get_data_set_path(data_set_name=data_set_name)}@{snapshot_name}"
+        origins = self.ZFS_FACTORY.zfs_get(data_set=self._zfs_root_data_set, depth=-1, properties=['origin'])
+        return [data_set.replace(f"{self._zfs_root_data_set}/", '') for data_set, properties in origins.items()
+                if properties.get('origin') == snapshot]
 
     def __eq__(self, other: 'DataSetFactory') -> bool:
         return self._zfs_root_data_set == other._zfs_root_data_set
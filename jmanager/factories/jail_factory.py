@@ -7,10 +7,12 @@ from jmanager.models.distribution import Distribution, Version
 from jmanager.models.jail import Jail, JailError
 from jmanager.models.jail_parameter import JailParameter
 from jmanager.factories.base_jail_factory import BaseJailFactory
+from jmanager.utils.command_runner import COMMAND_RUNNER
 
 
 class JailFactory:
     JAIL_CMD = "jail"
+    COMMAND_RUNNER = COMMAND_RUNNER
 
     DEFAULT_JAIL_OPTIONS: Dict[JailParameter, str] = {
         JailParameter.PATH: '',
@@ -74,7 +76,8 @@ class JailFactory:
         jail_mountpoint = self._base_jail_factory.get_jail_mountpoint(jail_data_set_name)
 
         clone_properties: Dict[str, str] = {"mountpoint": jail_mountpoint.as_posix()}
-        snapshot_name = self._base_jail_factory.get_snapshot_name(component_list=distribution.components)
+        snapshot_name = self._base_jail_factory.get_snapshot_name(component_list=distribution.components,
+                                                                  profile=distribution.profile)
         self._base_jail_factory.data_set_factory.clone(
             data_set_name=self._base_jail_factory.get_data_set_name(distribution),
             snapshot_name=snapshot_name,
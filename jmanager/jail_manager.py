@@ -1,24 +1,34 @@
 import os
-import subprocess
 from distutils.file_util import copy_file
+from enum import Enum
+from functools import partial
 from pathlib import PosixPath
-from tempfile import TemporaryDirectory
 from typing import List
 
 from jmanager.console_utils import print_progress_bar_extract, print_progress_bar_fetch
-from jmanager.models.distribution import Distribution
+from jmanager.models.distribution import Distribution, Version
 from jmanager.models.jail import Jail, JailError
 from jmanager.utils.ansible import Ansible
-from jmanager.utils.fetch import HTTPFetcher
+from jmanager.utils.base_update import BaseUpdateSummary
+from jmanager.utils.command_runner import split_command
+from jmanager.utils.distribution_source import DistributionSource
 from jmanager.utils.jail_configuration import create_private_key, configure_services, \
     configure_ssh_service_configuration_file, read_port_from_config_file, write_public_key
 from jmanager.factories.jail_factory import JailFactory
 
 
+class BaseJailStatus(Enum):
+    UP_TO_DATE = 'up to date'
+    OUTDATED = 'outdated'
+    UNKNOWN = 'unknown'
+
+
 class JailManager:
-    def __init__(self, http_fetcher: HTTPFetcher, jail_factory: JailFactory):
-        self._http_fetcher = http_fetcher
+    def __init__(self, distribution_source: DistributionSource, jail_factory: JailFactory,
+                 stream_tarballs: bool = False):
+        self._distribution_source = distribution_source
         self._jail_factory = jail_factory
+        self._stream_tarballs = stream_tarballs
         self._ansible = Ansible()
 
         if not self._jail_factory.jail_config_folder.is_dir():
@@ -30,21 +40,48 @@ class JailManager:
         if not self._private_key_path.is_file():
             create_private_key(priv_key_file_path=self._private_key_path)
 
-    def create_jail(self, jail_data: Jail, distribution: Distribution):
+    @property
+    def distribution_source(self) -> DistributionSource:
+        return self._distribution_source
+
+    def create_jail(self, jail_data: Jail, distribution: Distribution, distribution_source: DistributionSource = None):
+        """
+        :param distribution_source: Where the tarballs of the base jail come from, if it has to be
+        created, instead of the default distribution source.
+        """
+        if distribution_source is None:
+            distribution_source = self._distribution_source
+
+        base_jail_factory = self._jail_factory.base_jail_factory
+        if base_jail_factory.base_jail_exists(distribution) and not base_jail_factory.profile_matches(distribution):
+            raise JailError(f"The base jail for '{distribution}' was extracted with other rules for the "
+                            f"'{distribution.profile_name}' profile, destroy it first")
+
+        upstream_modified = None
         if not self._jail_factory.base_jail_factory.base_jail_exists(distribution=distribution):
-            with TemporaryDirectory(prefix="jmanager_", suffix="_tarballs") as temp_dir:
-                print("Fetching tarballs ...")
-                path_to_temp_dir = PosixPath(temp_dir)
-                self._http_fetcher.fetch_tarballs_into(
+            upstream_modified = distribution_source.get_upstream_modification_time(
+                version=distribution.version, architecture=distribution.architecture)
+
+        if self._stream_tarballs and not self._jail_factory.base_jail_factory.base_jail_exists(distribution):
+            print("Fetching and extracting tarballs ...")
+            self._jail_factory.base_jail_factory.create_base_jail_from_streams(
+                distribution=distribution,
+                open_tarball=partial(distribution_source.open_tarball_stream,
+                                     distribution.version, distribution.architecture),
+                callback=print_progress_bar_extract,
+                upstream_modified=upstream_modified)
+        elif not self._jail_factory.base_jail_factory.base_jail_exists(distribution=distribution):
+            print("Fetching tarballs and creating the base jail ...")
+            with distribution_source.provide_tarballs(
                     version=distribution.version,
                     architecture=distribution.architecture,
-                    components=distribution.components,
-                    temp_dir=path_to_temp_dir,
-                    callback=print_progress_bar_fetch)
-                print("Creating the base jail ...")
+                    components=self._jail_factory.base_jail_factory.get_missing_components(distribution),
+                    callback=print_progress_bar_fetch) as tarball_folder:
                 self._jail_factory.base_jail_factory.create_base_jail(distribution=distribution,
-                                                                      path_to_tarballs=path_to_temp_dir,
-                                                                      callback=print_progress_bar_extract)
+                                                                      path_to_tarballs=tarball_folder.path,
+                                                                      callback=print_progress_bar_extract,
+                                                                      upstream_modified=upstream_modified,
+                                                                      wait_for_tarball=tarball_folder.wait_for)
 
         self._jail_factory.create_jail(jail_data=jail_data, distribution=distribution)
         list_of_jails = self._jail_factory.list_jails()
@@ -63,6 +100,51 @@ class JailManager:
     def list_base_jails(self) -> List[Distribution]:
         return self._jail_factory.base_jail_factory.list_base_jails()
 
+    def get_base_jail_status(self, distribution: Distribution) -> BaseJailStatus:
+        """
+        Compares the upstream modification time recorded in the base jail snapshot with the
+        one of the distribution on the server, so base jails are only rebuilt when the
+        upstream snapshot has changed since.
+        """
+        base_jail_factory = self._jail_factory.base_jail_factory
+        local_modified = base_jail_factory.get_upstream_modification_time(
+            data_set_name=base_jail_factory.get_data_set_name(distribution),
+            snapshot_name=base_jail_factory.get_snapshot_name(component_list=distribution.components,
+                                                              profile=distribution.profile))
+        if local_modified is None:
+            return BaseJailStatus.UNKNOWN
+
+        upstream_modified = self._distribution_source.get_upstream_modification_time(
+            version=distribution.version, architecture=distribution.architecture)
+        if upstream_modified is None:
+            return BaseJailStatus.UNKNOWN
+        if upstream_modified > local_modified:
+            return BaseJailStatus.OUTDATED
+        return BaseJailStatus.UP_TO_DATE
+
+    def update_base_jail(self, distribution: Distribution, version: Version,
+                         distribution_source: DistributionSource = None) -> BaseUpdateSummary:
+        """
+        Updates the base jail of the distribution to the version, or refreshes it if it is the same one.
+        :param distribution_source: Where the new tarballs come from, instead of the default distribution source.
+        """
+        if distribution_source is None:
+            distribution_source = self._distribution_source
+
+        base_jail_factory = self._jail_factory.base_jail_factory
+        upstream_modified = distribution_source.get_upstream_modification_time(
+            version=version, architecture=distribution.architecture)
+        print(f"Fetching tarballs and updating the base jail for '{distribution}' to {version} ...")
+        with distribution_source.provide_tarballs(version=version,
+                                                  architecture=distribution.architecture,
+                                                  components=distribution.components,
+                                                  callback=print_progress_bar_fetch) as tarball_folder:
+            return base_jail_factory.update_base_jail(distribution=distribution, version=version,
+                                                      path_to_tarballs=tarball_folder.path,
+                                                      callback=print_progress_bar_extract,
+                                                      upstream_modified=upstream_modified,
+                                                      wait_for_tarball=tarball_folder.wait_for)
+
     def get_jail_mountpoint(self, jail_name: str) -> PosixPath:
         return self._jail_factory.base_jail_factory.get_jail_mountpoint(jail_data_set_name=jail_name)
 
@@ -72,15 +154,13 @@ class JailManager:
             copy_file('/etc/resolv.conf', path_to_jail.joinpath('etc').as_posix())
 
         jail_config_file = self._jail_factory.get_config_file_path(jail_name)
-        cmd = f"{self._jail_factory.JAIL_CMD} -f {jail_config_file} -c {jail_name}"
-        return subprocess.run(cmd, shell=True, check=True,
-                              universal_newlines=True).stdout
+        cmd = [*split_command(self._jail_factory.JAIL_CMD), '-f', jail_config_file.as_posix(), '-c', jail_name]
+        return self._jail_factory.COMMAND_RUNNER.run(cmd, capture=False).stdout
 
     def stop(self, jail_name: str):
         jail_config_file = self._jail_factory.get_config_file_path(jail_name)
-        cmd = f"{self._jail_factory.JAIL_CMD} -f {jail_config_file} -r {jail_name}"
-        return subprocess.run(cmd, shell=True, check=True,
-                              universal_newlines=True).stdout
+        cmd = [*split_command(self._jail_factory.JAIL_CMD), '-f', jail_config_file.as_posix(), '-r', jail_name]
+        return self._jail_factory.COMMAND_RUNNER.run(cmd, capture=False).stdout
 
     def get_jail_port(self, jail_name: str) -> int:
         port = -1
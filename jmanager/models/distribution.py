@@ -1,9 +1,11 @@
 from enum import Enum
 from pathlib import PosixPath
-from typing import List
+from typing import List, Optional
 
 import yaml
 
+from jmanager.models.extraction_profile import ExtractionProfile
+
 
 class Architecture(Enum):
     AMD64 = "amd64"
@@ -91,13 +93,15 @@ class Version:
 
 
 class Distribution:
-    def __init__(self, version: Version, architecture: Architecture, components: List[Component]):
+    def __init__(self, version: Version, architecture: Architecture, components: List[Component],
+                 profile: ExtractionProfile = None):
         self._version = version
         self._components = components.copy()
         if Component.BASE not in self._components:
             self._components.append(Component.BASE)
         self._components.sort()
         self._architecture = architecture
+        self._profile = profile
 
     @property
     def version(self) -> Version:
@@ -111,15 +115,26 @@ class Distribution:
     def components(self) -> List[Component]:
         return self._components
 
+    @property
+    def profile(self) -> Optional[ExtractionProfile]:
+        return self._profile
+
+    @property
+    def profile_name(self) -> Optional[str]:
+        return None if self._profile is None else self._profile.name
+
     def __hash__(self):
         return hash(self.__repr__())
 
     def __repr__(self):
         components = [component.value for component in self.components]
-        return f"{self.version}/{self.architecture.value}/{components}"
+        if self._profile is None:
+            return f"{self.version}/{self.architecture.value}/{components}"
+        return f"{self.version}/{self.architecture.value}/{components}/{self._profile.name}"
 
     def __eq__(self, other: 'Distribution') -> bool:
         is_equal = self.version == other.version and self.architecture == other.architecture
+        is_equal = is_equal and self.profile_name == other.profile_name
         return is_equal and set(self.components) == set(other.components)
 
     def __ne__(self, other: 'Distribution') -> bool:
@@ -131,6 +146,8 @@ class Distribution:
             'architecture': self.architecture.value,
             'components': [comp.value for comp in self.components]
         }
+        if self._profile is not None:
+            configuration['profile'] = self._profile.to_dict()
         with open(path_to_file.as_posix(), 'w') as config_file:
             yaml.dump(configuration, stream=config_file)
 
@@ -140,8 +157,12 @@ class Distribution:
             configuration = yaml.load(stream=config_file, Loader=yaml.Loader)
 
         components = [Component(comp) for comp in configuration['components']]
+        profile = None
+        if configuration.get('profile') is not None:
+            profile = ExtractionProfile.from_dict(configuration['profile'])
         return Distribution(
             version=Version.from_string(configuration['version']),
             architecture=Architecture(configuration['architecture']),
-            components=components
+            components=components,
+            profile=profile
         )
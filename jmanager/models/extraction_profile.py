@@ -0,0 +1,104 @@
+import hashlib
+import re
+import tarfile
+from fnmatch import fnmatchcase
+from typing import List, Dict, Any, Iterable, Iterator, Set
+
+PROFILE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+GLOB_CHARACTERS = '*?['
+
+
+class ExtractionProfile:
+    """
+    Named set of rules selecting the members of the tarballs extracted into a base jail.
+
+    Rules are either paths relative to the root of the jail, e.g. 'usr/share/doc', which
+    match that path and everything below it, or glob patterns, e.g. 'usr/lib/*_p.a', which
+    match whole member names ('*' matches slashes too). A member is extracted when there are
+    no include rules or it matches one of them, and it matches no exclude rule. The folders
+    leading to included paths are extracted as well, and hard links to members that are not
+    extracted are skipped along with them.
+    """
+
+    def __init__(self, name: str, include: Iterable[str] = (), exclude: Iterable[str] = ()):
+        if not PROFILE_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid extraction profile name '{name}', "
+                             f"only letters, digits, '_' and '-' are allowed")
+        self._name = name
+        self._include = [self.normalize_path(rule) for rule in include]
+        self._exclude = [self.normalize_path(rule) for rule in exclude]
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def include(self) -> List[str]:
+        return self._include
+
+    @property
+    def exclude(self) -> List[str]:
+        return self._exclude
+
+    @property
+    def digest(self) -> str:
+        """
+        Identifies the rules of the profile, so base jails extracted with other rules under the
+        same name can be told apart.
+        """
+        rules = '\n'.join(['include', *self._include, 'exclude', *self._exclude])
+        return hashlib.sha256(rules.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def normalize_path(path: str) -> str:
+        while path.startswith('./'):
+            path = path[2:]
+        path = path.strip('/')
+        return '' if path == '.' else path
+
+    @staticmethod
+    def match_rule(rule: str, name: str) -> bool:
+        if any(character in rule for character in GLOB_CHARACTERS):
+            return fnmatchcase(name, rule)
+        return name == rule or name.startswith(f"{rule}/")
+
+    def selects(self, member_name: str) -> bool:
+        name = self.normalize_path(member_name)
+        if not name:
+            return True
+        if self._include and not any(self.match_rule(rule, name) or rule.startswith(f"{name}/")
+                                     for rule in self._include):
+            return False
+        return not any(self.match_rule(rule, name) for rule in self._exclude)
+
+    def filter_members(self, members: Iterable[tarfile.TarInfo]) -> Iterator[tarfile.TarInfo]:
+        skipped_members: Set[str] = set()
+        for member in members:
+            if not self.selects(member.name) or (member.islnk() and member.linkname in skipped_members):
+                skipped_members.add(member.name)
+                continue
+            yield member
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self._name,
+            'include': self._include,
+            'exclude': self._exclude
+        }
+
+    @staticmethod
+    def from_dict(profile: Dict[str, Any]) -> 'ExtractionProfile':
+        for key in ['include', 'exclude']:
+            if not isinstance(profile.get(key, []), list):
+                raise ValueError(f"The '{key}' rules of an extraction profile must be a list")
+        return ExtractionProfile(name=str(profile.get('name', '')), include=profile.get('include', []),
+                                 exclude=profile.get('exclude', []))
+
+    def __eq__(self, other: 'ExtractionProfile') -> bool:
+        return isinstance(other, ExtractionProfile) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash((self._name, self.digest))
+
+    def __repr__(self):
+        return self._name
@@ -1,10 +1,11 @@
 from pathlib import PosixPath
 from tempfile import mkstemp
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 import yaml
 
 from jmanager.models.distribution import Distribution, Version, Architecture, Component
+from jmanager.models.extraction_profile import ExtractionProfile
 from jmanager.models.jail import Jail
 from jmanager.models.jail_parameter import JailParameter
 
@@ -12,9 +13,11 @@ from jmanager.models.jail_parameter import JailParameter
 class JManagerFile:
     def __init__(self, jail_name: str, version: Version, architecture: Architecture,
                  components: List[Component] = (), jail_parameters: Dict[JailParameter, str] = None,
-                 provision: Dict[str, Any] = None):
-        self._distribution = Distribution(version=version, architecture=architecture, components=components)
+                 provision: Dict[str, Any] = None, source: str = None, profile: ExtractionProfile = None):
+        self._distribution = Distribution(version=version, architecture=architecture, components=components,
+                                          profile=profile)
         self._jail = Jail(name=jail_name, parameters=jail_parameters)
+        self._source = source
 
         if provision is not None:
             if provision['type'] == 'inline':
@@ -47,3 +50,7 @@ class JManagerFile:
     @property
     def provision_file_path(self) -> PosixPath:
         return self._provision_file_path
+
+    @property
+    def source(self) -> Optional[str]:
+        return self._source
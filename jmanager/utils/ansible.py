@@ -1,10 +1,10 @@
-import subprocess
 from pathlib import PosixPath
 from typing import List, Dict
 
 import yaml
 
 from jmanager.models.jail import Jail
+from jmanager.utils.command_runner import COMMAND_RUNNER, split_command
 
 
 class Ansible:
@@ -12,6 +12,7 @@ class Ansible:
     ANSIBLE_CMD = 'ansible-3.6'
     ANSIBLE_INVENTORY_NAME = 'ansible_inventory'
     ANSIBLE_CONFIG_FILE = 'ansible.cfg'
+    COMMAND_RUNNER = COMMAND_RUNNER
     SSH_OPTIONS = {
         'ControlMaster': 'auto',
         'ControlPersist': '60s',
@@ -24,25 +25,24 @@ class Ansible:
             yaml.dump(ansible_playbook, stream=playbook)
 
     def run_provision_cmd(self, cmd: str, jail_name: str, config_folder: PosixPath):
-        cmd.replace("'", "\\'")
-        cmd = [
-            f'env ANSIBLE_CONFIG={config_folder.as_posix()}/{self.ANSIBLE_CONFIG_FILE}',
-            self.ANSIBLE_CMD,
+        ansible_arguments = [
+            *split_command(self.ANSIBLE_CMD),
             f"--inventory={config_folder.joinpath(self.ANSIBLE_INVENTORY_NAME).as_posix()}",
             f"--module-name=raw",
-            f"--args='{cmd}'",
+            f"--args={cmd}",
             jail_name
         ]
-        subprocess.run(" ".join(cmd), shell=True, check=True, universal_newlines=True)
+        self.COMMAND_RUNNER.run(ansible_arguments, capture=False, environment={
+            'ANSIBLE_CONFIG': config_folder.joinpath(self.ANSIBLE_CONFIG_FILE).as_posix()
+        })
 
     def run_provision(self, path_to_playbook_file: PosixPath, config_folder: PosixPath):
-        cmd = [
-            self.ANSIBLE_PLAYBOOK_CMD,
+        ansible_arguments = [
+            *split_command(self.ANSIBLE_PLAYBOOK_CMD),
             f"--inventory={config_folder.joinpath(self.ANSIBLE_INVENTORY_NAME).as_posix()}",
             path_to_playbook_file.as_posix()
         ]
-
-        subprocess.run(" ".join(cmd), shell=True, check=True, universal_newlines=True)
+        self.COMMAND_RUNNER.run(ansible_arguments, capture=False)
 
     def write_inventory(self, list_of_jails: List[Jail], config_folder: PosixPath):
         inventory: Dict = {
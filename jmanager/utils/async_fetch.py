@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+from functools import partial
+from pathlib import PosixPath
+from typing import Callable, List, Dict, Any, Optional, BinaryIO
+from urllib.error import HTTPError
+
+from jmanager.models.distribution import Architecture, Version, Component
+from jmanager.utils.async_http_pool import AsyncConnectionPool
+from jmanager.utils.fetch import HTTPFetcher, TRANSIENT_ERRORS, is_transient_error
+from jmanager.utils.manifest import ChecksumError, HASH_BLOCK_SIZE
+from jmanager.utils.print_utils import ProgressReporter
+
+ASYNC_TRANSIENT_ERRORS = (*TRANSIENT_ERRORS, asyncio.TimeoutError)
+
+
+def is_async_transient_error(error: BaseException) -> bool:
+    """
+    Same as is_transient_error, with the timeouts of asyncio, which are no socket timeouts before Python 3.11.
+    """
+    return isinstance(error, asyncio.TimeoutError) or is_transient_error(error)
+
+
+class AsyncHTTPFetcher:
+    """
+    Fetcher for asyncio applications: the components are downloaded concurrently on the
+    running event loop instead of on a thread each.
+
+    It wraps an HTTPFetcher, which provides the mirrors, the MANIFEST, the tarball cache and
+    the partial download state, so downloads are resumable, fail over between mirrors and are
+    verified exactly like the ones of HTTPFetcher, and either of them can resume the other's. Every download
+    hands its blocks to a disk writer through a queue of WRITE_QUEUE_SIZE blocks; when the disk
+    is slower than the network, the queue fills up and the socket is no longer read. Disk
+    access, hashing included, runs on the default executor. URLs the AsyncConnectionPool does
+    not support are downloaded by HTTPFetcher on the executor. The bandwidth flow of the
+    HTTPFetcher, if any, paces the downloads without blocking the event loop.
+
+    The HTTPFetcher is not a wrapper of this one, although that is how the two were first meant
+    to share their code: its segmented downloads, the tarball streams extracted while they are
+    downloaded and the distribution sources are driven from worker threads, which would each need
+    an event loop of their own. Both fetchers share the download state, the retries and the
+    parsing of HTTP responses instead, which http.client does for either connection pool.
+    """
+    WRITE_QUEUE_SIZE = 16
+
+    def __init__(self, http_fetcher: HTTPFetcher = None, async_connection_pool: AsyncConnectionPool = None):
+        self._http_fetcher = http_fetcher or HTTPFetcher()
+        self._async_connection_pool = async_connection_pool or AsyncConnectionPool()
+
+    @property
+    def http_fetcher(self) -> HTTPFetcher:
+        return self._http_fetcher
+
+    @property
+    def async_connection_pool(self) -> AsyncConnectionPool:
+        return self._async_connection_pool
+
+    async def fetch_tarballs_into(self, version: Version, architecture: Architecture,
+                                  components: List[Component], temp_dir: PosixPath,
+                                  callback: Callable[[str, int, int, float], None] = None,
+                                  fetched_callback: Callable[[Component], None] = None):
+        """
+        Same as HTTPFetcher.fetch_tarballs_into. When a component fails, or the call is cancelled,
+        the other downloads are cancelled too, leaving their partial files to be resumed later on.
+        """
+        http_fetcher = self._http_fetcher
+        base_urls = await self.run_in_executor(http_fetcher.get_base_urls, architecture, version)
+        callback = http_fetcher.synchronize_callback(callback)
+        checksums, components_to_fetch = await self.run_in_executor(
+            http_fetcher.prepare_fetch, version=version, architecture=architecture, components=components,
+            temp_dir=temp_dir, callback=callback)
+        if fetched_callback is not None:
+            for component in components:
+                if component not in components_to_fetch:
+                    fetched_callback(component)
+
+        semaphore = asyncio.Semaphore(http_fetcher.max_workers)
+
+        async def _fetch_component(component: Component):
+            async with semaphore:
+                await self.fetch_component(base_urls=base_urls, version=version, architecture=architecture,
+                                           component=component, temp_dir=temp_dir, checksums=checksums,
+                                           callback=callback)
+            if fetched_callback is not None:
+                fetched_callback(component)
+
+        tasks = [asyncio.ensure_future(_fetch_component(component)) for component in components_to_fetch]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def fetch_component(self, base_urls: List[str], version: Version, architecture: Architecture,
+                              component: Component, temp_dir: PosixPath, checksums: Dict[Component, str],
+                              callback: Callable[[str, int, int, float], None] = None):
+        http_fetcher = self._http_fetcher
+        tarball_name = http_fetcher.get_tarball_name(component)
+        destination = temp_dir.joinpath(tarball_name)
+        urls = [f"{base_url}/{tarball_name}" for base_url in base_urls]
+        if component not in checksums:
+            raise ChecksumError(f"Component '{component.value}' is not listed in the MANIFEST")
+        download_path = http_fetcher.get_component_download_path(version, architecture, component, destination)
+        state = await self.fetch_file(url=urls[0], destination=download_path, callback=callback,
+                                      mirror_urls=urls[1:], checksum=checksums[component])
+        await self.run_in_executor(http_fetcher.store_component, version, architecture, component,
+                                   download_path=download_path, destination=destination, state=state)
+
+    async def fetch_file(self, url: str, destination: PosixPath,
+                         callback: Callable[[str, int, int, float], None] = None,
+                         mirror_urls: List[str] = (), checksum: str = None) -> Dict[str, Any]:
+        """
+        Same as HTTPFetcher.fetch_file, but files are never split into segments: concurrency
+        comes from running many downloads on the event loop.
+        """
+        if not self._async_connection_pool.supports(url):
+            return await self.run_in_executor(self._http_fetcher.fetch_file, url=url, destination=destination,
+                                              callback=callback, mirror_urls=mirror_urls, checksum=checksum)
+
+        partial_file = self._http_fetcher.get_partial_path(destination)
+        attempt_urls = self._http_fetcher.get_attempt_urls(url, mirror_urls=mirror_urls)
+        for attempt, url in enumerate(attempt_urls):
+            try:
+                await self.download_into_partial_file(url=url, partial_file=partial_file,
+                                                      msg=f"{destination.name} ", callback=callback,
+                                                      verify=checksum is not None)
+                break
+            except ASYNC_TRANSIENT_ERRORS as error:
+                if not is_async_transient_error(error):
+                    raise
+                if await self.run_in_executor(self._http_fetcher.record_failed_attempt, url, attempt=attempt,
+                                              attempt_urls=attempt_urls):
+                    raise
+        return await self.run_in_executor(self._http_fetcher.finish_download, partial_file=partial_file,
+                                          destination=destination, checksum=checksum)
+
+    async def download_into_partial_file(self, url: str, partial_file: PosixPath, msg: str,
+                                         callback: Callable[[str, int, int, float], None] = None,
+                                         verify: bool = False):
+        http_fetcher = self._http_fetcher
+        offset, headers = await self.run_in_executor(http_fetcher.get_resume_headers, url=url,
+                                                     partial_file=partial_file)
+        try:
+            response = await self._async_connection_pool.urlopen(url, headers=headers, timeout=http_fetcher.TIMEOUT)
+        except HTTPError as error:
+            if await self.run_in_executor(http_fetcher.is_partial_file_complete, error,
+                                          partial_file=partial_file, offset=offset):
+                return
+
+        try:
+            state, offset = await self.run_in_executor(http_fetcher.start_partial_download, url=url,
+                                                       partial_file=partial_file, status=response.status,
+                                                       headers=response.headers, offset=offset)
+
+            queue = asyncio.Queue(maxsize=self.WRITE_QUEUE_SIZE)
+            writer = asyncio.ensure_future(self.write_blocks(partial_file, offset=offset, queue=queue,
+                                                             verify=verify))
+            try:
+                received_bytes = offset
+                progress_reporter = ProgressReporter(callback=callback, msg=msg, total=state['size'],
+                                                     received_bytes=offset)
+                while True:
+                    try:
+                        block = await asyncio.wait_for(response.read(http_fetcher.BLOCK_SIZE),
+                                                       http_fetcher.TIMEOUT)
+                    except ASYNC_TRANSIENT_ERRORS:
+                        await self.put_block(queue, None, writer=writer)
+                        await writer
+                        raise
+                    if not block:
+                        break
+                    if http_fetcher.bandwidth_flow is not None:
+                        await asyncio.sleep(http_fetcher.bandwidth_flow.reserve(len(block)))
+                    await self.put_block(queue, block, writer=writer)
+                    received_bytes += len(block)
+                    progress_reporter.update(received_bytes)
+                await self.put_block(queue, None, writer=writer)
+                digest = await writer
+            finally:
+                if not writer.done():
+                    writer.cancel()
+                    await asyncio.gather(writer, return_exceptions=True)
+        finally:
+            response.close()
+
+        await self.run_in_executor(http_fetcher.finish_partial_download, partial_file=partial_file, state=state,
+                                   received_bytes=received_bytes, digest=digest)
+
+    @staticmethod
+    async def put_block(queue: asyncio.Queue, block: Optional[bytes], writer: asyncio.Future):
+        """
+        Queues a block for the disk writer, waiting for it to make room when the queue is full.
+        If the writer fails meanwhile, its error is raised instead of waiting forever.
+        """
+        if not queue.full():
+            queue.put_nowait(block)
+            return
+
+        put = asyncio.ensure_future(queue.put(block))
+        await asyncio.wait([put, writer], return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            writer.result()
+
+    async def write_blocks(self, partial_file: PosixPath, offset: int, queue: asyncio.Queue,
+                           verify: bool) -> Optional[str]:
+        """
+        Writes the queued blocks after the first offset bytes of the partial file, until a None
+        block is queued, hashing them on the way when verifying.
+        :return: The SHA-256 digest of the whole file, or None when not verifying.
+        """
+        sha256 = hashlib.sha256() if verify else None
+        destination_file = await self.run_in_executor(self.open_partial_file, partial_file, offset, sha256)
+        pending_write = None
+        try:
+            while True:
+                block = await queue.get()
+                if block is None:
+                    break
+                pending_write = asyncio.ensure_future(self.run_in_executor(self.write_block, destination_file,
+                                                                           block, sha256))
+                await asyncio.shield(pending_write)
+        finally:
+            if pending_write is not None and not pending_write.done():
+                await asyncio.wait([pending_write])
+            destination_file.close()
+        return None if sha256 is None else sha256.hexdigest()
+
+    @staticmethod
+    def open_partial_file(partial_file: PosixPath, offset: int, sha256=None) -> BinaryIO:
+        """
+        Opens the partial file to continue it from the offset, hashing the bytes already there.
+        """
+        if not offset:
+            return open(partial_file.as_posix(), 'wb')
+
+        destination_file = open(partial_file.as_posix(), 'r+b')
+        if sha256 is not None:
+            remaining_bytes = offset
+            while remaining_bytes:
+                buffer = destination_file.read(min(HASH_BLOCK_SIZE, remaining_bytes))
+                if not buffer:
+                    break
+                sha256.update(buffer)
+                remaining_bytes -= len(buffer)
+        destination_file.seek(offset)
+        destination_file.truncate()
+        return destination_file
+
+    @staticmethod
+    def write_block(destination_file: BinaryIO, block: bytes, sha256=None):
+        destination_file.write(block)
+        if sha256 is not None:
+            sha256.update(block)
+
+    @staticmethod
+    async def run_in_executor(function: Callable[..., Any], *args, **kwargs) -> Any:
+        return await asyncio.get_event_loop().run_in_executor(None, partial(function, *args, **kwargs))
@@ -0,0 +1,282 @@
+import asyncio
+import ssl
+from collections import deque
+from http.client import HTTPMessage, HTTPResponse, IncompleteRead
+from time import monotonic
+from typing import Dict, Tuple, Deque, Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import getproxies
+
+from jmanager.utils.http_pool import ConnectionKey, ConnectionPoolStats, get_connection_key, get_redirection, \
+    get_status_error, parse_response_head
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class AsyncHTTPResponse:
+    """
+    Response of a request sent through an AsyncConnectionPool. Like PooledResponse, its
+    connection goes back to the pool when it is closed after its body was read to the end.
+    """
+
+    def __init__(self, url: str, head: HTTPResponse, connection: Connection, key: ConnectionKey,
+                 connection_pool: 'AsyncConnectionPool'):
+        """
+        :param head: The status line and the headers, parsed by http.client, see parse_response_head.
+        """
+        self._url = url
+        self._status = head.status
+        self._reason = head.reason
+        self._headers = head.headers
+        self._connection = connection
+        self._key = key
+        self._connection_pool = connection_pool
+        self._chunked = head.chunked
+        self._chunk_left = 0
+        self._length: Optional[int] = head.length
+        self._will_close = head.will_close
+        self._is_complete = self._length == 0
+
+    @property
+    def url(self) -> str:
+        return self._url
+
+    @property
+    def status(self) -> int:
+        return self._status
+
+    @property
+    def reason(self) -> str:
+        return self._reason
+
+    @property
+    def headers(self) -> HTTPMessage:
+        return self._headers
+
+    async def read(self, amt: int = None) -> bytes:
+        """
+        :param amt: The number of bytes to read at most, or None to read the body to the end.
+        :return: The data read, which is empty once the body is complete.
+        """
+        if amt is None:
+            blocks = []
+            while True:
+                block = await self.read(self._connection_pool.READ_SIZE)
+                if not block:
+                    return b''.join(blocks)
+                blocks.append(block)
+        if self._is_complete or self._connection is None:
+            return b''
+
+        reader = self._connection[0]
+        if self._chunked:
+            return await self._read_chunk(reader, amt)
+        if self._length is None:
+            block = await reader.read(amt)
+            self._is_complete = not block
+            return block
+
+        block = await reader.read(min(amt, self._length))
+        if not block:
+            raise IncompleteRead(b'', self._length)
+        self._length -= len(block)
+        self._is_complete = self._length == 0
+        return block
+
+    async def _read_chunk(self, reader: asyncio.StreamReader, amt: int) -> bytes:
+        if not self._chunk_left:
+            size_line = await reader.readline()
+            try:
+                self._chunk_left = int(size_line.split(b';')[0].strip(), 16)
+            except ValueError:
+                raise IncompleteRead(b'') from None
+            if not self._chunk_left:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                self._is_complete = True
+                return b''
+
+        block = await reader.read(min(amt, self._chunk_left))
+        if not block:
+            raise IncompleteRead(b'', self._chunk_left)
+        self._chunk_left -= len(block)
+        if not self._chunk_left:
+            await reader.readline()
+        return block
+
+    def close(self):
+        if self._connection is None:
+            return
+        self._connection_pool.release(self._key, self._connection,
+                                      reusable=self._is_complete and not self._will_close)
+        self._connection = None
+
+    async def __aenter__(self) -> 'AsyncHTTPResponse':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncConnectionPool:
+    """
+    asyncio counterpart of ConnectionPool: HTTP/1.1 connections are kept open between requests
+    sent from the same event loop, so many downloads can share them without a thread each.
+
+    Only http and https URLs not going through a proxy are supported, see supports().
+    """
+    MAX_IDLE_CONNECTIONS = 8
+    IDLE_TIMEOUT = 60
+    MAX_REDIRECTS = 10
+    USER_AGENT = 'jmanager'
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, max_idle_connections: int = MAX_IDLE_CONNECTIONS, idle_timeout: float = IDLE_TIMEOUT):
+        self._max_idle_connections = max_idle_connections
+        self._idle_timeout = idle_timeout
+        self._idle_connections: Dict[ConnectionKey, Deque[Tuple[Connection, float]]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ssl_context = None
+        self._requests = 0
+        self._connections_opened = 0
+        self._connections_reused = 0
+        self._stale_connections = 0
+
+    @property
+    def stats(self) -> ConnectionPoolStats:
+        return ConnectionPoolStats(requests=self._requests, connections_opened=self._connections_opened,
+                                   connections_reused=self._connections_reused,
+                                   stale_connections=self._stale_connections)
+
+    @property
+    def idle_connections(self) -> int:
+        return sum([len(connections) for connections in self._idle_connections.values()])
+
+    @staticmethod
+    def supports(url: str) -> bool:
+        scheme = urlsplit(url).scheme
+        return scheme in ('http', 'https') and scheme not in getproxies()
+
+    async def urlopen(self, url: str, headers: Dict[str, str] = None, method: str = 'GET',
+                      timeout: float = None) -> AsyncHTTPResponse:
+        """
+        Sends the request like ConnectionPool.urlopen does: redirections are followed and
+        error statuses raise HTTPError.
+        """
+        headers = headers or {}
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = await self.send(method, url, headers=headers, timeout=timeout)
+            redirection = get_redirection(url, method=method, status=response.status, headers=response.headers)
+            if redirection is not None:
+                await self.read_with_timeout(response, timeout)
+                response.close()
+                url, method = redirection
+                continue
+            if not 200 <= response.status < 300:
+                body = await self.read_with_timeout(response, timeout)
+                response.close()
+                raise get_status_error(url, status=response.status, reason=response.reason,
+                                       headers=response.headers, body=body)
+            return response
+        raise HTTPError(url, response.status, "Too many redirections", response.headers, None)
+
+    @staticmethod
+    async def read_with_timeout(response: AsyncHTTPResponse, timeout: float = None) -> bytes:
+        return await asyncio.wait_for(response.read(), timeout)
+
+    async def send(self, method: str, url: str, headers: Dict[str, str], timeout: float = None) -> AsyncHTTPResponse:
+        key, path = get_connection_key(url)
+        request_headers = {'Host': urlsplit(url).netloc, 'User-Agent': self.USER_AGENT,
+                           'Accept-Encoding': 'identity', **headers}
+        request = f"{method} {path} HTTP/1.1\r\n"
+        request += ''.join([f"{name}: {value}\r\n" for name, value in request_headers.items()])
+        request += "\r\n"
+
+        while True:
+            connection, is_reused = await self.acquire(key, timeout)
+            reader, writer = connection
+            try:
+                writer.write(request.encode('latin-1'))
+                await asyncio.wait_for(writer.drain(), timeout)
+                head = await asyncio.wait_for(self.read_response_head(reader), timeout)
+                response_head = parse_response_head(head, method=method)
+            except (ConnectionError, asyncio.IncompleteReadError) as error:
+                writer.close()
+                if is_reused:
+                    self._stale_connections += 1
+                    continue
+                raise URLError(error) from error
+            except BaseException:
+                writer.close()
+                raise
+
+            self._requests += 1
+            if is_reused:
+                self._connections_reused += 1
+            return AsyncHTTPResponse(url=url, head=response_head, connection=connection, key=key,
+                                     connection_pool=self)
+
+    @staticmethod
+    async def read_response_head(reader: asyncio.StreamReader) -> bytes:
+        """
+        :return: The status line and the headers of the response, up to the empty line ending them.
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+
+        lines = [status_line]
+        while lines[-1] not in (b'\r\n', b'\n', b''):
+            lines.append(await reader.readline())
+        return b''.join(lines)
+
+    async def acquire(self, key: ConnectionKey, timeout: float = None) -> Tuple[Connection, bool]:
+        loop = asyncio.get_event_loop()
+        if loop is not self._loop:
+            self.clear()
+            self._loop = loop
+
+        idle_connections = self._idle_connections.get(key, deque())
+        while idle_connections:
+            connection, released_at = idle_connections.pop()
+            if monotonic() - released_at <= self._idle_timeout and not connection[0].at_eof():
+                return connection, True
+            connection[1].close()
+        self._connections_opened += 1
+
+        scheme, host, port = key
+        ssl_context = self.get_ssl_context() if scheme == 'https' else None
+        try:
+            connection = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ssl_context), timeout)
+        except OSError as error:
+            raise URLError(error) from error
+        return connection, False
+
+    def release(self, key: ConnectionKey, connection: Connection, reusable: bool):
+        if not reusable or connection[0].at_eof():
+            connection[1].close()
+            return
+
+        idle_connections = self._idle_connections.setdefault(key, deque())
+        idle_connections.append((connection, monotonic()))
+        while len(idle_connections) > self._max_idle_connections:
+            idle_connections.popleft()[0][1].close()
+
+    def clear(self):
+        """
+        Closes the idle connections. The ones opened from an event loop that is already closed
+        are only dropped.
+        """
+        for idle_connections in self._idle_connections.values():
+            for connection, _ in idle_connections:
+                try:
+                    connection[1].close()
+                except RuntimeError:
+                    pass
+        self._idle_connections = {}
+
+    def get_ssl_context(self) -> ssl.SSLContext:
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
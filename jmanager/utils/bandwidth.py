@@ -0,0 +1,182 @@
+import fcntl
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from pathlib import PosixPath
+from random import getrandbits
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable, Iterator, Optional
+
+STATE_HEADER = struct.Struct('=d')
+FLOW_SLOT = struct.Struct('=Qddd')
+
+
+class BandwidthScheduler:
+    """
+    Token bucket capping the bandwidth used by all the downloads that go through it to
+    'rate' bytes per second, letting through bursts of up to BURST_TIME seconds of traffic.
+
+    Downloads reserve bandwidth through flows. Flows that used bandwidth within the last
+    ACTIVE_TIME seconds share the rate in proportion to their weights, so a build with weight
+    3 downloads three times as fast as a concurrent one with weight 1, and any of them gets
+    the whole rate when it is alone.
+
+    Without a state file the bucket is shared by the threads of the process. With one, the
+    state lives in that file, memory mapped and locked with flock, and the rate is shared
+    by every process using the same file, e.g. concurrent jmanager invocations.
+    """
+    BURST_TIME = 0.25
+    ACTIVE_TIME = 1.0
+    MAX_BACKLOG_TIME = 60.0
+    MAX_FLOWS = 64
+    STATE_SIZE = STATE_HEADER.size + MAX_FLOWS * FLOW_SLOT.size
+
+    def __init__(self, rate: float, state_file: PosixPath = None, burst_time: float = BURST_TIME,
+                 clock: Callable[[], float] = monotonic):
+        if rate <= 0:
+            raise ValueError("The bandwidth limit must be greater than 0")
+        self._rate = rate
+        self._state_file = state_file
+        self._burst_time = burst_time
+        self._clock = clock
+        self._lock = Lock()
+        self._state: Optional[mmap.mmap] = None
+        self._state_file_descriptor: Optional[int] = None
+        if state_file is None:
+            self._state = bytearray(self.STATE_SIZE)
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @property
+    def state_file(self) -> Optional[PosixPath]:
+        return self._state_file
+
+    @property
+    def burst_size(self) -> int:
+        return int(self._rate * self._burst_time)
+
+    def get_flow(self, weight: float = 1.0) -> 'BandwidthFlow':
+        return BandwidthFlow(scheduler=self, weight=weight)
+
+    def reserve(self, flow_id: int, weight: float, size: int) -> float:
+        """
+        Reserves bandwidth to transfer 'size' bytes for a flow.
+        :return: The number of seconds to wait before transferring them.
+        """
+        now = self._clock()
+        with self._locked_state() as state:
+            bucket_time, = STATE_HEADER.unpack_from(state, 0)
+            flow_slot, flow_time, total_weight = None, now, weight
+            for slot in range(self.MAX_FLOWS):
+                slot_id, slot_weight, slot_time, last_seen = FLOW_SLOT.unpack_from(state, self.get_slot_offset(slot))
+                is_active = slot_id != 0 and now - last_seen <= self.ACTIVE_TIME
+                if slot_id == flow_id:
+                    flow_slot = slot
+                    flow_time = self.get_start_time(slot_time, now) if is_active else now
+                elif is_active:
+                    total_weight += slot_weight
+                elif flow_slot is None:
+                    flow_slot = slot
+
+            bucket_time = self.get_start_time(bucket_time, now) + size / self._rate
+            STATE_HEADER.pack_into(state, 0, bucket_time)
+            delay = bucket_time - now
+            if flow_slot is not None:
+                flow_time += size / (self._rate * weight / total_weight)
+                FLOW_SLOT.pack_into(state, self.get_slot_offset(flow_slot), flow_id, weight, flow_time, now)
+                delay = max(delay, flow_time - now)
+        return max(0.0, delay - self._burst_time)
+
+    def get_start_time(self, reserved_until: float, now: float) -> float:
+        """
+        Reservations never reach far into the future: a time beyond MAX_BACKLOG_TIME comes from
+        a state file written before a reboot, when the monotonic clock started over.
+        """
+        if reserved_until - now > self.MAX_BACKLOG_TIME:
+            return now
+        return max(reserved_until, now)
+
+    @staticmethod
+    def get_slot_offset(slot: int) -> int:
+        return STATE_HEADER.size + slot * FLOW_SLOT.size
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[bytearray]:
+        with self._lock:
+            if self._state_file is None:
+                yield self._state
+                return
+
+            if self._state is None:
+                self._open_state_file()
+            fcntl.flock(self._state_file_descriptor, fcntl.LOCK_EX)
+            try:
+                yield self._state
+            finally:
+                fcntl.flock(self._state_file_descriptor, fcntl.LOCK_UN)
+
+    def _open_state_file(self):
+        file_descriptor = os.open(self._state_file.as_posix(), os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+        try:
+            if os.fstat(file_descriptor).st_size < self.STATE_SIZE:
+                os.ftruncate(file_descriptor, self.STATE_SIZE)
+        finally:
+            fcntl.flock(file_descriptor, fcntl.LOCK_UN)
+        self._state = mmap.mmap(file_descriptor, self.STATE_SIZE)
+        self._state_file_descriptor = file_descriptor
+
+    def close(self):
+        with self._lock:
+            if self._state_file_descriptor is not None:
+                self._state.close()
+                os.close(self._state_file_descriptor)
+                self._state = None
+                self._state_file_descriptor = None
+
+
+class BandwidthFlow:
+    """
+    Share of a BandwidthScheduler used by one build. All the downloads of the build, whichever
+    thread or coroutine runs them, reserve bandwidth through the same flow.
+    """
+
+    def __init__(self, scheduler: BandwidthScheduler, weight: float = 1.0):
+        if weight <= 0:
+            raise ValueError("The bandwidth weight must be greater than 0")
+        self._scheduler = scheduler
+        self._weight = weight
+        self._flow_id = getrandbits(63) | 1
+
+    @property
+    def scheduler(self) -> BandwidthScheduler:
+        return self._scheduler
+
+    @property
+    def weight(self) -> float:
+        return self._weight
+
+    @property
+    def max_block_size(self) -> int:
+        """
+        Bigger blocks would be sent as bursts longer than the scheduler allows.
+        """
+        return self._scheduler.burst_size
+
+    def reserve(self, size: int) -> float:
+        """
+        :return: The number of seconds to wait before transferring 'size' bytes.
+        """
+        return self._scheduler.reserve(flow_id=self._flow_id, weight=self._weight, size=size)
+
+    def acquire(self, size: int):
+        """
+        Waits until 'size' bytes can be transferred.
+        """
+        delay = self.reserve(size)
+        if delay > 0:
+            sleep(delay)
@@ -0,0 +1,338 @@
+import os
+import shutil
+import stat
+import tarfile
+from pathlib import PosixPath
+from typing import Callable, Iterable, Set, BinaryIO, Dict, Tuple, List, Optional
+
+from jmanager.models.extraction_profile import ExtractionProfile
+from jmanager.utils.file_utils import TarballStream, remove_immutable_path, STREAM_BUFFER_SIZE, \
+    set_flags_to_folder_recursively
+from jmanager.utils.tarball_codec import TarballCodec, open_decompressed_stream
+
+ZFS_CONTROL_FOLDER = '.zfs'
+
+
+class BaseUpdateSummary:
+    def __init__(self):
+        self._unchanged_files = 0
+        self._written_files = 0
+        self._written_bytes = 0
+        self._removed_files = 0
+
+    @property
+    def unchanged_files(self) -> int:
+        return self._unchanged_files
+
+    @property
+    def written_files(self) -> int:
+        return self._written_files
+
+    @property
+    def written_bytes(self) -> int:
+        return self._written_bytes
+
+    @property
+    def removed_files(self) -> int:
+        return self._removed_files
+
+    def add_unchanged(self):
+        self._unchanged_files += 1
+
+    def add_written(self, size: int):
+        self._written_files += 1
+        self._written_bytes += size
+
+    def add_removed(self):
+        self._removed_files += 1
+
+
+def update_tree_from_tarballs(jail_path: PosixPath, paths_to_tarballs: Iterable[PosixPath],
+                              callback: Callable[[str, int, int], None] = None,
+                              profile: ExtractionProfile = None) -> BaseUpdateSummary:
+    """
+    Turns the tree of a base jail into the one the tarballs would extract, writing only what differs.
+
+    The files of the new tarballs are compared with the ones in the tree: those with the same size
+    and modification time are kept without being read, those with the same content only get their
+    metadata updated, and the ones whose size or content differ, or that are new, are written. The files which are not in any of the tarballs are removed at the end. Since unchanged
+    files keep their blocks, the tree stays shared with the snapshot it was cloned from.
+    :param paths_to_tarballs: The tarballs of all the components, which are read in order.
+    """
+    summary = BaseUpdateSummary()
+    seen_paths: Set[str] = {''}
+    for path_to_tarball in paths_to_tarballs:
+        tarball_stream = TarballStream(raw_stream=open(path_to_tarball.as_posix(), 'rb'),
+                                       size=path_to_tarball.stat().st_size,
+                                       codec=TarballCodec.from_path(path_to_tarball))
+        with tarball_stream:
+            update_tree_from_stream(jail_path=jail_path, tarball_stream=tarball_stream,
+                                    tarball_name=path_to_tarball.name, seen_paths=seen_paths, summary=summary,
+                                    callback=callback, profile=profile)
+
+    remove_unseen_paths(jail_path=jail_path, seen_paths=seen_paths, summary=summary)
+    return summary
+
+
+def update_tree_from_stream(jail_path: PosixPath, tarball_stream: TarballStream, tarball_name: str,
+                            seen_paths: Set[str], summary: BaseUpdateSummary,
+                            callback: Callable[[str, int, int], None] = None, profile: ExtractionProfile = None):
+    msg = f"Updating from {tarball_name}"
+    decompressed_stream = open_decompressed_stream(tarball_stream, codec=tarball_stream.codec)
+    try:
+        with tarfile.open(fileobj=decompressed_stream, mode='r|', bufsize=STREAM_BUFFER_SIZE) as tar_file:
+            members = tar_file if profile is None else profile.filter_members(tar_file)
+            for member in members:
+                if callback is not None:
+                    callback(msg, min(tarball_stream.position, tarball_stream.size), tarball_stream.size)
+                add_seen_path(seen_paths, ExtractionProfile.normalize_path(member.name))
+                update_member(tar_file=tar_file, member=member, jail_path=jail_path, summary=summary)
+    finally:
+        if decompressed_stream is not tarball_stream:
+            decompressed_stream.close()
+    if callback is not None:
+        callback(msg, tarball_stream.size, tarball_stream.size)
+
+
+def add_seen_path(seen_paths: Set[str], path: str):
+    """
+    Adds the path and the folders leading to it, in case the tarball has no members for them.
+    """
+    while path not in seen_paths:
+        seen_paths.add(path)
+        path = path.rpartition('/')[0]
+
+
+def update_member(tar_file: tarfile.TarFile, member: tarfile.TarInfo, jail_path: PosixPath,
+                  summary: BaseUpdateSummary):
+    target_path = jail_path.joinpath(ExtractionProfile.normalize_path(member.name))
+    if is_unchanged_link(member=member, target_path=target_path, jail_path=jail_path):
+        summary.add_unchanged()
+        return
+
+    target_stat = target_path.stat() if member.isreg() and target_path.is_file() else None
+    if target_stat is not None and not target_path.is_symlink() and target_stat.st_size == member.size:
+        is_written = target_stat.st_mtime != member.mtime and \
+            write_if_changed(tar_file=tar_file, member=member, target_path=target_path)
+        set_attributes(tar_file=tar_file, member=member, target_path=target_path)
+        if is_written:
+            summary.add_written(member.size)
+        else:
+            summary.add_unchanged()
+        return
+
+    if member.isdir() and target_path.is_dir() and not target_path.is_symlink():
+        set_attributes(tar_file=tar_file, member=member, target_path=target_path)
+        summary.add_unchanged()
+        return
+
+    if target_path.is_dir() and not target_path.is_symlink():
+        remove_immutable_path(target_path)
+    elif os.path.lexists(target_path.as_posix()):
+        os.unlink(target_path.as_posix())
+    tar_file.extract(member, path=jail_path.as_posix())
+    summary.add_written(member.size)
+
+
+def is_unchanged_link(member: tarfile.TarInfo, target_path: PosixPath, jail_path: PosixPath) -> bool:
+    if member.issym():
+        return target_path.is_symlink() and os.readlink(target_path.as_posix()) == member.linkname
+    if member.islnk():
+        link_target = jail_path.joinpath(ExtractionProfile.normalize_path(member.linkname))
+        return os.path.lexists(target_path.as_posix()) and not target_path.is_symlink() and \
+            link_target.exists() and os.path.samefile(target_path.as_posix(), link_target.as_posix())
+    return False
+
+
+def write_if_changed(tar_file: tarfile.TarFile, member: tarfile.TarInfo, target_path: PosixPath) -> bool:
+    """
+    Compares the content of a member with the file of the same size in the tree, block by block,
+    and replaces the file from the first block that differs, so no more than a block of the member
+    is held in memory. The tarball is read as a stream and cannot be read again: the part before
+    that block, which is the same in both, is copied from the previous file. The file is replaced
+    rather than written over, so the paths hard linked to it keep the previous content.
+    :return: Whether the file was written.
+    """
+    member_file = tar_file.extractfile(member)
+    with open(target_path.as_posix(), 'rb') as target_file:
+        offset = 0
+        while True:
+            block = member_file.read(STREAM_BUFFER_SIZE)
+            if not block:
+                return False
+            if target_file.read(len(block)) != block:
+                break
+            offset += len(block)
+
+        os.unlink(target_path.as_posix())
+        with open(target_path.as_posix(), 'wb') as new_file:
+            target_file.seek(0)
+            copy_bytes(source_file=target_file, target_file=new_file, size=offset)
+            while block:
+                new_file.write(block)
+                block = member_file.read(STREAM_BUFFER_SIZE)
+    return True
+
+
+def copy_bytes(source_file: BinaryIO, target_file: BinaryIO, size: int):
+    while size > 0:
+        block = source_file.read(min(size, STREAM_BUFFER_SIZE))
+        if not block:
+            break
+        target_file.write(block)
+        size -= len(block)
+
+
+def set_attributes(tar_file: tarfile.TarFile, member: tarfile.TarInfo, target_path: PosixPath):
+    tar_file.chown(member, target_path.as_posix(), False)
+    tar_file.chmod(member, target_path.as_posix())
+    tar_file.utime(member, target_path.as_posix())
+
+
+def restore_tree_from_snapshot(jail_path: PosixPath, snapshot_path: PosixPath) -> BaseUpdateSummary:
+    """
+    Turns the tree of a base jail back into an older snapshot of its data set, read from its
+    .zfs/snapshot folder, without rolling the data set back, which would destroy the newer snapshots.
+
+    The entries whose type and content are the same in both are kept, so they stay shared with
+    the snapshots. The files of the same size and modification time are taken as unchanged without
+    being read, so only the files whose size matches but whose time differs are compared. The others are copied from the snapshot, keeping its hard links, and the
+    entries which are not in it are removed.
+    :param snapshot_path: The folder of the snapshot, e.g. <mountpoint>/.zfs/snapshot/<name>.
+    """
+    with os.scandir(jail_path.as_posix()) as entries:
+        root_paths = [PosixPath(entry.path) for entry in entries if entry.name != ZFS_CONTROL_FOLDER]
+    for root_path in root_paths:
+        set_flags_to_folder_recursively(root_path, 0)
+    summary = BaseUpdateSummary()
+    seen_paths: Set[str] = {''}
+    linked_paths: Dict[Tuple[int, int], str] = {}
+    flags: List[Tuple[str, int]] = []
+    folder_times: List[Tuple[str, os.stat_result]] = []
+    folders = ['']
+    while folders:
+        folder = folders.pop()
+        with os.scandir(snapshot_path.joinpath(folder).as_posix()) as entries:
+            entries = list(entries)
+        for entry in entries:
+            relative_path = f"{folder}/{entry.name}" if folder else entry.name
+            seen_paths.add(relative_path)
+            source_stat = entry.stat(follow_symlinks=False)
+            target_path = jail_path.joinpath(relative_path).as_posix()
+            restore_entry(source_path=entry.path, source_stat=source_stat, target_path=target_path,
+                          linked_paths=linked_paths, summary=summary)
+            if getattr(source_stat, 'st_flags', 0):
+                flags.append((target_path, source_stat.st_flags))
+            if stat.S_ISDIR(source_stat.st_mode):
+                folders.append(relative_path)
+                folder_times.append((target_path, source_stat))
+
+    remove_unseen_paths(jail_path=jail_path, seen_paths=seen_paths, summary=summary)
+    # Restoring the entries of a folder changes its modification time, so it is set again.
+    for target_path, source_stat in reversed(folder_times):
+        os.utime(target_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+    for target_path, entry_flags in flags:
+        os.chflags(target_path, entry_flags, follow_symlinks=False)
+    return summary
+
+
+def restore_entry(source_path: str, source_stat: os.stat_result, target_path: str,
+                  linked_paths: Dict[Tuple[int, int], str], summary: BaseUpdateSummary):
+    """
+    Makes the entry of the tree the same as the one of the snapshot.
+    :param linked_paths: The path in the tree of every file of the snapshot with hard links,
+    by device and inode, so the next paths linked to it are linked again.
+    """
+    target_stat = os.lstat(target_path) if os.path.lexists(target_path) else None
+    link_key = (source_stat.st_dev, source_stat.st_ino)
+    is_linked = source_stat.st_nlink > 1 and not stat.S_ISDIR(source_stat.st_mode)
+    linked_path = linked_paths.get(link_key) if is_linked else None
+    if is_linked:
+        linked_paths.setdefault(link_key, target_path)
+
+    if is_unchanged_entry(source_path, source_stat=source_stat, target_path=target_path, target_stat=target_stat,
+                          linked_path=linked_path):
+        copy_attributes(source_stat, target_path=target_path)
+        summary.add_unchanged()
+        return
+
+    if target_stat is not None and not (stat.S_ISDIR(source_stat.st_mode) and stat.S_ISDIR(target_stat.st_mode)):
+        if stat.S_ISDIR(target_stat.st_mode):
+            remove_immutable_path(PosixPath(target_path))
+        else:
+            os.unlink(target_path)
+
+    if stat.S_ISDIR(source_stat.st_mode):
+        os.makedirs(target_path, exist_ok=True)
+    elif stat.S_ISLNK(source_stat.st_mode):
+        os.symlink(os.readlink(source_path), target_path)
+    elif linked_path is not None:
+        os.link(linked_path, target_path)
+    elif stat.S_ISREG(source_stat.st_mode):
+        shutil.copyfile(source_path, target_path, follow_symlinks=False)
+    elif stat.S_ISFIFO(source_stat.st_mode):
+        os.mkfifo(target_path)
+    else:
+        os.mknod(target_path, source_stat.st_mode, source_stat.st_rdev)
+    copy_attributes(source_stat, target_path=target_path)
+    summary.add_written(source_stat.st_size if stat.S_ISREG(source_stat.st_mode) else 0)
+
+
+def is_unchanged_entry(source_path: str, source_stat: os.stat_result, target_path: str,
+                       target_stat: Optional[os.stat_result], linked_path: Optional[str]) -> bool:
+    if target_stat is None or stat.S_IFMT(source_stat.st_mode) != stat.S_IFMT(target_stat.st_mode):
+        return False
+    if stat.S_ISDIR(source_stat.st_mode):
+        return True
+    if stat.S_ISLNK(source_stat.st_mode):
+        return os.readlink(source_path) == os.readlink(target_path)
+    if linked_path is not None:
+        return os.path.samefile(linked_path, target_path)
+    if source_stat.st_nlink == 1 and target_stat.st_nlink > 1:
+        return False
+    if source_stat.st_size != target_stat.st_size:
+        return False
+    return source_stat.st_mtime_ns == target_stat.st_mtime_ns or has_same_content(source_path, target_path)
+
+
+def has_same_content(source_path: str, target_path: str) -> bool:
+    with open(source_path, 'rb') as source_file, open(target_path, 'rb') as target_file:
+        while True:
+            block = source_file.read(STREAM_BUFFER_SIZE)
+            if block != target_file.read(STREAM_BUFFER_SIZE):
+                return False
+            if not block:
+                return True
+
+
+def copy_attributes(source_stat: os.stat_result, target_path: str):
+    if os.geteuid() == 0:
+        os.chown(target_path, source_stat.st_uid, source_stat.st_gid, follow_symlinks=False)
+    if stat.S_ISLNK(source_stat.st_mode):
+        return
+    os.chmod(target_path, stat.S_IMODE(source_stat.st_mode))
+    os.utime(target_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+
+
+def remove_unseen_paths(jail_path: PosixPath, seen_paths: Set[str], summary: BaseUpdateSummary):
+    """
+    Removes the entries of the tree which are not in the seen paths. The .zfs folder at the root
+    of a data set, where its snapshots are, is left alone.
+    """
+    folders = ['']
+    while folders:
+        folder = folders.pop()
+        with os.scandir(jail_path.joinpath(folder).as_posix()) as entries:
+            entries = list(entries)
+        for entry in entries:
+            relative_path = f"{folder}/{entry.name}" if folder else entry.name
+            if relative_path == ZFS_CONTROL_FOLDER:
+                continue
+            if relative_path not in seen_paths:
+                if entry.is_dir(follow_symlinks=False):
+                    remove_immutable_path(PosixPath(entry.path))
+                else:
+                    os.unlink(entry.path)
+                summary.add_removed()
+            elif entry.is_dir(follow_symlinks=False):
+                folders.append(relative_path)
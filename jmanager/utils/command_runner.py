@@ -0,0 +1,145 @@
+import os
+import shlex
+import subprocess
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List, Dict, Optional
+
+
+class CommandResult:
+    def __init__(self, args: List[str], return_code: int, stdout: Optional[str], stderr: Optional[str]):
+        self._args = args
+        self._return_code = return_code
+        self._stdout = stdout
+        self._stderr = stderr
+
+    @property
+    def args(self) -> List[str]:
+        return self._args
+
+    @property
+    def return_code(self) -> int:
+        return self._return_code
+
+    @property
+    def stdout(self) -> Optional[str]:
+        """
+        :return: The standard output of the command, or None if it was not captured.
+        """
+        return self._stdout
+
+    @property
+    def stderr(self) -> Optional[str]:
+        """
+        :return: The standard error of the command, or None if it was not captured.
+        """
+        return self._stderr
+
+    def check(self) -> 'CommandResult':
+        if self._return_code != 0:
+            raise CommandError(self)
+        return self
+
+
+class CommandError(subprocess.CalledProcessError):
+    """
+    Raised when a command exits with a non-zero status. It is a CalledProcessError, so the
+    callers catching the errors subprocess.run(check=True) raised keep working.
+    """
+
+    def __init__(self, result: CommandResult):
+        super().__init__(returncode=result.return_code, cmd=result.args, output=result.stdout, stderr=result.stderr)
+        self._result = result
+
+    @property
+    def result(self) -> CommandResult:
+        return self._result
+
+    def __str__(self):
+        message = super().__str__()
+        if self._result.stderr:
+            message = f"{message}\n{self._result.stderr.strip()}"
+        return message
+
+
+class SpawnStrategy(ABC):
+    """
+    How the processes of a CommandRunner are started.
+    """
+
+    @abstractmethod
+    def spawn(self, args: List[str], capture: bool, environment: Optional[Dict[str, str]]) -> CommandResult:
+        """
+        Runs the command and waits for it to finish.
+        :param args: The program and its arguments, passed to it as they are.
+        :param capture: Whether to capture the output of the command instead of inheriting the streams.
+        :param environment: The whole environment of the process, or None to inherit the current one.
+        """
+
+
+class SubprocessSpawnStrategy(SpawnStrategy):
+    """
+    Executes the program directly, without a shell in between. Without close_fds, subprocess
+    can start it with posix_spawn (Python 3.8 and later) instead of fork and exec, which is
+    cheaper for a parent process with a large memory footprint.
+    """
+
+    def __init__(self, close_fds: bool = True):
+        self._close_fds = close_fds
+
+    @property
+    def close_fds(self) -> bool:
+        return self._close_fds
+
+    def spawn(self, args: List[str], capture: bool, environment: Optional[Dict[str, str]]) -> CommandResult:
+        output = subprocess.PIPE if capture else None
+        process = subprocess.run(args, stdout=output, stderr=output, env=environment, close_fds=self._close_fds,
+                                 universal_newlines=True)
+        return CommandResult(args=args, return_code=process.returncode, stdout=process.stdout,
+                             stderr=process.stderr)
+
+
+@lru_cache(maxsize=None)
+def _split_command(command: str) -> List[str]:
+    return shlex.split(command)
+
+
+def split_command(command: str) -> List[str]:
+    """
+    Splits a configured command, e.g. 'sh scripts/zfs.sh', into the arguments it starts with.
+    """
+    return list(_split_command(command))
+
+
+class CommandRunner:
+    """
+    Runs commands given as lists of arguments, so nothing needs to be quoted and no shell
+    is started for them.
+    """
+
+    def __init__(self, spawn_strategy: SpawnStrategy = None):
+        self._spawn_strategy = SubprocessSpawnStrategy() if spawn_strategy is None else spawn_strategy
+
+    @property
+    def spawn_strategy(self) -> SpawnStrategy:
+        return self._spawn_strategy
+
+    def run(self, args: List[str], capture: bool = True, check: bool = True,
+            environment: Dict[str, str] = None) -> CommandResult:
+        """
+        :param capture: Whether to capture stdout and stderr, instead of letting the command
+        write to the ones of jmanager.
+        :param check: Whether to raise a CommandError if the command fails.
+        :param environment: Variables to set for the command, on top of the current environment.
+        """
+        process_environment = None
+        if environment:
+            process_environment = dict(os.environ)
+            process_environment.update(environment)
+        result = self._spawn_strategy.spawn(args=list(args), capture=capture, environment=process_environment)
+        if check:
+            result.check()
+        return result
+
+
+COMMAND_RUNNER = CommandRunner()
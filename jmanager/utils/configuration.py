@@ -1,19 +1,29 @@
 from pathlib import PosixPath
-from typing import List, Dict, Union, Any
+from typing import List, Dict, Union, Any, Tuple
 
 from yaml import load, Loader
 
 from jmanager.models.distribution import Architecture, Component, Version
+from jmanager.models.extraction_profile import ExtractionProfile
 from jmanager.models.jail_parameter import JailParameter
 from jmanager.models.jmanagerfile import JManagerFile
 
-CONFIGURATION_SCHEMA: Dict[str, type] = {
+SIZE_UNITS: Dict[str, int] = {
+    'K': 1024,
+    'M': 1024 ** 2,
+    'G': 1024 ** 3,
+    'T': 1024 ** 4
+}
+
+CONFIGURATION_SCHEMA: Dict[str, Union[type, Tuple[type, ...]]] = {
     'name': str,
     'version': str,
     'architecture': str,
     'components': list,
     'jail_parameters': dict,
-    'provision': dict
+    'provision': dict,
+    'source': str,
+    'profile': (str, dict)
 }
 
 
@@ -26,7 +36,34 @@ def read_configuration_file(path_to_file: PosixPath) -> Union[List[Dict], Dict]:
     return data
 
 
-def parse_jmanagerfile(jail_dictionary_list: List[Dict[str, Any]]) -> List[JManagerFile]:
+def parse_extraction_profiles(configuration: Dict[str, Any]) -> Dict[str, ExtractionProfile]:
+    """
+    :param configuration: The jmanager configuration, whose 'extraction_profiles' map the name of
+    every profile to its 'include' and 'exclude' rules.
+    :return: The extraction profiles by name.
+    """
+    extraction_profiles: Dict[str, ExtractionProfile] = {}
+    for name, rules in (configuration.get('extraction_profiles') or {}).items():
+        extraction_profiles[name] = ExtractionProfile.from_dict({'name': name, **(rules or {})})
+    return extraction_profiles
+
+
+def parse_profile(profile: Union[str, Dict[str, Any]],
+                  extraction_profiles: Dict[str, ExtractionProfile]) -> ExtractionProfile:
+    """
+    :param profile: The name of a profile from the configuration, or one declared inline.
+    """
+    if isinstance(profile, dict):
+        return ExtractionProfile.from_dict(profile)
+    if profile not in extraction_profiles:
+        raise ValueError(f"Unknown extraction profile '{profile}'")
+    return extraction_profiles[profile]
+
+
+def parse_jmanagerfile(jail_dictionary_list: List[Dict[str, Any]],
+                       extraction_profiles: Dict[str, ExtractionProfile] = None) -> List[JManagerFile]:
+    if extraction_profiles is None:
+        extraction_profiles = {}
     jail_list: List[JManagerFile] = []
 
     for jail_dictionary in jail_dictionary_list:
@@ -43,20 +80,44 @@ def parse_jmanagerfile(jail_dictionary_list: List[Dict[str, Any]]) -> List[JMana
         provision = None
         if 'provision' in jail_dictionary:
             provision = jail_dictionary['provision']
+        profile = None
+        if 'profile' in jail_dictionary:
+            profile = parse_profile(jail_dictionary['profile'], extraction_profiles=extraction_profiles)
 
         jail_list.append(JManagerFile(jail_name=jail_dictionary['name'],
                                       version=Version.from_string(jail_dictionary['version']),
                                       components=components,
                                       architecture=Architecture(jail_dictionary['architecture']),
                                       jail_parameters=jail_parameters,
-                                      provision=provision
+                                      provision=provision,
+                                      source=jail_dictionary.get('source'),
+                                      profile=profile
                                       ))
     return jail_list
 
 
 def sanitize_input(jail_dictionary: Dict[str, Union[List, str]]):
     for key in jail_dictionary.keys():
-        if type(jail_dictionary[key]) != CONFIGURATION_SCHEMA[key]:
+        expected_types = CONFIGURATION_SCHEMA[key]
+        if not isinstance(expected_types, tuple):
+            expected_types = (expected_types,)
+        if type(jail_dictionary[key]) not in expected_types:
+            type_names = "' or '".join([expected_type.__name__ for expected_type in expected_types])
             raise ValueError(
-                f"Property {key} must be of type '{CONFIGURATION_SCHEMA[key].__name__}' not " +
+                f"Property {key} must be of type '{type_names}' not " +
                 f"'{type(jail_dictionary[key]).__name__}'")
+
+
+def parse_size(size: Union[int, str]) -> int:
+    """
+    Converts a size as written in the configuration file (e.g. 512M or 10G) into bytes
+    :param size: The size as an integer or a string with an optional K, M, G or T suffix.
+    :return: The size in bytes.
+    """
+    if isinstance(size, int):
+        return size
+
+    size = size.strip().upper()
+    if size and size[-1] in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+    return int(size)
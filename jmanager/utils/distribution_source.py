@@ -0,0 +1,224 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from threading import Condition, Event
+from typing import Callable, ContextManager, Iterator, List, Optional, Iterable
+from urllib.parse import urlsplit, unquote
+
+from jmanager.models.distribution import Architecture, Component, Version, VersionType
+from jmanager.utils.fetch import HTTPFetcher
+from jmanager.utils.file_utils import TarballStream
+from jmanager.utils.manifest import get_file_checksum, parse_manifest, ChecksumError
+
+
+class TarballFolder:
+    """
+    Folder where a distribution source provides tarballs, possibly while some of them are
+    still being fetched.
+    """
+
+    def __init__(self, path: PosixPath, pending_components: Iterable[Component] = ()):
+        self._path = path
+        self._pending_components = set(pending_components)
+        self._finished = not self._pending_components
+        self._error: Optional[BaseException] = None
+        self._condition = Condition()
+
+    @property
+    def path(self) -> PosixPath:
+        return self._path
+
+    def set_ready(self, component: Component):
+        with self._condition:
+            self._pending_components.discard(component)
+            self._condition.notify_all()
+
+    def finish(self, error: BaseException = None):
+        """
+        Marks the end of the fetch, which failed with the error, if any.
+        """
+        with self._condition:
+            self._finished = True
+            self._error = error
+            self._condition.notify_all()
+
+    def wait_for(self, component: Component):
+        """
+        Blocks until the tarball of the component is in the folder.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: component not in self._pending_components or self._finished)
+            if component not in self._pending_components:
+                return
+            if self._error is not None:
+                raise self._error
+            raise FileNotFoundError(f"Component '{component.value}' not found in {self._path}")
+
+
+class DistributionSource(ABC):
+    """
+    Where the tarballs base jails are created from come from.
+    """
+
+    @abstractmethod
+    def provide_tarballs(self, version: Version, architecture: Architecture, components: List[Component],
+                         callback: Callable[[str, int, int, float], None] = None) -> ContextManager[TarballFolder]:
+        """
+        :return: A context manager giving the folder where the tarballs of the components are,
+        which is only valid until it exits. The tarballs may still be on their way when it is
+        entered: TarballFolder.wait_for tells when each of them is there.
+        """
+
+    @abstractmethod
+    def open_tarball_stream(self, version: Version, architecture: Architecture,
+                            component: Component) -> ContextManager[TarballStream]:
+        pass
+
+    @abstractmethod
+    def get_upstream_modification_time(self, version: Version, architecture: Architecture) -> Optional[float]:
+        """
+        :return: When the distribution was last modified, as a timestamp, or None if it is unknown.
+        """
+
+
+class HTTPDistributionSource(DistributionSource):
+    """
+    Downloads the tarballs with an HTTPFetcher into a temporary folder. The download runs in
+    the background, so the first components can be used while the next ones are downloaded.
+    """
+
+    def __init__(self, http_fetcher: HTTPFetcher):
+        self._http_fetcher = http_fetcher
+
+    @property
+    def http_fetcher(self) -> HTTPFetcher:
+        return self._http_fetcher
+
+    @contextmanager
+    def provide_tarballs(self, version: Version, architecture: Architecture, components: List[Component],
+                         callback: Callable[[str, int, int, float], None] = None) -> Iterator[TarballFolder]:
+        """
+        When it exits before the download is over, it waits for it to finish before removing the folder.
+        If it exits with an error, e.g. because extracting a tarball failed, the download is cancelled
+        first, so the error is raised without waiting for the remaining tarballs.
+        """
+        stop_event = Event()
+        with TemporaryDirectory(prefix="jmanager_", suffix="_tarballs") as temp_dir, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix="jmanager_provide") as executor:
+            tarball_folder = TarballFolder(path=PosixPath(temp_dir), pending_components=components)
+            executor.submit(self.fetch_tarballs_into, tarball_folder, version=version, architecture=architecture,
+                            components=components, callback=callback, stop_event=stop_event)
+            try:
+                yield tarball_folder
+            except BaseException:
+                stop_event.set()
+                raise
+
+    def fetch_tarballs_into(self, tarball_folder: TarballFolder, version: Version, architecture: Architecture,
+                            components: List[Component], callback: Callable[[str, int, int, float], None] = None,
+                            stop_event: Event = None):
+        try:
+            self._http_fetcher.fetch_tarballs_into(version=version, architecture=architecture,
+                                                   components=components, temp_dir=tarball_folder.path,
+                                                   callback=callback, fetched_callback=tarball_folder.set_ready,
+                                                   stop_event=stop_event)
+        except BaseException as error:
+            tarball_folder.finish(error)
+        else:
+            tarball_folder.finish()
+
+    def open_tarball_stream(self, version: Version, architecture: Architecture,
+                            component: Component) -> ContextManager[TarballStream]:
+        return self._http_fetcher.open_tarball_stream(version, architecture, component)
+
+    def get_upstream_modification_time(self, version: Version, architecture: Architecture) -> Optional[float]:
+        return self._http_fetcher.get_upstream_modification_time(version=version, architecture=architecture)
+
+
+class LocalDistributionSource(DistributionSource):
+    """
+    Distribution files on a local disk or a mounted file system, laid out like the FreeBSD
+    mirrors (e.g. releases/amd64/12.0-RELEASE/base.txz under the root folder).
+
+    The tarballs are extracted straight from where they are, without being copied. With
+    verify, they are checked against the MANIFEST next to them first.
+    """
+
+    def __init__(self, root_path: PosixPath, verify: bool = False):
+        self._root_path = root_path
+        self._verify = verify
+
+    @property
+    def root_path(self) -> PosixPath:
+        return self._root_path
+
+    @property
+    def verify(self) -> bool:
+        return self._verify
+
+    def get_distribution_path(self, version: Version, architecture: Architecture) -> PosixPath:
+        folder = 'releases' if version.version_type == VersionType.RELEASE else 'snapshots'
+        return self._root_path.joinpath(folder, architecture.value, str(version))
+
+    def get_tarball_path(self, version: Version, architecture: Architecture, component: Component) -> PosixPath:
+        path_to_tarball = self.get_distribution_path(version, architecture).joinpath(
+            HTTPFetcher.get_tarball_name(component))
+        if not path_to_tarball.is_file():
+            raise FileNotFoundError(f"Component '{component.value}' not found in {path_to_tarball.parent}")
+        if self._verify:
+            self.verify_tarball(path_to_tarball, component=component)
+        return path_to_tarball
+
+    def verify_tarball(self, path_to_tarball: PosixPath, component: Component):
+        manifest_path = path_to_tarball.with_name(HTTPFetcher.get_tarball_name(Component.MANIFEST))
+        with open(manifest_path.as_posix(), 'r') as manifest_file:
+            checksums = parse_manifest(manifest_file.read())
+        if component not in checksums:
+            raise ChecksumError(f"Component '{component.value}' is not listed in the MANIFEST")
+        checksum = get_file_checksum(path_to_tarball)
+        if checksum != checksums[component]:
+            raise ChecksumError(f"Checksum mismatch for '{path_to_tarball.name}': "
+                                f"expected {checksums[component]}, got {checksum}")
+
+    @contextmanager
+    def provide_tarballs(self, version: Version, architecture: Architecture, components: List[Component],
+                         callback: Callable[[str, int, int, float], None] = None) -> Iterator[TarballFolder]:
+        for component in components:
+            self.get_tarball_path(version, architecture, component)
+        yield TarballFolder(path=self.get_distribution_path(version, architecture))
+
+    @contextmanager
+    def open_tarball_stream(self, version: Version, architecture: Architecture,
+                            component: Component) -> Iterator[TarballStream]:
+        path_to_tarball = self.get_tarball_path(version, architecture, component)
+        with TarballStream(raw_stream=open(path_to_tarball.as_posix(), 'rb'),
+                           size=path_to_tarball.stat().st_size) as tarball_stream:
+            yield tarball_stream
+
+    def get_upstream_modification_time(self, version: Version, architecture: Architecture) -> Optional[float]:
+        """
+        :return: When the MANIFEST of the distribution was last modified, like for the mirrors.
+        """
+        manifest_path = self.get_distribution_path(version, architecture).joinpath(
+            HTTPFetcher.get_tarball_name(Component.MANIFEST))
+        if not manifest_path.is_file():
+            return None
+        return manifest_path.stat().st_mtime
+
+
+def create_distribution_source(location: str, http_fetcher: HTTPFetcher, verify: bool = False) -> DistributionSource:
+    """
+    :param location: Path or file:// URL of a local mirror of the distributions, or 'http' to
+    download them with the HTTP fetcher.
+    """
+    if location == 'http':
+        return HTTPDistributionSource(http_fetcher=http_fetcher)
+
+    split_location = urlsplit(location)
+    if split_location.scheme == 'file':
+        return LocalDistributionSource(root_path=PosixPath(unquote(split_location.path)), verify=verify)
+    if split_location.scheme:
+        raise ValueError(f"Unsupported distribution source '{location}'")
+    return LocalDistributionSource(root_path=PosixPath(location), verify=verify)
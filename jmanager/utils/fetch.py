@@ -1,51 +1,919 @@
+import hashlib
+import io
+import os
+import shutil
+import socket
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from contextlib import contextmanager, ExitStack
+from email.utils import parsedate_to_datetime
+from http.client import IncompleteRead
 from pathlib import PosixPath
-from time import time
-from typing import Callable, List
-from urllib.request import urlopen
+from threading import Lock, Event
+from time import monotonic
+from tempfile import TemporaryDirectory
+from typing import Callable, List, Dict, Any, Iterator, Optional, Tuple, Set
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import Request
+
+import yaml
 
 from jmanager.models.distribution import Architecture, Version, VersionType, Component
+from jmanager.utils.bandwidth import BandwidthFlow
+from jmanager.utils.file_utils import link_or_copy_file, TarballStream
+from jmanager.utils.http_pool import ConnectionPool, HTTP_CONNECTION_POOL
+from jmanager.utils.manifest import parse_manifest, get_file_checksum, ChecksumError, BackgroundHasher
+from jmanager.utils.mirrors import MirrorSelector
+from jmanager.utils.print_utils import ProgressReporter
+from jmanager.utils.tarball_cache import TarballCache
+from jmanager.utils.tarball_codec import TarballCodec
+
+PARTIAL_SUFFIX = '.part'
+PARTIAL_STATE_SUFFIX = '.state'
+
+
+class SegmentedDownloadError(BaseException):
+    """
+    Raised when a server advertising range requests answers one with the whole file.
+    """
+
+
+class ResumeNotSupportedError(BaseException):
+    pass
+
+
+class DownloadCancelledError(BaseException):
+    pass
+
+
+TRANSIENT_ERRORS = (ConnectionError, socket.timeout, IncompleteRead, URLError)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Whether a download that failed with the error may succeed from another mirror. The connection
+    pool and urllib wrap the errors of connecting and of waiting for the response head, such as
+    a refused connection or a timeout, in a URLError. An HTTPError is a URLError too, but the
+    server did answer, so it is not transient.
+    """
+    if isinstance(error, HTTPError):
+        return False
+    if isinstance(error, URLError):
+        return isinstance(error.reason, OSError)
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class ResumableHTTPStream(io.RawIOBase):
+    """
+    Unbuffered reader over an HTTP download. When the connection drops, the transfer is resumed
+    from the current position with a Range request instead of failing the whole read.
+    """
+
+    def __init__(self, url: str, retries: int, mirror_urls: List[str] = (), timeout: float = None,
+                 connection_pool: ConnectionPool = HTTP_CONNECTION_POOL, bandwidth_flow: BandwidthFlow = None):
+        super().__init__()
+        self._connection_pool = connection_pool
+        self._bandwidth_flow = bandwidth_flow
+        self._urls = [url, *mirror_urls]
+        self._url = url
+        self._retries = retries
+        self._timeout = timeout
+        self._position = 0
+        self._response = self._open()
+        self._size = int(self._response.headers['content-length'])
+        self._etag = self._response.headers.get('etag')
+        self._last_modified = self._response.headers.get('last-modified')
+
+    def _open(self):
+        """
+        Opens the first of the URLs that can be reached, moving on to the next mirror when one of them
+        refuses the connection or stalls before answering.
+        """
+        for attempt, url in enumerate(self._urls):
+            try:
+                response = self._connection_pool.urlopen(url, timeout=self._timeout)
+                self._url = url
+                return response
+            except TRANSIENT_ERRORS as error:
+                if not is_transient_error(error) or attempt == len(self._urls) - 1:
+                    raise
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self._etag
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self._last_modified
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        for attempt in range(self._retries + 1):
+            try:
+                read_bytes = self._response.readinto(buffer)
+                if not read_bytes and self._position < self._size and len(buffer):
+                    raise IncompleteRead(b'', self._size - self._position)
+                if self._bandwidth_flow is not None:
+                    self._bandwidth_flow.acquire(read_bytes)
+                self._position += read_bytes
+                return read_bytes
+            except TRANSIENT_ERRORS as error:
+                if not is_transient_error(error) or attempt == self._retries:
+                    raise
+                self._resume(attempt)
+
+    def _resume(self, attempt: int):
+        """
+        Resumes the download from the next mirror, if any. ETags are only valid for the server
+        that issued them, so the modification date is used to validate other mirrors.
+        """
+        self._response.close()
+        url = self._urls[(attempt + 1) % len(self._urls)]
+        validator = self._last_modified
+        if url != self._url and validator is None:
+            url = self._url
+        if url == self._url:
+            validator = self._etag or self._last_modified
+        headers = {'Range': f"bytes={self._position}-"}
+        if validator:
+            headers['If-Range'] = validator
+        self._response = self._connection_pool.urlopen(Request(url, headers=headers), timeout=self._timeout)
+        if getattr(self._response, 'status', None) != 206:
+            self._response.close()
+            raise ResumeNotSupportedError(f"The download of {url} cannot be resumed")
+
+    def close(self):
+        if not self.closed:
+            self._response.close()
+        super().close()
 
 
 class HTTPFetcher:
     SERVER_URL = "https://ftp.FreeBSD.org"
     FTP_BASE_DIRECTORY = PosixPath('pub/FreeBSD')
-    BLOCK_SIZE = 8192
-
-    def fetch_file(self, url: str, destination: PosixPath, callback: Callable[[str, int, int, float], None] = None):
-        fetcher = urlopen(url)
-        file_size = int(fetcher.headers["content-length"])
-
-        received_bytes = 0
-        msg = f"{destination.name} "
-        total_time_elapsed = 0.0
-        speed = 0.0
-        with open(destination.as_posix(), 'wb') as destination_file:
-            while True:
-                start_time = time()
-                buffer = fetcher.read(self.BLOCK_SIZE)
-                if not buffer:
-                    break
-
-                if total_time_elapsed <= 5.0:
-                    speed = len(buffer) / (time() - start_time)
-                    total_time_elapsed += (time() - start_time)
-                else:
-                    total_time_elapsed = 0.0
-
-                received_bytes += len(buffer)
-                if callback is not None:
-                    callback(msg, received_bytes, file_size, speed)
-                destination_file.write(buffer)
+    BLOCK_SIZE = 64 * 1024
+    MAX_BLOCK_SIZE = 4 * 1024 ** 2
+    BLOCK_TIME = 0.05
+    MAX_WORKERS = 4
+    DOWNLOAD_RETRIES = 3
+    SEGMENTS = 4
+    SEGMENT_THRESHOLD = 64 * 1024 ** 2
+    TIMEOUT = 30
+
+    def __init__(self, max_workers: int = MAX_WORKERS, tarball_cache: TarballCache = None,
+                 segments: int = SEGMENTS, segment_threshold: int = SEGMENT_THRESHOLD,
+                 mirror_selector: MirrorSelector = None, connection_pool: ConnectionPool = HTTP_CONNECTION_POOL,
+                 bandwidth_flow: BandwidthFlow = None, download_dir: PosixPath = None):
+        """
+        :param download_dir: Folder the components are downloaded into when there is no tarball cache,
+        so their partial files outlive the temporary folder of the command and can be resumed by the next
+        one. Without it, they are downloaded straight into that temporary folder.
+        """
+        if max_workers < 1:
+            raise ValueError("The number of concurrent downloads must be at least 1")
+        if segments < 1:
+            raise ValueError("The number of segments per download must be at least 1")
+        self._max_workers = max_workers
+        self._tarball_cache = tarball_cache
+        self._segments = segments
+        self._segment_threshold = segment_threshold
+        self._mirror_selector = mirror_selector
+        self._connection_pool = connection_pool
+        self._bandwidth_flow = bandwidth_flow
+        self._download_dir = download_dir
+        self._hosts_without_ranges: Set[str] = set()
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    @property
+    def tarball_cache(self) -> TarballCache:
+        return self._tarball_cache
+
+    @property
+    def mirror_selector(self) -> MirrorSelector:
+        return self._mirror_selector
+
+    @property
+    def connection_pool(self) -> ConnectionPool:
+        return self._connection_pool
+
+    @property
+    def bandwidth_flow(self) -> Optional[BandwidthFlow]:
+        return self._bandwidth_flow
+
+    @property
+    def download_dir(self) -> Optional[PosixPath]:
+        return self._download_dir
+
+    def fetch_file(self, url: str, destination: PosixPath, callback: Callable[[str, int, int, float], None] = None,
+                   mirror_urls: List[str] = (), checksum: str = None, stop_event: Event = None) -> Dict[str, Any]:
+        """
+        Downloads the given URL into the destination.
+
+        The data is written into a '.part' file next to the destination, along with a state file
+        recording where it comes from, so an interrupted download is resumed with a Range request
+        instead of being started over, even from a different process.
+
+        Files bigger than the segment threshold are split into byte ranges fetched over several
+        connections at once when the server supports range requests. A server advertising them
+        but answering a range request with the whole file is downloaded from in a single stream
+        instead, in the same attempt, and never segmented again.
+
+        When the mirror refuses the connection, or the download fails or stalls, it is retried from
+        the next of the mirror URLs.
+
+        With a checksum, the file is hashed while it is downloaded and rejected as soon as it
+        is complete if its SHA-256 digest does not match.
+
+        When the stop event is set, the download raises DownloadCancelledError after the block it
+        is reading, leaving the partial file to be resumed later on.
+
+        :return: The URL the file was downloaded from, its size, the validators sent by the server
+        and, when verified, its SHA-256 digest.
+        """
+        partial_file = self.get_partial_path(destination)
+        attempt_urls = self.get_attempt_urls(url, mirror_urls=mirror_urls)
+        for attempt, url in enumerate(attempt_urls):
+            try:
+                if self.prepare_segmented_download(url=url, partial_file=partial_file):
+                    try:
+                        self.download_segments_into_partial_file(url=url, partial_file=partial_file,
+                                                                 msg=f"{destination.name} ", callback=callback,
+                                                                 verify=checksum is not None,
+                                                                 stop_event=stop_event)
+                        break
+                    except SegmentedDownloadError:
+                        self._hosts_without_ranges.add(urlsplit(url).netloc)
+                self.download_into_partial_file(url=url, partial_file=partial_file,
+                                                msg=f"{destination.name} ", callback=callback,
+                                                verify=checksum is not None, stop_event=stop_event)
+                break
+            except TRANSIENT_ERRORS as error:
+                if not is_transient_error(error) or \
+                        self.record_failed_attempt(url, attempt=attempt, attempt_urls=attempt_urls):
+                    raise
+        return self.finish_download(partial_file=partial_file, destination=destination, checksum=checksum)
+
+    def get_attempt_urls(self, url: str, mirror_urls: List[str] = ()) -> List[str]:
+        """
+        :return: The URL every attempt of a download goes to. The mirrors are tried in turn, and
+        the download is given DOWNLOAD_RETRIES more attempts than there are URLs.
+        """
+        urls = [url, *mirror_urls]
+        return [urls[attempt % len(urls)] for attempt in range(self.DOWNLOAD_RETRIES + len(urls))]
+
+    def record_failed_attempt(self, url: str, attempt: int, attempt_urls: List[str]) -> bool:
+        """
+        Demotes the mirror of a failed attempt.
+        :return: Whether it was the last attempt, in which case the error is to be raised.
+        """
+        self.report_failed_download(url)
+        return attempt == len(attempt_urls) - 1
+
+    def finish_download(self, partial_file: PosixPath, destination: PosixPath, checksum: str = None) -> Dict[str, Any]:
+        """
+        Moves a complete partial file to its destination, once its checksum, if any, is verified.
+        :return: The state recorded for the download.
+        """
+        state_file = self.get_partial_state_path(partial_file)
+        state = self.read_partial_state(state_file)
+        if checksum is not None:
+            digest = state.get('sha256') or get_file_checksum(partial_file)
+            if digest != checksum:
+                partial_file.unlink()
+                state_file.unlink()
+                raise ChecksumError(f"Checksum mismatch for '{destination.name}': expected {checksum}, got {digest}")
+        os.replace(partial_file.as_posix(), destination.as_posix())
+        state_file.unlink()
+        return state
+
+    def download_into_partial_file(self, url: str, partial_file: PosixPath, msg: str,
+                                   callback: Callable[[str, int, int, float], None] = None, verify: bool = False,
+                                   stop_event: Event = None):
+        offset, headers = self.get_resume_headers(url=url, partial_file=partial_file)
+        try:
+            fetcher = self._connection_pool.urlopen(Request(url, headers=headers), timeout=self.TIMEOUT)
+        except HTTPError as error:
+            if self.is_partial_file_complete(error, partial_file=partial_file, offset=offset):
+                return
+
+        state, offset = self.start_partial_download(url=url, partial_file=partial_file,
+                                                    status=getattr(fetcher, 'status', None),
+                                                    headers=fetcher.headers, offset=offset)
+        file_size = state['size']
+        mode = 'ab' if offset else 'wb'
+
+        received_bytes = offset
+        progress_reporter = ProgressReporter(callback=callback, msg=msg, total=file_size, received_bytes=offset)
+        hasher = BackgroundHasher(partial_file, size=file_size, available=offset) if verify else None
+        with fetcher, open(partial_file.as_posix(), mode) as destination_file, ExitStack() as stack:
+            if hasher is not None:
+                stack.enter_context(hasher)
+            for block in self.read_blocks(fetcher, stop_event=stop_event):
+                destination_file.write(block)
+                received_bytes += len(block)
+                progress_reporter.update(received_bytes)
+                if hasher is not None:
+                    destination_file.flush()
+                    hasher.update(received_bytes)
+
+        digest = None
+        if hasher is not None and received_bytes >= file_size:
+            digest = hasher.hexdigest()
+        self.finish_partial_download(partial_file=partial_file, state=state, received_bytes=received_bytes,
+                                     digest=digest)
+
+    def get_resume_headers(self, url: str, partial_file: PosixPath) -> Tuple[int, Dict[str, str]]:
+        """
+        :return: The offset the download of the URL into the partial file resumes from, and the
+        headers requesting it.
+        """
+        state = self.read_partial_state(self.get_partial_state_path(partial_file))
+        offset = 0
+        headers = {}
+        if self.can_resume(state, url) and partial_file.is_file():
+            offset = partial_file.stat().st_size
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+            validator = self.get_resume_validator(state, url)
+            if validator:
+                headers['If-Range'] = validator
+        return offset, headers
+
+    def is_partial_file_complete(self, error: HTTPError, partial_file: PosixPath, offset: int) -> bool:
+        """
+        A range starting at the end of the file cannot be satisfied: the partial file is either
+        complete already or bigger than the file on the server, in which case it is removed.
+        """
+        if error.code != 416:
+            raise error
+        if offset == self.read_partial_state(self.get_partial_state_path(partial_file)).get('size'):
+            return True
+        partial_file.unlink()
+        raise IncompleteRead(b'') from error
+
+    @staticmethod
+    def get_response_state(url: str, status: Optional[int], headers, offset: int) -> Tuple[Dict[str, Any], int]:
+        """
+        :return: The state of the download answered with the given response, and the offset it
+        continues from, which is 0 unless the server honoured the range request.
+        """
+        if offset and status == 206:
+            file_size = int(headers['content-range'].split('/')[-1])
+        else:
+            file_size = int(headers['content-length'])
+            offset = 0
+        state = {
+            'url': url,
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'size': file_size
+        }
+        return state, offset
+
+    def start_partial_download(self, url: str, partial_file: PosixPath, status: Optional[int], headers,
+                               offset: int) -> Tuple[Dict[str, Any], int]:
+        """
+        Records the state of the download answered with the given response next to the partial file.
+        :return: The state, and the offset the download continues from.
+        """
+        state, offset = self.get_response_state(url=url, status=status, headers=headers, offset=offset)
+        self.write_partial_state(self.get_partial_state_path(partial_file), state)
+        return state, offset
+
+    def finish_partial_download(self, partial_file: PosixPath, state: Dict[str, Any], received_bytes: int,
+                                digest: Optional[str] = None):
+        """
+        Checks that the whole file was received, and records its SHA-256 digest, if it was hashed.
+        """
+        if received_bytes < state['size']:
+            raise IncompleteRead(b'', state['size'] - received_bytes)
+        if digest is not None:
+            state['sha256'] = digest
+            self.write_partial_state(self.get_partial_state_path(partial_file), state)
+
+    def prepare_segmented_download(self, url: str, partial_file: PosixPath) -> bool:
+        state_file = self.get_partial_state_path(partial_file)
+        state = self.read_partial_state(state_file)
+        if self.can_resume(state, url) and partial_file.is_file():
+            return 'segments' in state
+        if self._segments < 2 or urlsplit(url).netloc in self._hosts_without_ranges:
+            return False
+
+        with self._connection_pool.urlopen(Request(url, method='HEAD'), timeout=self.TIMEOUT) as head_response:
+            headers = head_response.headers
+        file_size = int(headers.get('content-length', 0))
+        if headers.get('accept-ranges') != 'bytes' or file_size < self._segment_threshold:
+            return False
+
+        segment_size = -(-file_size // self._segments)
+        segments = [[start, min(start + segment_size, file_size) - 1, 0]
+                    for start in range(0, file_size, segment_size)]
+        self.write_partial_state(state_file, {
+            'url': url,
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'size': file_size,
+            'segments': segments
+        })
+        with open(partial_file.as_posix(), 'wb') as destination_file:
+            try:
+                os.posix_fallocate(destination_file.fileno(), 0, file_size)
+            except (AttributeError, OSError):
+                os.truncate(destination_file.fileno(), file_size)
+        return True
+
+    def download_segments_into_partial_file(self, url: str, partial_file: PosixPath, msg: str,
+                                            callback: Callable[[str, int, int, float], None] = None,
+                                            verify: bool = False, stop_event: Event = None):
+        state_file = self.get_partial_state_path(partial_file)
+        state = self.read_partial_state(state_file)
+        file_size = state['size']
+        validator = self.get_resume_validator(state, url)
+        pending_segments = [segment for segment in state['segments'] if segment[0] + segment[2] <= segment[1]]
+
+        received_bytes = sum([segment[2] for segment in state['segments']])
+        progress = {
+            'lock': Lock(),
+            'abort': Event(),
+            'received_bytes': received_bytes,
+            'reporter': ProgressReporter(callback=callback, msg=msg, total=file_size, received_bytes=received_bytes),
+            'segments': state['segments'],
+            'hasher': None,
+            'stop_event': stop_event
+        }
+        if verify:
+            progress['hasher'] = BackgroundHasher(partial_file, size=file_size,
+                                                  available=self.get_contiguous_size(state['segments']))
+        restart_download = False
+        file_descriptor = os.open(partial_file.as_posix(), os.O_WRONLY)
+        try:
+            with ExitStack() as stack:
+                if progress['hasher'] is not None:
+                    stack.enter_context(progress['hasher'])
+                with ThreadPoolExecutor(max_workers=max(1, len(pending_segments)),
+                                        thread_name_prefix="jmanager_segment") as executor:
+                    futures = [executor.submit(self.download_segment, url=url, file_descriptor=file_descriptor,
+                                               segment=segment, validator=validator, progress=progress)
+                               for segment in pending_segments]
+                    wait(futures, return_when=FIRST_EXCEPTION)
+                    progress['abort'].set()
+                    for future in futures:
+                        future.result()
+            if progress['hasher'] is not None and progress['received_bytes'] == file_size:
+                state['sha256'] = progress['hasher'].hexdigest()
+        except SegmentedDownloadError:
+            restart_download = True
+            raise
+        finally:
+            os.close(file_descriptor)
+            if restart_download:
+                partial_file.unlink()
+                state_file.unlink()
+            else:
+                self.write_partial_state(state_file, state)
+
+        if progress['received_bytes'] != file_size:
+            raise IncompleteRead(b'', file_size - progress['received_bytes'])
+
+    def download_segment(self, url: str, file_descriptor: int, segment: List[int], validator: str,
+                         progress: Dict[str, Any]):
+        start, end, _ = segment
+        headers = {'Range': f"bytes={start + segment[2]}-{end}"}
+        if validator:
+            headers['If-Range'] = validator
+
+        with self._connection_pool.urlopen(Request(url, headers=headers), timeout=self.TIMEOUT) as fetcher:
+            if getattr(fetcher, 'status', None) != 206:
+                raise SegmentedDownloadError(f"The server did not honour the range request for {url}")
+
+            for block in self.read_blocks(fetcher, size=end - start - segment[2] + 1,
+                                          stop_event=progress.get('stop_event')):
+                if progress['abort'].is_set():
+                    return
+                os.pwrite(file_descriptor, block, start + segment[2])
+
+                with progress['lock']:
+                    segment[2] += len(block)
+                    progress['received_bytes'] += len(block)
+                    progress['reporter'].update(progress['received_bytes'])
+                    if progress['hasher'] is not None:
+                        progress['hasher'].update(self.get_contiguous_size(progress['segments']))
+
+            if start + segment[2] <= end:
+                raise IncompleteRead(b'', end - start - segment[2] + 1)
+
+    @staticmethod
+    def get_contiguous_size(segments: List[List[int]]) -> int:
+        """
+        :return: The number of bytes downloaded without gaps from the start of a segmented download.
+        """
+        for start, end, received_bytes in sorted(segments):
+            if start + received_bytes <= end:
+                return start + received_bytes
+        return max([end for _, end, _ in segments]) + 1
+
+    def read_blocks(self, response, size: int = None, stop_event: Event = None) -> Iterator[memoryview]:
+        """
+        Reads the response with readinto into a buffer reused for every block, so no new bytes
+        object is created per read. Blocks start at BLOCK_SIZE and double, up to MAX_BLOCK_SIZE,
+        while reading one takes less than half of BLOCK_TIME; they halve when it takes longer
+        than twice BLOCK_TIME. Every block is only valid until the next one is read.
+
+        With a bandwidth flow, blocks are not bigger than the bursts it allows, and every one
+        of them waits for its share of the bandwidth before being yielded.
+        :param response: The response to read from.
+        :param size: The number of bytes to read at most, or None to read the response to the end.
+        :param stop_event: Raises DownloadCancelledError before reading the next block once it is set.
+        """
+        block_size = self.BLOCK_SIZE
+        max_block_size = self.MAX_BLOCK_SIZE
+        if self._bandwidth_flow is not None:
+            max_block_size = max(self.BLOCK_SIZE, min(self._bandwidth_flow.max_block_size, max_block_size))
+        buffer = memoryview(bytearray(block_size))
+        while size is None or size > 0:
+            self.check_stop_event(stop_event)
+            read_size = block_size if size is None else min(block_size, size)
+            start_time = monotonic()
+            read_bytes = response.readinto(buffer[:read_size])
+            if not read_bytes:
+                return
+            elapsed_time = monotonic() - start_time
+            if self._bandwidth_flow is not None:
+                self._bandwidth_flow.acquire(read_bytes)
+            yield buffer[:read_bytes]
+
+            if size is not None:
+                size -= read_bytes
+            if read_bytes == read_size and elapsed_time < self.BLOCK_TIME / 2:
+                block_size = min(block_size * 2, max_block_size)
+            elif elapsed_time > self.BLOCK_TIME * 2:
+                block_size = max(block_size // 2, self.BLOCK_SIZE)
+            if block_size > len(buffer):
+                buffer = memoryview(bytearray(block_size))
+
+    @staticmethod
+    def check_stop_event(stop_event: Optional[Event]):
+        if stop_event is not None and stop_event.is_set():
+            raise DownloadCancelledError("The download was cancelled")
+
+    def can_resume(self, state: Dict[str, Any], url: str) -> bool:
+        """
+        A partial download can be resumed from the server it comes from or, when its modification
+        date is known, from any other mirror serving the same file.
+        """
+        if state.get('url') is None:
+            return False
+        if state['url'] == url:
+            return True
+        is_same_file = self.get_mirror_path(state['url']) == self.get_mirror_path(url)
+        return is_same_file and state.get('last_modified') is not None
+
+    @staticmethod
+    def get_resume_validator(state: Dict[str, Any], url: str) -> Optional[str]:
+        if state.get('url') == url:
+            return state.get('etag') or state.get('last_modified')
+        return state.get('last_modified')
+
+    def get_mirror_path(self, url: str) -> str:
+        if self._mirror_selector is not None:
+            mirror = self._mirror_selector.get_mirror(url)
+            if mirror is not None:
+                return url[len(mirror):]
+        return url
+
+    def report_failed_download(self, url: str):
+        if self._mirror_selector is not None:
+            mirror = self._mirror_selector.get_mirror(url)
+            if mirror is not None:
+                self._mirror_selector.demote(mirror)
+
+    @staticmethod
+    def get_partial_path(destination: PosixPath) -> PosixPath:
+        return destination.with_name(f"{destination.name}{PARTIAL_SUFFIX}")
+
+    @staticmethod
+    def get_partial_state_path(partial_file: PosixPath) -> PosixPath:
+        return partial_file.with_name(f"{partial_file.name}{PARTIAL_STATE_SUFFIX}")
+
+    @staticmethod
+    def read_partial_state(state_file: PosixPath) -> Dict[str, Any]:
+        if not state_file.is_file():
+            return {}
+        with open(state_file.as_posix(), 'r') as partial_state:
+            return yaml.load(stream=partial_state, Loader=yaml.Loader) or {}
+
+    @staticmethod
+    def write_partial_state(state_file: PosixPath, state: Dict[str, Any]):
+        with open(state_file.as_posix(), 'w') as partial_state:
+            yaml.dump(state, stream=partial_state)
 
     def fetch_tarballs_into(self, version: Version, architecture: Architecture,
                             components: List[Component], temp_dir: PosixPath,
-                            callback: Callable[[str, int, int, float], None] = None):
+                            callback: Callable[[str, int, int, float], None] = None,
+                            fetched_callback: Callable[[Component], None] = None, stop_event: Event = None):
+        """
+        :param fetched_callback: Called, from any thread, with every component as soon as its
+        tarball is in the temporary directory.
+        :param stop_event: Cancels the downloads, which raise DownloadCancelledError, once it is set.
+        """
+        base_urls = self.get_base_urls(architecture, version)
+        callback = self.synchronize_callback(callback)
+        checksums, components_to_fetch = self.prepare_fetch(version=version, architecture=architecture,
+                                                            components=components, temp_dir=temp_dir,
+                                                            callback=callback)
+        if fetched_callback is not None:
+            for component in components:
+                if component not in components_to_fetch:
+                    fetched_callback(component)
+
+        workers = max(1, min(self._max_workers, len(components_to_fetch)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jmanager_fetch") as executor:
+            futures = []
+            for component in components_to_fetch:
+                futures.append(executor.submit(self.fetch_component, base_urls=base_urls, version=version,
+                                               architecture=architecture, component=component,
+                                               temp_dir=temp_dir, checksums=checksums, callback=callback,
+                                               fetched_callback=fetched_callback, stop_event=stop_event))
+
+            wait(futures, return_when=FIRST_EXCEPTION)
+            for future in futures:
+                future.cancel()
+            for future in futures:
+                if not future.cancelled():
+                    future.result()
+
+    def prepare_fetch(self, version: Version, architecture: Architecture, components: List[Component],
+                      temp_dir: PosixPath, callback: Callable[[str, int, int, float], None] = None
+                      ) -> Tuple[Dict[Component, str], List[Component]]:
+        """
+        Fetches the MANIFEST and copies the cached components into the temporary directory.
+        :return: The checksums of the MANIFEST and the components that still need to be downloaded.
+        """
+        checksums = self.fetch_manifest(version=version, architecture=architecture)
+        if self._tarball_cache is None:
+            return checksums, components.copy()
+        return checksums, [component for component in components
+                           if not self.fetch_from_cache(version, architecture, component,
+                                                        checksum=checksums.get(component),
+                                                        temp_dir=temp_dir, callback=callback)]
+
+    def fetch_component(self, base_urls: List[str], version: Version, architecture: Architecture,
+                        component: Component, temp_dir: PosixPath, checksums: Dict[Component, str],
+                        callback: Callable[[str, int, int, float], None] = None,
+                        fetched_callback: Callable[[Component], None] = None, stop_event: Event = None):
+        self.check_stop_event(stop_event)
+        tarball_name = self.get_tarball_name(component)
+        destination = temp_dir.joinpath(tarball_name)
+        urls = [f"{base_url}/{tarball_name}" for base_url in base_urls]
+        if component not in checksums:
+            raise ChecksumError(f"Component '{component.value}' is not listed in the MANIFEST")
+        download_path = self.get_component_download_path(version, architecture, component, destination)
+        state = self.fetch_file(url=urls[0], destination=download_path, callback=callback, mirror_urls=urls[1:],
+                                checksum=checksums[component], stop_event=stop_event)
+        self.store_component(version, architecture, component, download_path=download_path,
+                             destination=destination, state=state)
+        if fetched_callback is not None:
+            fetched_callback(component)
+
+    def get_component_download_path(self, version: Version, architecture: Architecture, component: Component,
+                                    destination: PosixPath) -> PosixPath:
+        if self._tarball_cache is not None:
+            return self._tarball_cache.get_download_path(version, architecture, component)
+        if self._download_dir is not None:
+            os.makedirs(self._download_dir.as_posix(), exist_ok=True)
+            return self._download_dir.joinpath(f"{version}_{architecture.value}_{component.value}")
+        return destination
+
+    def store_component(self, version: Version, architecture: Architecture, component: Component,
+                        download_path: PosixPath, destination: PosixPath, state: Dict[str, Any]):
+        """
+        Adds a verified download to the tarball cache, if any, and links it into its destination.
+        Without a cache, it is moved there from the download folder.
+        """
+        if self._tarball_cache is None:
+            if download_path != destination:
+                shutil.move(download_path.as_posix(), destination.as_posix())
+            return
+        try:
+            cached_file = self._tarball_cache.insert(version, architecture, component,
+                                                     path_to_file=download_path, checksum=state['sha256'],
+                                                     etag=state.get('etag'), last_modified=state.get('last_modified'))
+        finally:
+            download_path.unlink()
+        cached_file = self._tarball_cache.lookup(version, architecture, component, checksum=state['sha256'],
+                                                 fast_copy=True) or cached_file
+        destination = destination.with_name(self.get_tarball_name(component, TarballCodec.from_path(cached_file)))
+        link_or_copy_file(source=cached_file, destination=destination)
+
+    def fetch_from_cache(self, version: Version, architecture: Architecture, component: Component, checksum: str,
+                         temp_dir: PosixPath, callback: Callable[[str, int, int, float], None] = None) -> bool:
+        if checksum is None:
+            return False
+
+        cached_file = self._tarball_cache.lookup(version, architecture, component, checksum=checksum, fast_copy=True)
+        if cached_file is None:
+            return False
+
+        destination = temp_dir.joinpath(self.get_tarball_name(component, TarballCodec.from_path(cached_file)))
+        link_or_copy_file(source=cached_file, destination=destination)
+        if callback is not None:
+            file_size = destination.stat().st_size
+            callback(f"{destination.name} ", file_size, file_size, 0.0)
+        return True
+
+    def fetch_manifest(self, version: Version, architecture: Architecture) -> Dict[Component, str]:
+        """
+        Cached MANIFEST files of releases are used as they are. Snapshots change over time, so
+        their cached MANIFEST is revalidated with a conditional request and only downloaded
+        again when the server has a newer one.
+        """
+        cached_manifest = None
+        if self._tarball_cache is not None:
+            cached_manifest = self._tarball_cache.lookup(version, architecture, Component.MANIFEST)
+            if cached_manifest is not None and version.version_type == VersionType.RELEASE:
+                return self.read_manifest(cached_manifest)
+
+        with TemporaryDirectory(prefix="jmanager_", suffix="_manifest") as temp_dir:
+            manifest_path = PosixPath(temp_dir).joinpath(self.get_tarball_name(Component.MANIFEST))
+            urls = [f"{base_url}/{manifest_path.name}" for base_url in self.get_base_urls(architecture, version)]
+            cache_entry = None
+            if cached_manifest is not None:
+                cache_entry = self._tarball_cache.get_entry(version, architecture, Component.MANIFEST)
+
+            if cache_entry is not None and (cache_entry.etag or cache_entry.last_modified):
+                validators = self.fetch_file_if_modified(urls=urls, destination=manifest_path,
+                                                         etag=cache_entry.etag,
+                                                         last_modified=cache_entry.last_modified)
+                if validators is None:
+                    return self.read_manifest(cached_manifest)
+            else:
+                validators = self.fetch_file(url=urls[0], destination=manifest_path, mirror_urls=urls[1:])
+
+            if self._tarball_cache is not None:
+                self._tarball_cache.insert(version, architecture, Component.MANIFEST,
+                                           path_to_file=manifest_path, checksum=get_file_checksum(manifest_path),
+                                           etag=validators.get('etag'),
+                                           last_modified=validators.get('last_modified'))
+            return self.read_manifest(manifest_path)
+
+    def fetch_file_if_modified(self, urls: List[str], destination: PosixPath, etag: str = None,
+                               last_modified: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Downloads the file unless it still matches the given validators, in which case the
+        request costs a single round trip.
+        :return: The validators of the downloaded file, or None when it has not been modified.
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        for attempt, url in enumerate(urls):
+            try:
+                with self._connection_pool.urlopen(Request(url, headers=headers), timeout=self.TIMEOUT) as response, \
+                        open(destination.as_posix(), 'wb') as destination_file:
+                    shutil.copyfileobj(response, destination_file)
+                    return {
+                        'url': url,
+                        'etag': response.headers.get('etag'),
+                        'last_modified': response.headers.get('last-modified')
+                    }
+            except HTTPError as error:
+                if error.code != 304:
+                    raise
+                return None
+            except TRANSIENT_ERRORS as error:
+                if not is_transient_error(error):
+                    raise
+                self.report_failed_download(url)
+                if attempt == len(urls) - 1:
+                    raise
+
+    def get_upstream_modification_time(self, version: Version, architecture: Architecture) -> Optional[float]:
+        """
+        :return: When the MANIFEST of the distribution was last modified on the server, as a timestamp,
+        or None if the server does not tell.
+        """
+        manifest_url = f"{self.get_base_urls(architecture, version)[0]}/{self.get_tarball_name(Component.MANIFEST)}"
+        try:
+            with self._connection_pool.urlopen(Request(manifest_url, method='HEAD'), timeout=self.TIMEOUT) as response:
+                last_modified = response.headers.get('last-modified')
+        except HTTPError:
+            return None
+        if last_modified is None:
+            return None
+        return parsedate_to_datetime(last_modified).timestamp()
+
+    @staticmethod
+    def read_manifest(manifest_path: PosixPath) -> Dict[Component, str]:
+        with open(manifest_path.as_posix(), 'r') as manifest_file:
+            return parse_manifest(manifest_file.read())
+
+    @contextmanager
+    def open_tarball_stream(self, version: Version, architecture: Architecture,
+                            component: Component) -> Iterator[TarballStream]:
+        """
+        Opens a component for reading while it is being downloaded, so it can be extracted
+        without being written to disk first.
+
+        The stream is hashed as it is read and rejected once drained if it does not match the
+        MANIFEST checksum. With a tarball cache configured, hits are read straight from the cache.
+        Misses are copied into the cache as they are read and only added to it once verified.
+        """
+        tarball_name = self.get_tarball_name(component)
+        urls = [f"{base_url}/{tarball_name}" for base_url in self.get_base_urls(architecture, version)]
+        checksum = self.fetch_manifest(version=version, architecture=architecture).get(component)
+        if checksum is None:
+            raise ChecksumError(f"Component '{component.value}' is not listed in the MANIFEST")
+
+        if self._tarball_cache is None:
+            sha256 = hashlib.sha256()
+            http_stream = ResumableHTTPStream(url=urls[0], retries=self.DOWNLOAD_RETRIES, mirror_urls=urls[1:],
+                                              timeout=self.TIMEOUT, connection_pool=self._connection_pool,
+                                              bandwidth_flow=self._bandwidth_flow)
+            with TarballStream(raw_stream=http_stream, size=http_stream.size,
+                               observers=[sha256.update]) as tarball_stream:
+                yield tarball_stream
+                tarball_stream.drain()
+            if sha256.hexdigest() != checksum:
+                raise ChecksumError(f"Checksum mismatch for '{component.value}': "
+                                    f"expected {checksum}, got {sha256.hexdigest()}")
+            return
+
+        cached_file = self._tarball_cache.lookup(version, architecture, component, checksum=checksum, fast_copy=True)
+        if cached_file is not None:
+            with TarballStream(raw_stream=open(cached_file.as_posix(), 'rb'), size=cached_file.stat().st_size,
+                               codec=TarballCodec.from_path(cached_file)) as tarball_stream:
+                yield tarball_stream
+            return
+
+        sha256 = hashlib.sha256()
+        download_path = self._tarball_cache.get_download_path(version, architecture, component)
+        try:
+            with open(download_path.as_posix(), 'wb') as download_file:
+                http_stream = ResumableHTTPStream(url=urls[0], retries=self.DOWNLOAD_RETRIES, mirror_urls=urls[1:],
+                                                  timeout=self.TIMEOUT,
+                                                  connection_pool=self._connection_pool,
+                                                  bandwidth_flow=self._bandwidth_flow)
+                with TarballStream(raw_stream=http_stream, size=http_stream.size,
+                                   observers=[download_file.write, sha256.update]) as tarball_stream:
+                    yield tarball_stream
+                    tarball_stream.drain()
+
+            if sha256.hexdigest() != checksum:
+                raise ChecksumError(f"Checksum mismatch for '{component.value}': "
+                                    f"expected {checksum}, got {sha256.hexdigest()}")
+            self._tarball_cache.insert(version, architecture, component, path_to_file=download_path,
+                                       checksum=checksum, etag=http_stream.etag,
+                                       last_modified=http_stream.last_modified)
+        finally:
+            if download_path.exists():
+                download_path.unlink()
+
+    @staticmethod
+    def synchronize_callback(callback: Callable[..., None]) -> Callable[..., None]:
+        if callback is None:
+            return None
+
+        lock = Lock()
+
+        def _synchronized_callback(*args):
+            with lock:
+                callback(*args)
+
+        return _synchronized_callback
+
+    @staticmethod
+    def get_tarball_name(component: Component, codec: TarballCodec = TarballCodec.XZ) -> str:
+        if component == Component.MANIFEST:
+            return component.value
+        return f"{component.value}.{codec.extension}"
+
+    def get_base_url(self, architecture: Architecture, version: Version) -> str:
+        return self.get_base_urls(architecture, version)[0]
+
+    def get_base_urls(self, architecture: Architecture, version: Version) -> List[str]:
+        """
+        URLs of the distribution folder, from the fastest mirror to the slowest one.
+        Without mirrors configured, only the one of SERVER_URL.
+        """
         directory = self.get_directory_path(architecture, version)
-        base_url = f"{self.SERVER_URL}/{directory.as_posix()}"
+        if self._mirror_selector is None:
+            return [f"{self.SERVER_URL}/{directory.as_posix()}"]
 
-        for component in components.copy():
-            temp_file = temp_dir.joinpath(f"{component.value}.txz")
-            self.fetch_file(url=f"{base_url}/{component.value}.txz", destination=temp_file, callback=callback)
+        probe_path = directory.joinpath(self.get_tarball_name(Component.BASE)).as_posix()
+        mirrors = self._mirror_selector.get_ranked_mirrors(probe_path=probe_path)
+        return [f"{mirror}/{directory.as_posix()}" for mirror in mirrors]
 
     def get_directory_path(self, architecture: Architecture, version: Version) -> PosixPath:
         if version.version_type == VersionType.RELEASE:
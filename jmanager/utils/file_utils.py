@@ -1,48 +1,172 @@
-import lzma
+import io
 import os
 import shutil
 import sys
 import tarfile
 from pathlib import PosixPath
 from stat import SF_IMMUTABLE
-from tempfile import TemporaryDirectory
-from typing import Callable
+from typing import Callable, BinaryIO, Iterable, Union
+
+from jmanager.models.extraction_profile import ExtractionProfile
+from jmanager.utils.parallel_extract import ParallelTarExtractor
+from jmanager.utils.tarball_codec import TarballCodec, open_decompressed_stream
+from jmanager.utils.xz import XZBlockReader, is_multi_block_xz
+
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+
+class TarballStream(io.RawIOBase):
+    """
+    Read-only view over a compressed tarball coming from any binary stream.
+
+    It keeps track of how many bytes have been consumed and hands every block
+    read to the given observers, e.g. to store or hash the data on its way to
+    the extractor.
+    """
+
+    def __init__(self, raw_stream: BinaryIO, size: int, observers: Iterable[Callable[[memoryview], None]] = (),
+                 codec: TarballCodec = TarballCodec.XZ):
+        super().__init__()
+        self._raw_stream = raw_stream
+        self._size = size
+        self._position = 0
+        self._observers = list(observers)
+        self._codec = codec
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def codec(self) -> TarballCodec:
+        return self._codec
+
+    @property
+    def position(self) -> int:
+        return self._position
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        read_bytes = self._raw_stream.readinto(buffer)
+        if read_bytes:
+            self._position += read_bytes
+            data = memoryview(buffer)[:read_bytes]
+            for observer in self._observers:
+                observer(data)
+        return read_bytes
+
+    def drain(self):
+        buffer = bytearray(STREAM_BUFFER_SIZE)
+        while self.readinto(buffer):
+            pass
+
+    def close(self):
+        if not self.closed:
+            self._raw_stream.close()
+        super().close()
 
 
 def extract_tarball_into(jail_path: PosixPath, path_to_tarball: PosixPath,
-                         callback: Callable[[str, int, int], None]):
-    with TemporaryDirectory(prefix="jail_factory_") as temp_dir:
-        temp_file_path = f"{temp_dir}/{path_to_tarball.name}"
-        with lzma.open(path_to_tarball.as_posix(), 'r') as lz_file:
-            with open(temp_file_path, "wb") as temp_file:
-                temp_file.write(lz_file.read())
-
-        msg = f"Extracting {path_to_tarball.name}"
-        with tarfile.open(temp_file_path, mode='r') as tar_file:
-            members = tar_file.getmembers()
-            iteration = 0
-            for member in members:
-                if callback is not None:
-                    callback(msg, iteration, len(members))
-                tar_file.extract(member, path=jail_path.as_posix())
-                iteration += 1
+                         callback: Callable[[str, int, int], None], workers: int = 1, decompression_workers: int = 1,
+                         profile: ExtractionProfile = None):
+    """
+    Extracts a tarball into the jail path. Its encoding is given by its extension (see TarballCodec).
+
+    The tarball is decompressed and untarred as a stream, so the memory used does not depend on
+    its size. The progress is reported as the number of compressed bytes consumed.
+    With more than one worker, the regular files are written in parallel by ParallelTarExtractor
+    and the progress is reported as the number of bytes written. With more than one decompression
+    worker, the blocks of multi-block tarballs are decompressed in parallel. With a profile, only
+    the members it selects are written.
+    """
+    if workers > 1:
+        ParallelTarExtractor(workers=workers, decompression_workers=decompression_workers).extract_tarball(
+            jail_path=jail_path, path_to_tarball=path_to_tarball, callback=callback, profile=profile)
+        return
+
+    codec = TarballCodec.from_path(path_to_tarball)
+    if codec == TarballCodec.XZ and decompression_workers > 1 and is_multi_block_xz(path_to_tarball):
+        with XZBlockReader(path_to_tarball, workers=decompression_workers) as xz_reader:
+            untar_stream_into(jail_path=jail_path, decompressed_stream=xz_reader, progress_stream=xz_reader,
+                              tarball_name=path_to_tarball.name, callback=callback, profile=profile)
+        return
+
+    tarball_stream = TarballStream(raw_stream=open(path_to_tarball.as_posix(), 'rb'),
+                                   size=path_to_tarball.stat().st_size, codec=codec)
+    with tarball_stream:
+        extract_tarball_stream_into(jail_path=jail_path, tarball_stream=tarball_stream,
+                                    tarball_name=path_to_tarball.name, callback=callback, profile=profile)
+
+
+def extract_tarball_stream_into(jail_path: PosixPath, tarball_stream: TarballStream, tarball_name: str,
+                                callback: Callable[[str, int, int], None], profile: ExtractionProfile = None):
+    """
+    Extracts a tarball while it is being read, without any intermediate file.
+    The decompressor never produces more than one buffer ahead of the tar reader, which keeps
+    the memory used bounded. The progress is reported as the number of compressed bytes consumed.
+    """
+    decompressed_stream = open_decompressed_stream(tarball_stream, codec=tarball_stream.codec)
+    try:
+        untar_stream_into(jail_path=jail_path, decompressed_stream=decompressed_stream, progress_stream=tarball_stream,
+                          tarball_name=tarball_name, callback=callback, profile=profile)
+    finally:
+        if decompressed_stream is not tarball_stream:
+            decompressed_stream.close()
+
+
+def untar_stream_into(jail_path: PosixPath, decompressed_stream: BinaryIO,
+                      progress_stream: Union[TarballStream, XZBlockReader], tarball_name: str,
+                      callback: Callable[[str, int, int], None], profile: ExtractionProfile = None):
+    msg = f"Extracting {tarball_name}"
+    with tarfile.open(fileobj=decompressed_stream, mode='r|', bufsize=STREAM_BUFFER_SIZE) as tar_file:
+        members = tar_file if profile is None else profile.filter_members(tar_file)
+        for member in members:
             if callback is not None:
-                callback(msg, len(members), len(members))
+                callback(msg, min(progress_stream.position, progress_stream.size), progress_stream.size)
+            tar_file.extract(member, path=jail_path.as_posix())
+    if callback is not None:
+        callback(msg, progress_stream.size, progress_stream.size)
 
 
 def set_flags_to_folder_recursively(path: PosixPath, flags: int):
-    if not path.is_dir() and not path.is_symlink():
-        if sys.platform.startswith('freebsd'):
-            os.chflags(path.as_posix(), flags)
+    """
+    Sets the flags of every file and folder below the path, without following symbolic links.
+    The tree is walked with os.scandir and an explicit stack, so deep trees do not hit the
+    recursion limit and no PosixPath is created per node.
+    """
+    if not sys.platform.startswith('freebsd') or path.is_symlink():
         return
-
-    if path.is_symlink():
+    if not path.is_dir():
+        os.chflags(path.as_posix(), flags)
         return
 
-    for node in path.iterdir():
-        set_flags_to_folder_recursively(path=node, flags=flags)
+    folders = [path.as_posix()]
+    while folders:
+        folder = folders.pop()
+        os.chflags(folder, flags)
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif not entry.is_symlink():
+                    os.chflags(entry.path, flags)
+
+
+def link_or_copy_file(source: PosixPath, destination: PosixPath):
+    if destination.exists():
+        destination.unlink()
+    try:
+        os.link(source.as_posix(), destination.as_posix())
+    except OSError:
+        shutil.copyfile(source.as_posix(), destination.as_posix())
 
 
 def remove_immutable_path(jail_path: PosixPath):
+    """
+    Removes a tree which may contain immutable files, walking it. When the tree is a data set
+    of its own, resetting it at the ZFS level is much faster (see BaseJailFactory.reset_base_data_set).
+    """
     set_flags_to_folder_recursively(jail_path, not SF_IMMUTABLE)
     shutil.rmtree(jail_path, ignore_errors=True)
@@ -0,0 +1,288 @@
+import io
+import select
+import ssl
+from collections import deque
+from http.client import HTTPConnection, HTTPSConnection, HTTPResponse, RemoteDisconnected, HTTPMessage
+from threading import Lock
+from time import monotonic
+from typing import Dict, Tuple, Deque, NamedTuple, Union, Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit, urljoin
+from urllib.request import Request, urlopen, getproxies
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+STALE_CONNECTION_ERRORS = (RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+ConnectionKey = Tuple[str, str, int]
+
+
+def get_connection_key(url: str) -> Tuple[ConnectionKey, str]:
+    """
+    :return: The key the connections to the server of the URL are kept under, and the path to request.
+    """
+    split_url = urlsplit(url)
+    key = (split_url.scheme, split_url.hostname, split_url.port or (443 if split_url.scheme == 'https' else 80))
+    path = split_url.path or '/'
+    if split_url.query:
+        path = f"{path}?{split_url.query}"
+    return key, path
+
+
+def get_redirection(url: str, method: str, status: int, headers: HTTPMessage) -> Optional[Tuple[str, str]]:
+    """
+    :return: The URL and the method to send the request again with, or None if the response is no redirection.
+    """
+    if status not in REDIRECT_CODES or not headers.get('location'):
+        return None
+    return urljoin(url, headers['location']), 'GET' if status == 303 else method
+
+
+def get_status_error(url: str, status: int, reason: str, headers: HTTPMessage, body: bytes) -> Optional[HTTPError]:
+    """
+    :return: The error to raise for a response with an error status, like urllib does, or None.
+    """
+    if 200 <= status < 300:
+        return None
+    return HTTPError(url, status, reason, headers, io.BytesIO(body))
+
+
+class _ResponseHeadSocket:
+    def __init__(self, head: bytes):
+        self._head = head
+
+    def makefile(self, mode: str) -> io.BytesIO:
+        return io.BytesIO(self._head)
+
+
+def parse_response_head(head: bytes, method: str) -> HTTPResponse:
+    """
+    Parses the status line and the headers of a response received by other means than an
+    HTTPConnection, e.g. an asyncio stream, the same way http.client parses the ones of ConnectionPool.
+    :return: A response without body, which tells its status, its headers, and how its body is delimited
+    through its length, chunked and will_close attributes.
+    """
+    response = HTTPResponse(_ResponseHeadSocket(head), method=method)
+    response.begin()
+    return response
+
+
+class ConnectionPoolStats(NamedTuple):
+    requests: int
+    connections_opened: int
+    connections_reused: int
+    stale_connections: int
+
+    @property
+    def reuse_ratio(self) -> float:
+        if not self.requests:
+            return 0.0
+        return self.connections_reused / self.requests
+
+
+class PooledResponse:
+    """
+    Response of a request sent through a ConnectionPool. Its connection goes back to the pool
+    when the response is closed after its body was read to the end, otherwise it is dropped.
+    """
+
+    def __init__(self, url: str, response: HTTPResponse, connection: HTTPConnection, key: ConnectionKey,
+                 connection_pool: 'ConnectionPool'):
+        self._url = url
+        self._response = response
+        self._connection = connection
+        self._key = key
+        self._connection_pool = connection_pool
+
+    @property
+    def url(self) -> str:
+        return self._url
+
+    @property
+    def status(self) -> int:
+        return self._response.status
+
+    @property
+    def reason(self) -> str:
+        return self._response.reason
+
+    @property
+    def headers(self) -> HTTPMessage:
+        return self._response.headers
+
+    def read(self, amt: int = None) -> bytes:
+        return self._response.read(amt)
+
+    def readinto(self, buffer) -> int:
+        return self._response.readinto(buffer)
+
+    def close(self):
+        if self._connection is None:
+            return
+        if not self._response.isclosed() and self._response.length == 0:
+            self._response.read()
+        is_complete = self._response.isclosed()
+        self._response.close()
+        self._connection_pool.release(self._key, self._connection,
+                                      reusable=is_complete and not self._response.will_close)
+        self._connection = None
+
+    def __enter__(self) -> 'PooledResponse':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Keeps HTTP/1.1 connections open between requests, so downloads from the same server do
+    not pay for a new TCP and TLS handshake every time.
+
+    Idle connections are kept per scheme, host and port, up to MAX_IDLE_CONNECTIONS each and
+    for at most IDLE_TIMEOUT seconds. A kept connection closed meanwhile by the server is
+    replaced by a new one. URLs other than http and https, and requests going through a
+    proxy, are handed over to urllib.
+    """
+    MAX_IDLE_CONNECTIONS = 8
+    IDLE_TIMEOUT = 60
+    MAX_REDIRECTS = 10
+    USER_AGENT = 'jmanager'
+
+    def __init__(self, max_idle_connections: int = MAX_IDLE_CONNECTIONS, idle_timeout: float = IDLE_TIMEOUT):
+        self._max_idle_connections = max_idle_connections
+        self._idle_timeout = idle_timeout
+        self._lock = Lock()
+        self._idle_connections: Dict[ConnectionKey, Deque[Tuple[HTTPConnection, float]]] = {}
+        self._ssl_context = None
+        self._requests = 0
+        self._connections_opened = 0
+        self._connections_reused = 0
+        self._stale_connections = 0
+
+    @property
+    def stats(self) -> ConnectionPoolStats:
+        with self._lock:
+            return ConnectionPoolStats(requests=self._requests, connections_opened=self._connections_opened,
+                                       connections_reused=self._connections_reused,
+                                       stale_connections=self._stale_connections)
+
+    @property
+    def idle_connections(self) -> int:
+        with self._lock:
+            return sum([len(connections) for connections in self._idle_connections.values()])
+
+    def urlopen(self, request: Union[Request, str], timeout: float = None) -> Union[PooledResponse, HTTPResponse]:
+        """
+        Sends the request like urllib.request.urlopen does: redirections are followed and
+        error statuses raise HTTPError.
+        """
+        if isinstance(request, str):
+            request = Request(request)
+        scheme = urlsplit(request.full_url).scheme
+        if scheme not in ('http', 'https') or scheme in getproxies():
+            return urlopen(request, timeout=timeout)
+
+        url = request.full_url
+        method = request.get_method()
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = self.send(method, url, headers=dict(request.header_items()), timeout=timeout)
+            redirection = get_redirection(url, method=method, status=response.status, headers=response.headers)
+            if redirection is not None:
+                response.read()
+                response.close()
+                url, method = redirection
+                continue
+            if not 200 <= response.status < 300:
+                body = response.read()
+                response.close()
+                raise get_status_error(url, status=response.status, reason=response.reason,
+                                       headers=response.headers, body=body)
+            return response
+        raise HTTPError(url, response.status, "Too many redirections", response.headers, None)
+
+    def send(self, method: str, url: str, headers: Dict[str, str], timeout: float = None) -> PooledResponse:
+        key, path = get_connection_key(url)
+        headers = {'User-Agent': self.USER_AGENT, **headers}
+
+        while True:
+            connection, is_reused = self.acquire(key, timeout)
+            try:
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+            except STALE_CONNECTION_ERRORS as error:
+                connection.close()
+                if is_reused:
+                    with self._lock:
+                        self._stale_connections += 1
+                    continue
+                raise URLError(error) from error
+            except OSError as error:
+                connection.close()
+                raise URLError(error) from error
+            except BaseException:
+                connection.close()
+                raise
+
+            with self._lock:
+                self._requests += 1
+                if is_reused:
+                    self._connections_reused += 1
+            return PooledResponse(url=url, response=response, connection=connection, key=key,
+                                  connection_pool=self)
+
+    def acquire(self, key: ConnectionKey, timeout: float = None) -> Tuple[HTTPConnection, bool]:
+        with self._lock:
+            idle_connections = self._idle_connections.get(key, deque())
+            while idle_connections:
+                connection, released_at = idle_connections.pop()
+                if monotonic() - released_at <= self._idle_timeout and not self.is_connection_dropped(connection):
+                    connection.timeout = timeout
+                    connection.sock.settimeout(timeout)
+                    return connection, True
+                connection.close()
+            self._connections_opened += 1
+
+        scheme, host, port = key
+        if scheme == 'https':
+            return HTTPSConnection(host, port, timeout=timeout, context=self.get_ssl_context()), False
+        return HTTPConnection(host, port, timeout=timeout), False
+
+    def release(self, key: ConnectionKey, connection: HTTPConnection, reusable: bool):
+        if not reusable or connection.sock is None:
+            connection.close()
+            return
+
+        with self._lock:
+            idle_connections = self._idle_connections.setdefault(key, deque())
+            idle_connections.append((connection, monotonic()))
+            while len(idle_connections) > self._max_idle_connections:
+                idle_connections.popleft()[0].close()
+
+    def clear(self):
+        with self._lock:
+            for idle_connections in self._idle_connections.values():
+                for connection, _ in idle_connections:
+                    connection.close()
+            self._idle_connections = {}
+
+    def get_ssl_context(self) -> ssl.SSLContext:
+        with self._lock:
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            return self._ssl_context
+
+    @staticmethod
+    def is_connection_dropped(connection: HTTPConnection) -> bool:
+        """
+        An idle connection has nothing to read: when it is readable, the server has closed it.
+        """
+        if connection.sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([connection.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+
+HTTP_CONNECTION_POOL = ConnectionPool()
@@ -0,0 +1,124 @@
+import hashlib
+from pathlib import PosixPath
+from threading import Thread, Condition
+from typing import Dict, Optional
+
+from jmanager.models.distribution import Component
+
+MANIFEST_SEPARATOR = '\t'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class ChecksumError(BaseException):
+    pass
+
+
+def parse_manifest(content: str) -> Dict[Component, str]:
+    """
+    Parses the MANIFEST file published next to the distribution tarballs.
+
+    Every line has the form 'base.txz<TAB>sha256<TAB>number of files<TAB>base<TAB>description<TAB>on/off'.
+    :param content: The content of the MANIFEST file.
+    :return: The SHA-256 digest of every known component.
+    """
+    checksums: Dict[Component, str] = {}
+    for line in content.split('\n'):
+        fields = line.strip().split(MANIFEST_SEPARATOR)
+        if len(fields) < 2 or not fields[0].endswith('.txz'):
+            continue
+
+        try:
+            component = Component(fields[0][:-len('.txz')])
+        except ValueError:
+            continue
+        checksums[component] = fields[1].lower()
+    return checksums
+
+
+def get_file_checksum(path_to_file: PosixPath) -> str:
+    sha256 = hashlib.sha256()
+    with open(path_to_file.as_posix(), 'rb') as file_to_check:
+        while True:
+            buffer = file_to_check.read(HASH_BLOCK_SIZE)
+            if not buffer:
+                break
+            sha256.update(buffer)
+    return sha256.hexdigest()
+
+
+def verify_file_checksum(path_to_file: PosixPath, expected_checksum: str):
+    checksum = get_file_checksum(path_to_file)
+    if checksum != expected_checksum:
+        raise ChecksumError(f"Checksum mismatch for '{path_to_file.name}': "
+                            f"expected {expected_checksum}, got {checksum}")
+
+
+class BackgroundHasher:
+    """
+    Computes the SHA-256 digest of a file while it is being written, on a thread of its own,
+    so hashing overlaps with the download instead of being a second pass over the file once
+    it is complete. The writer reports how many bytes from the start of the file are already
+    written, and the hasher reads them back, usually straight from the page cache.
+    """
+
+    def __init__(self, path_to_file: PosixPath, size: int, available: int = 0):
+        self._path_to_file = path_to_file
+        self._size = size
+        self._available = available
+        self._cancelled = False
+        self._error: Optional[BaseException] = None
+        self._sha256 = hashlib.sha256()
+        self._condition = Condition()
+        self._thread = Thread(target=self._hash_file, name="jmanager_hasher", daemon=True)
+
+    def __enter__(self) -> 'BackgroundHasher':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None or self._available < self._size:
+            self.cancel()
+        self._thread.join()
+
+    def update(self, available: int):
+        """
+        :param available: The number of bytes written so far without gaps from the start of the file.
+        """
+        with self._condition:
+            self._available = available
+            self._condition.notify()
+
+    def cancel(self):
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify()
+
+    def hexdigest(self) -> str:
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        if self._cancelled:
+            raise ChecksumError(f"The checksum of '{self._path_to_file.name}' was not computed")
+        return self._sha256.hexdigest()
+
+    def _hash_file(self):
+        buffer = memoryview(bytearray(HASH_BLOCK_SIZE))
+        position = 0
+        try:
+            with open(self._path_to_file.as_posix(), 'rb', buffering=0) as file_to_hash:
+                while position < self._size:
+                    with self._condition:
+                        while self._available <= position and not self._cancelled:
+                            self._condition.wait()
+                        if self._cancelled:
+                            return
+                        available = self._available
+
+                    while position < available:
+                        read_bytes = file_to_hash.readinto(buffer[:min(HASH_BLOCK_SIZE, available - position)])
+                        if not read_bytes:
+                            raise ChecksumError(f"'{self._path_to_file.name}' is shorter than expected")
+                        self._sha256.update(buffer[:read_bytes])
+                        position += read_bytes
+        except BaseException as error:
+            self._error = error
@@ -0,0 +1,131 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from pathlib import PosixPath
+from threading import Lock
+from time import time, monotonic
+from typing import List, Dict, Any, Callable
+from urllib.request import Request
+
+import yaml
+
+from jmanager.utils.http_pool import ConnectionPool, HTTP_CONNECTION_POOL
+
+
+class MirrorProbe:
+    def __init__(self, mirror: str, latency: float = None, throughput: float = None, error: str = None):
+        self._mirror = mirror
+        self._latency = latency
+        self._throughput = throughput
+        self._error = error
+
+    @property
+    def mirror(self) -> str:
+        return self._mirror
+
+    @property
+    def latency(self) -> float:
+        return self._latency
+
+    @property
+    def throughput(self) -> float:
+        return self._throughput
+
+    @property
+    def error(self) -> str:
+        return self._error
+
+    def get_estimated_time(self, reference_size: int) -> float:
+        if self._error is not None:
+            return float('inf')
+        return self._latency + reference_size / max(self._throughput, 1.0)
+
+
+class MirrorSelector:
+    """
+    Ranks the FreeBSD mirrors by how fast they would serve a distribution tarball.
+
+    Every mirror is asked for the first bytes of a file; the time to the first byte gives
+    its latency and the rest of the transfer its throughput. Mirrors failing the probe go
+    last. The ranking is kept for a while, in the ranking file when there is one, and a
+    mirror failing during a download is moved to the end of it.
+    """
+    RANKING_TTL = 3600
+    PROBE_SIZE = 256 * 1024
+    PROBE_TIMEOUT = 10
+    REFERENCE_SIZE = 16 * 1024 ** 2
+
+    def __init__(self, mirrors: List[str], ranking_ttl: float = RANKING_TTL, ranking_file: PosixPath = None,
+                 clock: Callable[[], float] = time, connection_pool: ConnectionPool = HTTP_CONNECTION_POOL):
+        if not mirrors:
+            raise ValueError("At least one mirror is needed")
+        self._mirrors = [mirror.rstrip('/') for mirror in mirrors]
+        self._ranking_ttl = ranking_ttl
+        self._ranking_file = ranking_file
+        self._clock = clock
+        self._connection_pool = connection_pool
+        self._lock = Lock()
+        self._ranking: Dict[str, Any] = {}
+
+    @property
+    def mirrors(self) -> List[str]:
+        return self._mirrors
+
+    def get_ranked_mirrors(self, probe_path: str) -> List[str]:
+        """
+        :param probe_path: Path, relative to the mirror root, of the file used to probe the mirrors.
+        :return: The mirrors sorted from the fastest to the slowest.
+        """
+        with self._lock:
+            ranking = self._ranking or self.read_ranking_file()
+            is_valid = ranking.get('mirrors') is not None and set(ranking['mirrors']) == set(self._mirrors)
+            if not is_valid or self._clock() - ranking.get('ranked_at', 0) > self._ranking_ttl:
+                probes = self.probe_mirrors(probe_path)
+                ranked_probes = sorted(probes, key=lambda probe: probe.get_estimated_time(self.REFERENCE_SIZE))
+                ranking = {'ranked_at': self._clock(), 'mirrors': [probe.mirror for probe in ranked_probes]}
+                self.write_ranking_file(ranking)
+            self._ranking = ranking
+            return list(ranking['mirrors'])
+
+    def demote(self, mirror: str):
+        with self._lock:
+            if mirror in self._ranking.get('mirrors', []):
+                self._ranking['mirrors'].remove(mirror)
+                self._ranking['mirrors'].append(mirror)
+                self.write_ranking_file(self._ranking)
+
+    def get_mirror(self, url: str) -> str:
+        for mirror in self._mirrors:
+            if url.startswith(f"{mirror}/"):
+                return mirror
+        return None
+
+    def probe_mirrors(self, probe_path: str) -> List[MirrorProbe]:
+        with ThreadPoolExecutor(max_workers=len(self._mirrors), thread_name_prefix="jmanager_probe") as executor:
+            return list(executor.map(lambda mirror: self.probe_mirror(mirror, probe_path), self._mirrors))
+
+    def probe_mirror(self, mirror: str, probe_path: str) -> MirrorProbe:
+        request = Request(f"{mirror}/{probe_path.lstrip('/')}", headers={'Range': f"bytes=0-{self.PROBE_SIZE - 1}"})
+        start_time = monotonic()
+        try:
+            with self._connection_pool.urlopen(request, timeout=self.PROBE_TIMEOUT) as response:
+                latency = monotonic() - start_time
+                received_bytes = len(response.read(self.PROBE_SIZE))
+            transfer_time = monotonic() - start_time - latency
+        except (OSError, ValueError, HTTPException) as error:
+            return MirrorProbe(mirror=mirror, error=str(error))
+        return MirrorProbe(mirror=mirror, latency=latency, throughput=received_bytes / max(transfer_time, 1e-6))
+
+    def read_ranking_file(self) -> Dict[str, Any]:
+        if self._ranking_file is None or not self._ranking_file.is_file():
+            return {}
+        with open(self._ranking_file.as_posix(), 'r') as ranking_file:
+            return yaml.load(stream=ranking_file, Loader=yaml.Loader) or {}
+
+    def write_ranking_file(self, ranking: Dict[str, Any]):
+        if self._ranking_file is None:
+            return
+        temp_ranking_file = self._ranking_file.with_name(f".{self._ranking_file.name}.{os.getpid()}")
+        with open(temp_ranking_file.as_posix(), 'w') as ranking_file:
+            yaml.dump(ranking, stream=ranking_file)
+        os.replace(temp_ranking_file.as_posix(), self._ranking_file.as_posix())
@@ -0,0 +1,152 @@
+import mmap
+import os
+import shutil
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from threading import Lock
+from typing import Callable, List, Dict, Set
+
+from jmanager.models.extraction_profile import ExtractionProfile
+from jmanager.utils.tarball_codec import TarballCodec, open_tarball_file
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class ParallelTarExtractor:
+    """
+    Extracts a tarball spreading the regular files among several worker threads.
+
+    The tarball is decompressed once into an uncompressed archive that is mapped in
+    memory, and its member table is indexed up front. The directory skeleton is created
+    first, then the regular files are written concurrently straight from the mapping,
+    and finally links, special files and directory attributes are applied in archive
+    order, so ownership, modes and hardlinks end up as with TarFile.extract.
+    """
+    WORKERS = min(8, os.cpu_count() or 1)
+
+    def __init__(self, workers: int = WORKERS, decompression_workers: int = 1):
+        if workers < 1:
+            raise ValueError("The number of extraction workers must be at least 1")
+        self._workers = workers
+        self._decompression_workers = decompression_workers
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    def extract_tarball(self, jail_path: PosixPath, path_to_tarball: PosixPath,
+                        callback: Callable[[str, int, int], None] = None, profile: ExtractionProfile = None):
+        """
+        Uncompressed tarballs are mapped as they are, without being copied first.
+        """
+        if TarballCodec.from_path(path_to_tarball) == TarballCodec.TAR:
+            self.extract_archive(jail_path=jail_path, path_to_archive=path_to_tarball,
+                                 msg=f"Extracting {path_to_tarball.name}", callback=callback, profile=profile)
+            return
+
+        with TemporaryDirectory(prefix="jmanager_", suffix="_tar", dir=jail_path.parent.as_posix()) as temp_dir:
+            path_to_archive = PosixPath(temp_dir).joinpath(f"{path_to_tarball.stem}.tar")
+            with open_tarball_file(path_to_tarball, workers=self._decompression_workers) as decompressed_file, \
+                    open(path_to_archive.as_posix(), 'wb') as archive_file:
+                shutil.copyfileobj(decompressed_file, archive_file, COPY_BUFFER_SIZE)
+
+            self.extract_archive(jail_path=jail_path, path_to_archive=path_to_archive,
+                                 msg=f"Extracting {path_to_tarball.name}", callback=callback, profile=profile)
+
+    def extract_archive(self, jail_path: PosixPath, path_to_archive: PosixPath, msg: str,
+                        callback: Callable[[str, int, int], None] = None, profile: ExtractionProfile = None):
+        """
+        :param profile: Selects the members to be extracted, if given.
+        """
+        with tarfile.open(path_to_archive.as_posix(), mode='r:') as tar_file:
+            members = tar_file.getmembers()
+            if profile is not None:
+                members = list(profile.filter_members(members))
+            members = self.index_members(members)
+            parallel_members = self.get_parallel_members(members)
+            total_bytes = sum([member.size for member in parallel_members])
+            progress = {'lock': Lock(), 'written_bytes': 0}
+
+            folders = {member.name for member in members if member.isdir()}
+            folders.update({os.path.dirname(member.name) for member in parallel_members})
+            for folder in sorted(folders):
+                os.makedirs(jail_path.joinpath(folder).as_posix(), exist_ok=True)
+
+            if callback is not None:
+                callback(msg, 0, total_bytes)
+            if parallel_members:
+                with open(path_to_archive.as_posix(), 'rb') as archive_file, \
+                        mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ) as archive_map, \
+                        ThreadPoolExecutor(max_workers=self._workers,
+                                           thread_name_prefix="jmanager_extract") as executor:
+                    futures = [executor.submit(self.write_regular_file, tar_file=tar_file, archive_map=archive_map,
+                                               member=member, jail_path=jail_path, progress=progress,
+                                               msg=msg, total_bytes=total_bytes, callback=callback)
+                               for member in parallel_members]
+                    for future in futures:
+                        future.result()
+
+            parallel_member_names = {member.name for member in parallel_members}
+            for member in members:
+                if not member.isdir() and member.name not in parallel_member_names:
+                    tar_file.extract(member, path=jail_path.as_posix())
+
+            for member in sorted([member for member in members if member.isdir()],
+                                 key=lambda directory: directory.name, reverse=True):
+                directory_path = jail_path.joinpath(member.name).as_posix()
+                tar_file.chown(member, directory_path, numeric_owner=False)
+                tar_file.utime(member, directory_path)
+                tar_file.chmod(member, directory_path)
+
+            if callback is not None:
+                callback(msg, total_bytes, total_bytes)
+
+    @staticmethod
+    def index_members(members: List[tarfile.TarInfo]) -> List[tarfile.TarInfo]:
+        """
+        Keeps only the last entry of every path, which is the one a sequential extraction leaves behind.
+        """
+        last_members: Dict[str, tarfile.TarInfo] = {}
+        for member in members:
+            last_members[member.name.rstrip('/')] = member
+        return [member for member in members if last_members[member.name.rstrip('/')] is member]
+
+    @staticmethod
+    def get_parallel_members(members: List[tarfile.TarInfo]) -> List[tarfile.TarInfo]:
+        """
+        Regular files that can be written in any order: not sparse and not below a path
+        that the archive turns into a symbolic link.
+        """
+        symlinks: Set[str] = {member.name.rstrip('/') for member in members if member.issym()}
+
+        def _is_below_symlink(name: str) -> bool:
+            parent = os.path.dirname(name)
+            while parent:
+                if parent in symlinks:
+                    return True
+                parent = os.path.dirname(parent)
+            return False
+
+        return [member for member in members
+                if member.isreg() and member.sparse is None and not _is_below_symlink(member.name)]
+
+    @staticmethod
+    def write_regular_file(tar_file: tarfile.TarFile, archive_map: mmap.mmap, member: tarfile.TarInfo,
+                           jail_path: PosixPath, progress: Dict, msg: str, total_bytes: int,
+                           callback: Callable[[str, int, int], None] = None):
+        target_path = jail_path.joinpath(member.name).as_posix()
+        if os.path.islink(target_path):
+            os.unlink(target_path)
+        with open(target_path, 'wb') as target_file:
+            target_file.write(memoryview(archive_map)[member.offset_data:member.offset_data + member.size])
+
+        tar_file.chown(member, target_path, numeric_owner=False)
+        tar_file.chmod(member, target_path)
+        tar_file.utime(member, target_path)
+
+        with progress['lock']:
+            progress['written_bytes'] += member.size
+            if callback is not None:
+                callback(msg, progress['written_bytes'], total_bytes)
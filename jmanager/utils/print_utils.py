@@ -1,6 +1,77 @@
+from collections import deque
+from time import monotonic
+from typing import Callable, Deque, Tuple
+
+
 def get_progress_text(msg: str, iteration: int, total: int) -> str:
     percent = "{0:.1f}".format(100 * (iteration / float(total)))
     filled_length = int(50 * iteration // total)
     bar = '=' * filled_length + ' ' * (50 - filled_length)
 
-    return "%s |%s| %s%%" % (msg, bar, percent)
\ No newline at end of file
+    return "%s |%s| %s%%" % (msg, bar, percent)
+
+
+def get_human_readable_size(size: int) -> str:
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+class ThroughputMeter:
+    """
+    Transfer rate over a sliding time window, so it follows the recent speed instead
+    of the speed of a single read or the average since the start.
+    """
+    WINDOW = 5.0
+
+    def __init__(self, window: float = WINDOW, clock: Callable[[], float] = monotonic):
+        self._window = window
+        self._clock = clock
+        self._samples: Deque[Tuple[float, int]] = deque()
+
+    def update(self, total_bytes: int):
+        now = self._clock()
+        self._samples.append((now, total_bytes))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self._window:
+            self._samples.popleft()
+
+    @property
+    def rate(self) -> float:
+        if len(self._samples) < 2:
+            return 0.0
+        (first_time, first_bytes), (last_time, last_bytes) = self._samples[0], self._samples[-1]
+        if last_time <= first_time:
+            return 0.0
+        return (last_bytes - first_bytes) / (last_time - first_time)
+
+
+class ProgressReporter:
+    """
+    Calls a progress callback at most once per interval, and once more when the transfer
+    completes, however many blocks the transfer is made of.
+    """
+    INTERVAL = 0.1
+
+    def __init__(self, callback: Callable[[str, int, int, float], None], msg: str, total: int,
+                 received_bytes: int = 0, interval: float = INTERVAL, clock: Callable[[], float] = monotonic):
+        self._callback = callback
+        self._msg = msg
+        self._total = total
+        self._interval = interval
+        self._clock = clock
+        self._last_call = None
+        self._throughput_meter = ThroughputMeter(clock=clock)
+        self._throughput_meter.update(received_bytes)
+
+    def update(self, received_bytes: int):
+        if self._callback is None:
+            return
+
+        now = self._clock()
+        if self._last_call is not None and now - self._last_call < self._interval and received_bytes < self._total:
+            return
+        self._last_call = now
+        self._throughput_meter.update(received_bytes)
+        self._callback(self._msg, received_bytes, self._total, self._throughput_meter.rate)
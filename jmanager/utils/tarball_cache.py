@@ -0,0 +1,363 @@
+import fcntl
+import os
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from contextlib import contextmanager
+from pathlib import PosixPath
+from threading import RLock
+from time import time
+from typing import Dict, List, Optional, Any, Iterator, Iterable
+
+import yaml
+
+from jmanager.models.distribution import Architecture, Component, Version
+from jmanager.utils.file_utils import link_or_copy_file
+from jmanager.utils.tarball_codec import TarballCodec, encode_tarball
+
+
+class CacheEntry:
+    def __init__(self, version: Version, architecture: Architecture, component: Component,
+                 checksum: str, size: int, last_access: float, etag: str = None, last_modified: str = None,
+                 fast_copy_codec: TarballCodec = None, fast_copy_size: int = 0):
+        self._version = version
+        self._architecture = architecture
+        self._component = component
+        self._checksum = checksum
+        self._size = size
+        self._etag = etag
+        self._last_modified = last_modified
+        self.last_access = last_access
+        self.fast_copy_codec = fast_copy_codec
+        self.fast_copy_size = fast_copy_size
+
+    @property
+    def version(self) -> Version:
+        return self._version
+
+    @property
+    def architecture(self) -> Architecture:
+        return self._architecture
+
+    @property
+    def component(self) -> Component:
+        return self._component
+
+    @property
+    def checksum(self) -> str:
+        return self._checksum
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self._etag
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self._last_modified
+
+    @property
+    def key(self) -> str:
+        return TarballCache.get_key(self._version, self._architecture, self._component)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': str(self._version),
+            'architecture': self._architecture.value,
+            'component': self._component.value,
+            'checksum': self._checksum,
+            'size': self._size,
+            'last_access': self.last_access,
+            'etag': self._etag,
+            'last_modified': self._last_modified,
+            'fast_copy_codec': None if self.fast_copy_codec is None else self.fast_copy_codec.value,
+            'fast_copy_size': self.fast_copy_size
+        }
+
+    @staticmethod
+    def from_dict(entry: Dict[str, Any]) -> 'CacheEntry':
+        fast_copy_codec = entry.get('fast_copy_codec')
+        return CacheEntry(version=Version.from_string(entry['version']),
+                          architecture=Architecture(entry['architecture']),
+                          component=Component(entry['component']),
+                          checksum=entry['checksum'],
+                          size=int(entry['size']),
+                          last_access=float(entry['last_access']),
+                          etag=entry.get('etag'),
+                          last_modified=entry.get('last_modified'),
+                          fast_copy_codec=None if fast_copy_codec is None else TarballCodec(fast_copy_codec),
+                          fast_copy_size=int(entry.get('fast_copy_size', 0)))
+
+
+class TarballCache:
+    """
+    On-disk cache of distribution tarballs.
+
+    Files are stored once under their SHA-256 digest and an index maps every
+    version/architecture/component to its digest. When the cache grows over
+    its size cap, the least recently used entries are evicted.
+
+    With a codec other than xz, every verified tarball also gets a fast copy: the same
+    tar archive re-encoded with that codec, stored next to the original and named after
+    the original digest, so it is trusted as much as the original. The fast copy is made
+    in the background once the tarball is added, or the first time it is looked up for an
+    older entry, so the build that downloads a tarball does not wait for it and extracts
+    the original. It counts towards the size cap.
+    """
+    INDEX_FILE_NAME = 'index.yaml'
+    LOCK_FILE_NAME = '.lock'
+    OBJECTS_FOLDER = 'objects'
+    DOWNLOADS_FOLDER = 'downloads'
+    DEFAULT_MAX_SIZE = 10 * 1024 ** 3
+
+    def __init__(self, cache_dir: PosixPath, max_size: int = DEFAULT_MAX_SIZE, codec: TarballCodec = None):
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._codec = None if codec == TarballCodec.XZ else codec
+        self._lock = RLock()
+        self._fast_copy_executor: Optional[ThreadPoolExecutor] = None
+        self._pending_fast_copies: Dict[str, Future] = {}
+
+        if cache_dir.exists() and not cache_dir.is_dir():
+            raise PermissionError("The tarball cache path exists and it is not a directory")
+        os.makedirs(cache_dir.joinpath(self.OBJECTS_FOLDER).as_posix(), exist_ok=True)
+        os.makedirs(cache_dir.joinpath(self.DOWNLOADS_FOLDER).as_posix(), exist_ok=True)
+
+    @property
+    def cache_dir(self) -> PosixPath:
+        return self._cache_dir
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @property
+    def codec(self) -> Optional[TarballCodec]:
+        return self._codec
+
+    @property
+    def size(self) -> int:
+        with self._locked_index() as index:
+            return self._get_index_size(index)
+
+    @staticmethod
+    def get_key(version: Version, architecture: Architecture, component: Component) -> str:
+        return f"{version}/{architecture.value}/{component.value}"
+
+    def get_object_path(self, checksum: str, codec: TarballCodec = None) -> PosixPath:
+        """
+        :param codec: Codec of the fast copy of the object, or None for the original.
+        """
+        object_name = checksum if codec is None else f"{checksum}.{codec.extension}"
+        return self._cache_dir.joinpath(self.OBJECTS_FOLDER, checksum[:2], object_name)
+
+    def get_download_path(self, version: Version, architecture: Architecture, component: Component) -> PosixPath:
+        """
+        Path where a component is downloaded before being added to the cache. Unlike a temporary
+        directory, it outlives the process, so interrupted downloads can be resumed later on.
+        """
+        return self._cache_dir.joinpath(self.DOWNLOADS_FOLDER, f"{version}_{architecture.value}_{component.value}")
+
+    def lookup(self, version: Version, architecture: Architecture, component: Component,
+               checksum: str = None, fast_copy: bool = False) -> Optional[PosixPath]:
+        """
+        :param fast_copy: Return the fast copy of the tarball instead of the original, if the cache
+        keeps them and it is ready. When it is missing, the original is returned and the fast copy is made
+        in the background. The encoding of the file is given by its extension.
+        """
+        key = self.get_key(version, architecture, component)
+        with self._locked_index(write=True) as index:
+            entry = index.get(key)
+            if entry is None:
+                return None
+
+            object_path = self.get_object_path(entry.checksum)
+            is_valid = checksum is None or entry.checksum == checksum
+            if not is_valid or not object_path.is_file() or object_path.stat().st_size != entry.size:
+                del index[key]
+                self._remove_unreferenced_objects(index, [entry])
+                return None
+
+            entry.last_access = time()
+            if not fast_copy or not self.keeps_fast_copy(entry):
+                return object_path
+            fast_copy_path = self.get_object_path(entry.checksum, codec=self._codec)
+            if entry.fast_copy_codec == self._codec and fast_copy_path.is_file():
+                return fast_copy_path
+        self.add_fast_copy_in_background(entry)
+        return object_path
+
+    def get_entry(self, version: Version, architecture: Architecture, component: Component) -> Optional[CacheEntry]:
+        with self._locked_index() as index:
+            return index.get(self.get_key(version, architecture, component))
+
+    def insert(self, version: Version, architecture: Architecture, component: Component,
+               path_to_file: PosixPath, checksum: str, etag: str = None, last_modified: str = None) -> PosixPath:
+        """
+        Adds a file to the cache, along with the validators the server sent for it, so
+        it can be revalidated later on with a conditional request.
+        """
+        object_path = self.get_object_path(checksum)
+        with self._locked_index(write=True) as index:
+            if not object_path.is_file():
+                os.makedirs(object_path.parent.as_posix(), exist_ok=True)
+                temp_object_path = object_path.with_name(f".{checksum}.{os.getpid()}")
+                link_or_copy_file(source=path_to_file, destination=temp_object_path)
+                os.replace(temp_object_path.as_posix(), object_path.as_posix())
+
+            entry = CacheEntry(version=version, architecture=architecture, component=component,
+                               checksum=checksum, size=object_path.stat().st_size, last_access=time(),
+                               etag=etag, last_modified=last_modified)
+            fast_copy_path = self.get_object_path(checksum, codec=self._codec)
+            if self.keeps_fast_copy(entry) and fast_copy_path.is_file():
+                entry.fast_copy_codec, entry.fast_copy_size = self._codec, fast_copy_path.stat().st_size
+            previous_entry = index.get(entry.key)
+            index[entry.key] = entry
+            if previous_entry is not None:
+                self._remove_unreferenced_objects(index, [previous_entry])
+            self._evict(index, max_size=self._max_size, keep=[entry.key])
+
+        if self.keeps_fast_copy(entry) and entry.fast_copy_codec != self._codec:
+            self.add_fast_copy_in_background(entry)
+        return object_path
+
+    def keeps_fast_copy(self, entry: CacheEntry) -> bool:
+        return self._codec is not None and entry.component != Component.MANIFEST
+
+    def add_fast_copy_in_background(self, entry: CacheEntry) -> Future:
+        """
+        Makes the fast copy of a cached tarball on a background thread, unless it is being made already.
+        The process waits for the pending fast copies before exiting, see also wait_for_fast_copies.
+        """
+        with self._lock:
+            future = self._pending_fast_copies.get(entry.checksum)
+            if future is not None and not future.done():
+                return future
+            if self._fast_copy_executor is None:
+                self._fast_copy_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jmanager_fast_copy")
+            future = self._fast_copy_executor.submit(self.add_fast_copy, entry)
+            self._pending_fast_copies[entry.checksum] = future
+            return future
+
+    def wait_for_fast_copies(self):
+        """
+        Waits for the fast copies being made in the background, raising the error of any that failed.
+        """
+        with self._lock:
+            futures = list(self._pending_fast_copies.values())
+            self._pending_fast_copies = {}
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def add_fast_copy(self, entry: CacheEntry) -> Optional[PosixPath]:
+        """
+        Re-encodes a cached tarball with the codec of the cache. The index is not locked meanwhile.
+        :return: The path to the fast copy, or None if the tarball was removed from the cache meanwhile.
+        """
+        fast_copy_path = self.get_object_path(entry.checksum, codec=self._codec)
+        temp_fast_copy_path = fast_copy_path.with_name(f".{fast_copy_path.name}.{os.getpid()}")
+        try:
+            try:
+                encode_tarball(self.get_object_path(entry.checksum), temp_fast_copy_path, codec=self._codec)
+            except FileNotFoundError:
+                return None
+
+            with self._locked_index(write=True) as index:
+                entries = [cached_entry for cached_entry in index.values() if cached_entry.checksum == entry.checksum]
+                if not entries:
+                    return None
+                os.replace(temp_fast_copy_path.as_posix(), fast_copy_path.as_posix())
+                self._remove_fast_copies(entry.checksum, keep=self._codec)
+                for cached_entry in entries:
+                    cached_entry.fast_copy_codec = self._codec
+                    cached_entry.fast_copy_size = fast_copy_path.stat().st_size
+                self._evict(index, max_size=self._max_size, keep=[cached_entry.key for cached_entry in entries])
+            return fast_copy_path
+        finally:
+            if temp_fast_copy_path.exists():
+                temp_fast_copy_path.unlink()
+
+    def remove(self, version: Version, architecture: Architecture, component: Component):
+        key = self.get_key(version, architecture, component)
+        with self._locked_index(write=True) as index:
+            if key in index:
+                entry = index.pop(key)
+                self._remove_unreferenced_objects(index, [entry])
+
+    def list_entries(self) -> List[CacheEntry]:
+        with self._locked_index() as index:
+            return sorted(index.values(), key=lambda entry: entry.last_access, reverse=True)
+
+    def prune(self, max_size: int = None) -> List[CacheEntry]:
+        if max_size is None:
+            max_size = self._max_size
+        with self._locked_index(write=True) as index:
+            return self._evict(index, max_size=max_size)
+
+    def _evict(self, index: Dict[str, CacheEntry], max_size: int, keep: Iterable[str] = ()) -> List[CacheEntry]:
+        evicted_entries = []
+        candidates = sorted([entry for key, entry in index.items() if key not in keep],
+                            key=lambda entry: entry.last_access)
+        for entry in candidates:
+            if self._get_index_size(index) <= max_size:
+                break
+            del index[entry.key]
+            evicted_entries.append(entry)
+        self._remove_unreferenced_objects(index, evicted_entries)
+        return evicted_entries
+
+    def _remove_unreferenced_objects(self, index: Dict[str, CacheEntry], removed_entries: List[CacheEntry]):
+        referenced_checksums = {entry.checksum for entry in index.values()}
+        for entry in removed_entries:
+            if entry.checksum not in referenced_checksums:
+                object_path = self.get_object_path(entry.checksum)
+                if object_path.exists():
+                    object_path.unlink()
+                self._remove_fast_copies(entry.checksum)
+
+    def _remove_fast_copies(self, checksum: str, keep: TarballCodec = None):
+        for codec in TarballCodec:
+            fast_copy_path = self.get_object_path(checksum, codec=codec)
+            if codec != keep and fast_copy_path.exists():
+                fast_copy_path.unlink()
+
+    @staticmethod
+    def _get_index_size(index: Dict[str, CacheEntry]) -> int:
+        sizes = {entry.checksum: entry.size + entry.fast_copy_size for entry in index.values()}
+        return sum(sizes.values())
+
+    @contextmanager
+    def _locked_index(self, write: bool = False) -> Iterator[Dict[str, CacheEntry]]:
+        with self._lock:
+            with open(self._cache_dir.joinpath(self.LOCK_FILE_NAME).as_posix(), 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    index = self._read_index()
+                    yield index
+                    if write:
+                        self._write_index(index)
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_index(self) -> Dict[str, CacheEntry]:
+        index_path = self._cache_dir.joinpath(self.INDEX_FILE_NAME)
+        if not index_path.is_file():
+            return {}
+
+        with open(index_path.as_posix(), 'r') as index_file:
+            entries = yaml.load(stream=index_file, Loader=yaml.Loader) or []
+
+        index: Dict[str, CacheEntry] = {}
+        for entry_data in entries:
+            entry = CacheEntry.from_dict(entry_data)
+            index[entry.key] = entry
+        return index
+
+    def _write_index(self, index: Dict[str, CacheEntry]):
+        index_path = self._cache_dir.joinpath(self.INDEX_FILE_NAME)
+        temp_index_path = index_path.with_name(f".{self.INDEX_FILE_NAME}.{os.getpid()}")
+        with open(temp_index_path.as_posix(), 'w') as index_file:
+            yaml.dump([entry.to_dict() for entry in index.values()], stream=index_file)
+        os.replace(temp_index_path.as_posix(), index_path.as_posix())
@@ -0,0 +1,90 @@
+import gzip
+import lzma
+import shutil
+from enum import Enum
+from pathlib import PosixPath
+from typing import BinaryIO, Optional
+
+from jmanager.models.distribution import Component
+from jmanager.utils.xz import open_xz_file
+
+COPY_BUFFER_SIZE = 1024 * 1024
+GZIP_COMPRESSION_LEVEL = 6
+
+
+class TarballCodec(Enum):
+    """
+    Encodings a distribution tarball can be stored in. The mirrors only ship xz, which
+    compresses best but is the slowest to decompress; gzip decompresses several times
+    faster and an uncompressed tar does not need to be decompressed at all.
+    """
+    XZ = 'xz'
+    GZIP = 'gzip'
+    TAR = 'tar'
+
+    @property
+    def extension(self) -> str:
+        return {TarballCodec.XZ: 'txz', TarballCodec.GZIP: 'tgz', TarballCodec.TAR: 'tar'}[self]
+
+    @staticmethod
+    def from_path(path_to_tarball: PosixPath) -> 'TarballCodec':
+        """
+        Files without a known extension, such as the objects of the tarball cache, are xz.
+        """
+        for codec in TarballCodec:
+            if path_to_tarball.suffix == f".{codec.extension}":
+                return codec
+        return TarballCodec.XZ
+
+
+def get_tarball_path(path_to_tarballs: PosixPath, component: Component) -> Optional[PosixPath]:
+    """
+    :return: The tarball of the component in the folder, preferring the encodings that are
+    faster to decompress when there are several of them, or None if there is none.
+    """
+    for codec in [TarballCodec.TAR, TarballCodec.GZIP, TarballCodec.XZ]:
+        path_to_tarball = path_to_tarballs.joinpath(f"{component.value}.{codec.extension}")
+        if path_to_tarball.is_file():
+            return path_to_tarball
+    return None
+
+
+def open_tarball_file(path_to_tarball: PosixPath, workers: int = 1) -> BinaryIO:
+    """
+    Opens a tarball to read the tar archive in it, whatever its encoding.
+    :param workers: Number of threads decompressing multi-block xz tarballs.
+    """
+    codec = TarballCodec.from_path(path_to_tarball)
+    if codec == TarballCodec.GZIP:
+        return gzip.open(path_to_tarball.as_posix(), 'rb')
+    if codec == TarballCodec.TAR:
+        return open(path_to_tarball.as_posix(), 'rb')
+    return open_xz_file(path_to_tarball, workers=workers)
+
+
+def open_decompressed_stream(stream: BinaryIO, codec: TarballCodec) -> BinaryIO:
+    """
+    :return: The tar archive read from the stream, which is returned as it is when it is not
+    compressed. Closing the decompressed stream does not close the one given.
+    """
+    if codec == TarballCodec.GZIP:
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if codec == TarballCodec.TAR:
+        return stream
+    return lzma.open(stream, 'rb')
+
+
+def encode_tarball(path_to_tarball: PosixPath, destination: PosixPath, codec: TarballCodec, workers: int = 1):
+    """
+    Writes the tar archive of a tarball into the destination with another encoding.
+    """
+    with open_tarball_file(path_to_tarball, workers=workers) as tar_archive:
+        if codec == TarballCodec.GZIP:
+            encoded_file = gzip.GzipFile(destination.as_posix(), mode='wb',
+                                         compresslevel=GZIP_COMPRESSION_LEVEL, mtime=0)
+        elif codec == TarballCodec.TAR:
+            encoded_file = open(destination.as_posix(), 'wb')
+        else:
+            encoded_file = lzma.open(destination.as_posix(), 'wb')
+        with encoded_file:
+            shutil.copyfileobj(tar_archive, encoded_file, COPY_BUFFER_SIZE)
@@ -0,0 +1,214 @@
+import io
+import lzma
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import PosixPath
+from typing import List, NamedTuple, Deque, Tuple, BinaryIO
+
+HEADER_MAGIC = b'\xfd7zXZ\x00'
+FOOTER_MAGIC = b'YZ'
+STREAM_HEADER_SIZE = 12
+STREAM_FOOTER_SIZE = 12
+
+
+class XZFormatError(BaseException):
+    pass
+
+
+class XZBlock(NamedTuple):
+    offset: int
+    unpadded_size: int
+    uncompressed_size: int
+    stream_flags: bytes
+
+    @property
+    def size(self) -> int:
+        return round_up_to_four(self.unpadded_size)
+
+
+def round_up_to_four(size: int) -> int:
+    return (size + 3) & ~3
+
+
+def decode_multibyte_integer(buffer: bytes, position: int) -> Tuple[int, int]:
+    value = 0
+    for index in range(9):
+        if position + index >= len(buffer):
+            break
+        byte = buffer[position + index]
+        value |= (byte & 0x7f) << (7 * index)
+        if not byte & 0x80:
+            return value, position + index + 1
+    raise XZFormatError("Invalid variable length integer in the xz index")
+
+
+def encode_multibyte_integer(value: int) -> bytes:
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def read_xz_blocks(path_to_file: PosixPath) -> List[XZBlock]:
+    """
+    Reads the block table of an xz file from the indexes stored at the end of each of its streams.
+
+    :param path_to_file: The xz file, which may contain several concatenated streams.
+    :return: The blocks in file order, with their offsets and sizes.
+    """
+    blocks: List[XZBlock] = []
+    with open(path_to_file.as_posix(), 'rb') as xz_file:
+        end_of_stream = xz_file.seek(0, io.SEEK_END)
+        while end_of_stream > 0:
+            xz_file.seek(end_of_stream - 4)
+            if xz_file.read(4) == b'\x00\x00\x00\x00':
+                end_of_stream -= 4
+                continue
+            if end_of_stream < STREAM_HEADER_SIZE + STREAM_FOOTER_SIZE:
+                raise XZFormatError("Truncated xz stream")
+
+            xz_file.seek(end_of_stream - STREAM_FOOTER_SIZE)
+            footer = xz_file.read(STREAM_FOOTER_SIZE)
+            if footer[10:] != FOOTER_MAGIC or zlib.crc32(footer[4:10]) != struct.unpack('<I', footer[:4])[0]:
+                raise XZFormatError("Invalid xz stream footer")
+            index_size = (struct.unpack('<I', footer[4:8])[0] + 1) * 4
+            index_offset = end_of_stream - STREAM_FOOTER_SIZE - index_size
+            if index_offset < STREAM_HEADER_SIZE:
+                raise XZFormatError("Invalid xz index size")
+
+            xz_file.seek(index_offset)
+            index = xz_file.read(index_size)
+            if index[0] != 0 or zlib.crc32(index[:-4]) != struct.unpack('<I', index[-4:])[0]:
+                raise XZFormatError("Invalid xz index")
+
+            number_of_records, position = decode_multibyte_integer(index, 1)
+            records = []
+            for _ in range(number_of_records):
+                unpadded_size, position = decode_multibyte_integer(index, position)
+                uncompressed_size, position = decode_multibyte_integer(index, position)
+                records.append((unpadded_size, uncompressed_size))
+
+            stream_offset = index_offset - sum([round_up_to_four(record[0]) for record in records]) - STREAM_HEADER_SIZE
+            if stream_offset < 0:
+                raise XZFormatError("Invalid xz block sizes")
+            xz_file.seek(stream_offset)
+            header = xz_file.read(STREAM_HEADER_SIZE)
+            if header[:6] != HEADER_MAGIC or header[6:8] != footer[8:10]:
+                raise XZFormatError("Invalid xz stream header")
+
+            stream_blocks = []
+            block_offset = stream_offset + STREAM_HEADER_SIZE
+            for unpadded_size, uncompressed_size in records:
+                stream_blocks.append(XZBlock(offset=block_offset, unpadded_size=unpadded_size,
+                                             uncompressed_size=uncompressed_size, stream_flags=header[6:8]))
+                block_offset += round_up_to_four(unpadded_size)
+            blocks = stream_blocks + blocks
+            end_of_stream = stream_offset
+    return blocks
+
+
+def is_multi_block_xz(path_to_file: PosixPath) -> bool:
+    try:
+        return len(read_xz_blocks(path_to_file)) > 1
+    except (XZFormatError, OSError):
+        return False
+
+
+def decompress_xz_block(block: XZBlock, compressed_data: bytes) -> bytes:
+    """
+    Decompresses a single block by wrapping it into a stream of its own, so it does not depend
+    on the rest of the file and every block can be decompressed independently.
+    """
+    header = HEADER_MAGIC + block.stream_flags + struct.pack('<I', zlib.crc32(block.stream_flags))
+    index = b'\x00' + encode_multibyte_integer(1) + encode_multibyte_integer(block.unpadded_size) + \
+        encode_multibyte_integer(block.uncompressed_size)
+    index += b'\x00' * (round_up_to_four(len(index)) - len(index))
+    index += struct.pack('<I', zlib.crc32(index))
+    footer_fields = struct.pack('<I', len(index) // 4 - 1) + block.stream_flags
+    footer = struct.pack('<I', zlib.crc32(footer_fields)) + footer_fields + FOOTER_MAGIC
+
+    return lzma.decompress(header + compressed_data + index + footer, format=lzma.FORMAT_XZ)
+
+
+class XZBlockReader(io.RawIOBase):
+    """
+    Decompresses a multi-block xz file using several threads, liblzma releases the GIL
+    while decompressing. Blocks are returned in order and only a few of them are kept
+    in memory at any time. The position and the size refer to the compressed file.
+    """
+    BLOCKS_PER_WORKER = 2
+
+    def __init__(self, path_to_file: PosixPath, workers: int):
+        super().__init__()
+        self._blocks = read_xz_blocks(path_to_file)
+        self._xz_file = open(path_to_file.as_posix(), 'rb')
+        self._size = os.fstat(self._xz_file.fileno()).st_size
+        self._position = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jmanager_xz")
+        self._max_pending_blocks = workers * self.BLOCKS_PER_WORKER
+        self._pending_blocks: Deque[Tuple[XZBlock, Future]] = deque()
+        self._next_block = 0
+        self._buffer = memoryview(b'')
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def position(self) -> int:
+        return self._position
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not len(self._buffer):
+            self._schedule_blocks()
+            if not self._pending_blocks:
+                self._position = self._size
+                return 0
+            block, future = self._pending_blocks.popleft()
+            self._buffer = memoryview(future.result())
+            self._position = block.offset + block.size
+
+        read_bytes = min(len(buffer), len(self._buffer))
+        buffer[:read_bytes] = self._buffer[:read_bytes]
+        self._buffer = self._buffer[read_bytes:]
+        return read_bytes
+
+    def _schedule_blocks(self):
+        while len(self._pending_blocks) < self._max_pending_blocks and self._next_block < len(self._blocks):
+            block = self._blocks[self._next_block]
+            self._pending_blocks.append((block, self._executor.submit(self._decompress_block, block)))
+            self._next_block += 1
+
+    def _decompress_block(self, block: XZBlock) -> bytes:
+        compressed_data = os.pread(self._xz_file.fileno(), block.size, block.offset)
+        if len(compressed_data) != block.size:
+            raise XZFormatError("Truncated xz block")
+        return decompress_xz_block(block, compressed_data)
+
+    def close(self):
+        if not self.closed:
+            for _, future in self._pending_blocks:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._pending_blocks.clear()
+            self._buffer = memoryview(b'')
+            self._xz_file.close()
+        super().close()
+
+
+def open_xz_file(path_to_file: PosixPath, workers: int = 1) -> BinaryIO:
+    """
+    Opens an xz file for reading, decompressing its blocks in parallel when there is more than
+    one worker and more than one block. Otherwise, the file is decompressed by lzma on one core.
+    """
+    if workers > 1 and is_multi_block_xz(path_to_file):
+        return io.BufferedReader(XZBlockReader(path_to_file, workers=workers))
+    return lzma.open(path_to_file.as_posix(), 'rb')
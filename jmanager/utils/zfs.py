@@ -1,7 +1,8 @@
-import subprocess
 from enum import Enum
 from typing import List, Dict
 
+from jmanager.utils.command_runner import CommandError, COMMAND_RUNNER, split_command
+
 
 class ZFSError(BaseException):
     pass
@@ -21,24 +22,28 @@ class ZFSProperty(Enum):
     AVAIL = "AVAIL"
     REFER = "REFER"
     MOUNTPOINT = "MOUNTPOINT"
+    TYPE = "TYPE"
 
 
 class ZFS:
     ZFS_CLI = "zfs"
+    COMMAND_RUNNER = COMMAND_RUNNER
 
-    def zfs_cmd(self, cmd: str, arguments: List[str], options: Dict[str, str], data_set: str):
+    def zfs_cmd(self, cmd: str, arguments: List[str], options: Dict[str, str], data_set: str,
+                operands: List[str] = ()) -> str:
+        """
+        :param operands: Operands given before the data set, e.g. the snapshot a clone is created from.
+        :return: The standard output of the command.
+        """
+        zfs_arguments = [*split_command(self.ZFS_CLI), cmd, *arguments]
         for option, value in options.items():
-            arguments.append('-o')
-            arguments.append(f"{option}={value}")
+            zfs_arguments.extend(['-o', f"{option}={value}"])
+        zfs_arguments.extend([operand for operand in [*operands, data_set] if operand])
         try:
-            out = subprocess.run(' '.join([self.ZFS_CLI, cmd, *arguments, data_set]), shell=True, check=True,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.STDOUT, universal_newlines=True)
-        except subprocess.CalledProcessError as error:
+            return self.COMMAND_RUNNER.run(zfs_arguments).stdout
+        except CommandError as error:
             raise ZFSError(error) from error
 
-        return out.stdout
-
     def zfs_create(self, data_set: str, options: Dict[str, str]):
         self.zfs_cmd(cmd='create', arguments=['-p'], options=options, data_set=data_set)
 
@@ -54,6 +59,9 @@ class ZFS:
             options = {}
         self.zfs_cmd(cmd="snapshot", arguments=zfs_arguments, options=options, data_set=f"{data_set}@{snapshot_name}")
 
+    def zfs_rollback(self, data_set: str, snapshot_name: str):
+        self.zfs_cmd(cmd='rollback', arguments=[], options={}, data_set=f"{data_set}@{snapshot_name}")
+
     def zfs_list(self, data_set: str = "", depth: int = 0, properties: List[ZFSProperty] = (),
                  types: List[ZFSType] = (), arguments: List[str] = ()) -> List[Dict[ZFSProperty, str]]:
         """
@@ -96,7 +104,7 @@ class ZFS:
         return zfs_data_sets
 
     def zfs_clone(self, snapshot: str, data_set: str, options: Dict[str, str]):
-        self.zfs_cmd(cmd='clone', data_set=f"{snapshot} {data_set}", options=options, arguments=['-p'])
+        self.zfs_cmd(cmd='clone', arguments=['-p'], options=options, data_set=data_set, operands=[snapshot])
 
     def zfs_get(self, data_set: str, depth: int = 0,
                 properties: List[str] = ()) -> Dict[str, Dict[str, str]]:
@@ -0,0 +1,111 @@
+from typing import Dict, List, Optional
+
+from jmanager.utils.zfs import ZFS, ZFSProperty, ZFSType
+
+
+class ZFSStateCache:
+    """
+    In-memory view of the data sets and snapshots below a root data set.
+
+    The whole tree is loaded with a single 'zfs list' the first time it is queried, so existence
+    checks and listings do not run a command each. The callers performing a change report it
+    through the add and remove methods, which patch the view instead of loading it again.
+    Changes made outside of them, e.g. by another process, are only seen after refresh.
+    """
+
+    def __init__(self, zfs: ZFS, root_data_set: str):
+        self._zfs = zfs
+        self._root_data_set = root_data_set
+        self._data_sets: Optional[Dict[str, List[str]]] = None
+
+    @property
+    def root_data_set(self) -> str:
+        return self._root_data_set
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._data_sets is not None
+
+    def refresh(self):
+        """
+        Loads the tree again. The snapshots of every data set are kept in creation order, which is
+        taken from the transaction group they were created in: the creation property only has a
+        resolution of one second, and the snapshots of a base jail are taken back to back.
+        """
+        items = self._zfs.zfs_list(data_set=self._root_data_set, depth=-1,
+                                   properties=[ZFSProperty.NAME, ZFSProperty.TYPE],
+                                   types=[ZFSType.ALL],
+                                   arguments=['-o', 'name,type', '-s', 'createtxg'])
+        data_sets: Dict[str, List[str]] = {}
+        for item in items:
+            if item[ZFSProperty.TYPE] not in (ZFSType.SNAPSHOT.value, ZFSType.BOOKMARK.value):
+                data_sets.setdefault(item[ZFSProperty.NAME], [])
+        for item in items:
+            if item[ZFSProperty.TYPE] == ZFSType.SNAPSHOT.value:
+                data_set, snapshot_name = item[ZFSProperty.NAME].split('@', 1)
+                data_sets.setdefault(data_set, []).append(snapshot_name)
+        self._data_sets = data_sets
+
+    def invalidate(self):
+        """
+        Drops the view, so it is loaded again when it is next queried.
+        """
+        self._data_sets = None
+
+    def _get_data_sets(self) -> Dict[str, List[str]]:
+        if self._data_sets is None:
+            self.refresh()
+        return self._data_sets
+
+    def data_set_exists(self, data_set: str) -> bool:
+        return data_set in self._get_data_sets()
+
+    def snapshot_exists(self, data_set: str, snapshot_name: str) -> bool:
+        return snapshot_name in self._get_data_sets().get(data_set, [])
+
+    def list_snapshots(self, data_set: str) -> List[str]:
+        """
+        :return: The names of the snapshots of the data set, from the oldest to the newest.
+        """
+        return list(self._get_data_sets().get(data_set, []))
+
+    def list_all_snapshots(self) -> List[str]:
+        """
+        :return: The full names (data_set@snapshot) of all the snapshots in the tree.
+        """
+        return [f"{data_set}@{snapshot_name}" for data_set, snapshot_names in self._get_data_sets().items()
+                for snapshot_name in snapshot_names]
+
+    def add_data_set(self, data_set: str):
+        """
+        Records a created data set, along with the parents 'zfs create -p' may have created.
+        """
+        if self._data_sets is None:
+            return
+        while data_set.startswith(f"{self._root_data_set}/") and data_set not in self._data_sets:
+            self._data_sets[data_set] = []
+            data_set = data_set.rpartition('/')[0]
+
+    def add_snapshot(self, data_set: str, snapshot_name: str):
+        if self._data_sets is None:
+            return
+        snapshot_names = self._data_sets.setdefault(data_set, [])
+        if snapshot_name not in snapshot_names:
+            snapshot_names.append(snapshot_name)
+
+    def remove_data_set(self, data_set: str):
+        """
+        Forgets a destroyed data set, its snapshots and its children.
+        """
+        if self._data_sets is None:
+            return
+        for name in list(self._data_sets.keys()):
+            if name == data_set or name.startswith(f"{data_set}/"):
+                del self._data_sets[name]
+
+    def remove_snapshot(self, data_set: str, snapshot_name: str):
+        if self._data_sets is None:
+            return
+        snapshot_names = self._data_sets.get(data_set, [])
+        if snapshot_name in snapshot_names:
+            snapshot_names.remove(snapshot_name)
@@ -76,6 +76,9 @@ while getopts "rd:Hpo:t:s:S:" "args" ; do
 		t)
 			check_value "^(${ZFS_TYPES}),?(${ZFS_TYPES})*$" || return 1
 			types=$(echo "${OPTARG}" | sed 's/,/|/g')
+			if echo "${OPTARG}" | grep -q 'all' ; then
+				types=".*"
+			fi
 			;;
 		s|S)
 			check_value "^[a-zA-Z]+$" || return 1
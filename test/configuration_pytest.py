@@ -2,7 +2,8 @@ from pathlib import PosixPath
 
 import pytest
 
-from jmanager.utils.configuration import read_configuration_file
+from jmanager.models.extraction_profile import ExtractionProfile
+from jmanager.utils.configuration import read_configuration_file, parse_size, parse_extraction_profiles
 from test.jmanagerfile_pytest import SAMPLE_JMANAGER_FILE, JAIL_CONFIGURATION_EXAMPLE
 
 
@@ -19,3 +20,17 @@ class TestConfigurationFile:
     def test_read_missing_configuration_file(self):
         with pytest.raises(FileNotFoundError):
             read_configuration_file(PosixPath('test/resources/missing_file'))
+
+    @pytest.mark.parametrize('size,expected_size', [(1024, 1024), ('2048', 2048), ('1K', 1024),
+                                                    ('1.5M', 1536 * 1024), ('10g', 10 * 1024 ** 3)])
+    def test_parse_size(self, size, expected_size):
+        assert parse_size(size) == expected_size
+
+    def test_parse_extraction_profiles(self):
+        configuration = read_configuration_file(PosixPath('examples/jmanager.conf'))
+        extraction_profiles = parse_extraction_profiles(configuration)
+
+        assert list(extraction_profiles.keys()) == ['minimal']
+        assert 'usr/share/doc' in extraction_profiles['minimal'].exclude
+        assert parse_extraction_profiles({}) == {}
+        assert parse_extraction_profiles({'extraction_profiles': {'all': None}}) == {'all': ExtractionProfile('all')}
@@ -0,0 +1,57 @@
+import io
+
+from jmanager.console_utils import ProgressDisplay, CLEAR_LINE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestProgressDisplay:
+    def test_disabled_when_not_a_terminal(self):
+        stream = io.StringIO()
+        progress_display = ProgressDisplay(stream=stream)
+
+        progress_display.update("base.txz", 1, 2)
+        progress_display.update("base.txz", 2, 2)
+        assert not progress_display.enabled
+        assert stream.getvalue() == ''
+
+    def test_redraws_are_throttled(self):
+        stream = io.StringIO()
+        clock = FakeClock()
+        progress_display = ProgressDisplay(stream=stream, frame_rate=10, enabled=True, clock=clock)
+
+        for iteration in range(100):
+            progress_display.update("base.txz", iteration, 100)
+        assert stream.getvalue().count('\n') == 1
+
+        clock.now = 0.1
+        progress_display.update("base.txz", 50, 100)
+        assert stream.getvalue().count('\n') == 2
+
+        progress_display.update("base.txz", 100, 100)
+        assert stream.getvalue().endswith(f"base.txz |{'=' * 50}| 100.0%{CLEAR_LINE}\n")
+
+    def test_concurrent_bars(self):
+        stream = io.StringIO()
+        clock = FakeClock()
+        progress_display = ProgressDisplay(stream=stream, enabled=True, clock=clock)
+
+        progress_display.update("base.txz", 1, 4, speed=1024.0)
+        clock.now = 1.0
+        output_length = len(stream.getvalue())
+        progress_display.update("src.txz", 1, 4, speed=2048.0)
+        frame = stream.getvalue()[output_length:]
+        assert frame.startswith('\x1b[1F')
+        assert "1.0 KiB/s" in frame and "2.0 KiB/s" in frame
+
+        output_length = len(stream.getvalue())
+        progress_display.update("base.txz", 4, 4, speed=1024.0)
+        lines = stream.getvalue()[output_length:].split('\n')
+        assert lines[0].startswith("\x1b[2Fbase.txz |") and "100.0%" in lines[0]
+        assert lines[1].startswith("src.txz |")
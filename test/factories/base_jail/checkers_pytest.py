@@ -10,6 +10,8 @@ class TestBaseJailFactoryCheckers:
 
         create_dummy_base_jail()
         try:
+            assert not base_jail_factory.base_jail_exists(TEST_DISTRIBUTION)
+            base_jail_factory.data_set_factory.refresh()
             assert base_jail_factory.base_jail_exists(TEST_DISTRIBUTION)
         finally:
             destroy_dummy_base_jail()
@@ -26,6 +28,7 @@ class TestBaseJailFactoryCheckers:
             destroy_dummy_base_jail()
 
         create_dummy_base_jail(distribution=distribution)
+        base_jail_factory.data_set_factory.refresh()
         try:
             jail_exists = base_jail_factory.base_jail_exists(distribution)
             assert jail_exists
@@ -1,10 +1,15 @@
+import shutil
+from contextlib import contextmanager
 from pathlib import PosixPath
 from tempfile import TemporaryDirectory
 
 import pytest
 
+from jmanager.factories.base_jail_factory import BaseJailFactory
 from jmanager.models.distribution import Distribution, Component
+from jmanager.models.extraction_profile import ExtractionProfile
 from jmanager.models.jail import JailError
+from jmanager.utils.file_utils import TarballStream
 from test.globals import get_mocking_base_jail_factory, TMP_PATH, TEST_DISTRIBUTION, create_dummy_tarball_in_folder, \
     destroy_dummy_base_jail
 
@@ -97,3 +102,246 @@ class TestBaseJailFactoryCreate:
                                                    callback=_callback)
             finally:
                 destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_create_base_jail_while_fetching(self):
+        distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                    architecture=TEST_DISTRIBUTION.architecture,
+                                    components=[Component.LIB32, Component.SRC])
+        with TemporaryDirectory() as tarballs_dir, TemporaryDirectory() as temp_dir:
+            create_dummy_tarball_in_folder(PosixPath(tarballs_dir))
+            waited_components = []
+
+            def _wait_for_tarball(component: Component):
+                waited_components.append(component)
+                shutil.copy(PosixPath(tarballs_dir).joinpath(f"{component.value}.txz").as_posix(), temp_dir)
+
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            try:
+                base_jail_factory.create_base_jail(distribution=distribution, path_to_tarballs=PosixPath(temp_dir),
+                                                   wait_for_tarball=_wait_for_tarball)
+                assert waited_components == distribution.components
+                assert base_jail_factory.base_jail_exists(distribution=TEST_DISTRIBUTION)
+                assert base_jail_factory.base_jail_exists(distribution=Distribution(
+                    version=TEST_DISTRIBUTION.version, architecture=TEST_DISTRIBUTION.architecture,
+                    components=[Component.LIB32]))
+                assert base_jail_factory.base_jail_exists(distribution=distribution)
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_create_base_jail_from_streams(self):
+        distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                    architecture=TEST_DISTRIBUTION.architecture,
+                                    components=[Component.LIB32])
+
+        with TemporaryDirectory() as temp_dir:
+            @contextmanager
+            def _open_tarball(component: Component):
+                path_to_tarball = PosixPath(temp_dir).joinpath(f"{component.value}.txz")
+                with TarballStream(raw_stream=open(path_to_tarball.as_posix(), 'rb'),
+                                   size=path_to_tarball.stat().st_size) as tarball_stream:
+                    yield tarball_stream
+
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            try:
+                base_jail_factory.create_base_jail_from_streams(distribution=distribution,
+                                                                open_tarball=_open_tarball)
+                assert base_jail_factory.base_jail_exists(distribution=distribution)
+                assert base_jail_factory.base_jail_exists(distribution=TEST_DISTRIBUTION)
+                jail_path = base_jail_factory.get_jail_mountpoint(base_jail_factory.get_data_set_name(distribution))
+                assert jail_path.joinpath('jmanager', 'models', 'distribution.py').is_file()
+                assert jail_path.joinpath('examples', 'jmanager.conf').is_file()
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_create_base_jail_reusing_latest_snapshot(self):
+        lib32_distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                          architecture=TEST_DISTRIBUTION.architecture,
+                                          components=[Component.LIB32])
+        distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                    architecture=TEST_DISTRIBUTION.architecture,
+                                    components=[Component.LIB32, Component.SRC])
+        with TemporaryDirectory() as temp_dir, TemporaryDirectory() as src_temp_dir:
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            shutil.copy(PosixPath(temp_dir).joinpath('src.txz').as_posix(), src_temp_dir)
+            try:
+                base_jail_factory.create_base_jail(distribution=lib32_distribution,
+                                                   path_to_tarballs=PosixPath(temp_dir))
+                assert base_jail_factory.get_installed_components(distribution) == [Component.BASE, Component.LIB32]
+                assert base_jail_factory.get_missing_components(distribution) == [Component.SRC]
+
+                base_jail_factory.create_base_jail(distribution=distribution,
+                                                   path_to_tarballs=PosixPath(src_temp_dir))
+                assert base_jail_factory.base_jail_exists(distribution=distribution)
+                assert base_jail_factory.base_jail_exists(distribution=lib32_distribution)
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_missing_components_without_reusable_snapshot(self):
+        lib32_distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                          architecture=TEST_DISTRIBUTION.architecture,
+                                          components=[Component.LIB32])
+        src_distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                        architecture=TEST_DISTRIBUTION.architecture,
+                                        components=[Component.SRC])
+        with TemporaryDirectory() as temp_dir:
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            assert base_jail_factory.get_missing_components(src_distribution) == [Component.BASE, Component.SRC]
+            try:
+                base_jail_factory.create_base_jail(distribution=lib32_distribution,
+                                                   path_to_tarballs=PosixPath(temp_dir))
+                assert base_jail_factory.get_installed_components(src_distribution) == []
+                assert base_jail_factory.get_missing_components(src_distribution) == [Component.BASE, Component.SRC]
+
+                base_jail_factory.create_base_jail(distribution=src_distribution,
+                                                   path_to_tarballs=PosixPath(temp_dir))
+                assert base_jail_factory.base_jail_exists(distribution=src_distribution)
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_reuse_older_snapshot_with_most_components(self):
+        lib32_distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                          architecture=TEST_DISTRIBUTION.architecture,
+                                          components=[Component.LIB32])
+        src_distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                        architecture=TEST_DISTRIBUTION.architecture,
+                                        components=[Component.SRC])
+        data_set_name = BaseJailFactory.get_data_set_name(TEST_DISTRIBUTION)
+        with TemporaryDirectory() as temp_dir:
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            jail_path = base_jail_factory.get_jail_mountpoint(data_set_name)
+            shutil.rmtree(jail_path, ignore_errors=True)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            try:
+                base_jail_factory.create_base_jail(distribution=TEST_DISTRIBUTION,
+                                                   path_to_tarballs=PosixPath(temp_dir))
+                # The mocked ZFS does not mount snapshots, so the one of the base is copied where ZFS shows it.
+                snapshot_path = base_jail_factory.get_snapshot_path(jail_path, base_jail_factory.SNAPSHOT_NAME)
+                shutil.copytree(jail_path.as_posix(), snapshot_path.as_posix(), symlinks=True)
+                base_jail_factory.create_base_jail(distribution=lib32_distribution,
+                                                   path_to_tarballs=PosixPath(temp_dir))
+                assert jail_path.joinpath('examples').exists()
+                assert base_jail_factory.get_installed_components(src_distribution) == [Component.BASE]
+                assert base_jail_factory.get_missing_components(src_distribution) == [Component.SRC]
+
+                base_jail_factory.create_base_jail(distribution=src_distribution,
+                                                   path_to_tarballs=PosixPath(temp_dir))
+                assert base_jail_factory.base_jail_exists(distribution=src_distribution)
+                assert base_jail_factory.base_jail_exists(distribution=lib32_distribution)
+                assert not jail_path.joinpath('examples').exists()
+                assert jail_path.joinpath('jmanager', 'factories').is_dir()
+                assert snapshot_path.joinpath('jmanager', 'models').is_dir()
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
+                shutil.rmtree(jail_path, ignore_errors=True)
+
+    def test_snapshots_record_upstream_modification_time(self):
+        distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                    architecture=TEST_DISTRIBUTION.architecture,
+                                    components=[Component.LIB32])
+        data_set_name = BaseJailFactory.get_data_set_name(TEST_DISTRIBUTION)
+        with TemporaryDirectory() as temp_dir:
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            try:
+                base_jail_factory.create_base_jail(distribution=TEST_DISTRIBUTION,
+                                                   path_to_tarballs=PosixPath(temp_dir), upstream_modified=1000)
+                base_jail_factory.create_base_jail(distribution=distribution,
+                                                   path_to_tarballs=PosixPath(temp_dir), upstream_modified=2000)
+
+                assert base_jail_factory.get_upstream_modification_time(
+                    data_set_name=data_set_name, snapshot_name=base_jail_factory.SNAPSHOT_NAME) == 1000
+                assert base_jail_factory.get_upstream_modification_time(
+                    data_set_name=data_set_name,
+                    snapshot_name=base_jail_factory.get_snapshot_name(distribution.components)) == 1000
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_snapshots_without_upstream_modification_time(self):
+        with TemporaryDirectory() as temp_dir:
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            try:
+                base_jail_factory.create_base_jail(distribution=TEST_DISTRIBUTION,
+                                                   path_to_tarballs=PosixPath(temp_dir))
+                assert base_jail_factory.get_upstream_modification_time(
+                    data_set_name=BaseJailFactory.get_data_set_name(TEST_DISTRIBUTION),
+                    snapshot_name=base_jail_factory.SNAPSHOT_NAME) is None
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_create_base_jail_with_profile(self):
+        profile = ExtractionProfile(name='no_models', exclude=['jmanager/models'])
+        distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                    architecture=TEST_DISTRIBUTION.architecture,
+                                    components=[Component.SRC], profile=profile)
+        src_distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                        architecture=TEST_DISTRIBUTION.architecture,
+                                        components=[Component.SRC])
+        data_set_name = BaseJailFactory.get_data_set_name(TEST_DISTRIBUTION)
+        with TemporaryDirectory() as temp_dir:
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            try:
+                base_jail_factory.create_base_jail(distribution=src_distribution,
+                                                   path_to_tarballs=PosixPath(temp_dir))
+                assert base_jail_factory.get_installed_components(distribution) == []
+
+                base_jail_factory.create_base_jail(distribution=distribution, path_to_tarballs=PosixPath(temp_dir))
+                jail_path = base_jail_factory.get_jail_mountpoint(data_set_name)
+                assert jail_path.joinpath('jmanager', 'utils', 'file_utils.py').is_file()
+                assert not jail_path.joinpath('jmanager', 'models').exists()
+
+                assert base_jail_factory.base_jail_exists(distribution=distribution)
+                assert base_jail_factory.base_jail_exists(distribution=src_distribution)
+                assert base_jail_factory.data_set_factory.snapshot_exists(
+                    data_set_name=data_set_name, snapshot=f"{base_jail_factory.SNAPSHOT_NAME}__profile_no_models")
+                assert base_jail_factory.profile_matches(distribution)
+                assert distribution in base_jail_factory.list_base_jails()
+
+                changed_distribution = Distribution(
+                    version=TEST_DISTRIBUTION.version, architecture=TEST_DISTRIBUTION.architecture,
+                    components=[Component.SRC], profile=ExtractionProfile(name='no_models', exclude=['jmanager']))
+                assert not base_jail_factory.profile_matches(changed_distribution)
+                assert base_jail_factory.get_installed_components(changed_distribution) == []
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_reset_base_data_set(self):
+        data_set_name = BaseJailFactory.get_data_set_name(TEST_DISTRIBUTION)
+        base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+        data_set_factory = base_jail_factory.data_set_factory
+        jail_path = base_jail_factory.get_jail_mountpoint(data_set_name)
+        try:
+            data_set_factory.create_base_data_set(data_set_name, jail_path)
+            base_jail_factory.reset_base_data_set(data_set_name=data_set_name, jail_path=jail_path)
+            assert data_set_factory.get_latest_snapshot(data_set_name) == base_jail_factory.EMPTY_SNAPSHOT_NAME
+
+            base_jail_factory.reset_base_data_set(data_set_name=data_set_name, jail_path=jail_path)
+            assert data_set_factory.get_latest_snapshot(data_set_name) == base_jail_factory.EMPTY_SNAPSHOT_NAME
+            assert not base_jail_factory.list_base_jails()
+        finally:
+            destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_reset_base_data_set_keeping_other_base_jails(self):
+        src_distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                        architecture=TEST_DISTRIBUTION.architecture,
+                                        components=[Component.SRC])
+        with TemporaryDirectory() as temp_dir:
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            try:
+                base_jail_factory.create_base_jail(distribution=src_distribution,
+                                                   path_to_tarballs=PosixPath(temp_dir))
+                jail_path = base_jail_factory.get_jail_mountpoint(base_jail_factory.get_data_set_name(src_distribution))
+                assert jail_path.joinpath('jmanager', 'utils').is_dir()
+
+                base_jail_factory.reset_base_data_set(
+                    data_set_name=base_jail_factory.get_data_set_name(src_distribution), jail_path=jail_path)
+                assert not jail_path.exists()
+                assert base_jail_factory.base_jail_exists(src_distribution)
+                assert base_jail_factory.base_jail_exists(TEST_DISTRIBUTION)
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
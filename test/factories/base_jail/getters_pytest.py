@@ -1,4 +1,5 @@
 from jmanager.models.distribution import Distribution, Component
+from jmanager.models.extraction_profile import ExtractionProfile
 from test.globals import get_mocking_base_jail_factory, TMP_PATH, TEST_DISTRIBUTION, create_dummy_base_jail, \
     destroy_dummy_base_jail
 
@@ -20,6 +21,29 @@ class TestBaseJailFactoryGetters:
         )
         assert base_jail_factory.get_snapshot_name(
             distribution.components) == f"{base_jail_factory.SNAPSHOT_NAME}_lib32_src"
+        assert base_jail_factory.get_snapshot_name(
+            distribution.components,
+            profile=ExtractionProfile(name='minimal')) == \
+            f"{base_jail_factory.SNAPSHOT_NAME}_lib32_src__profile_minimal"
+        assert base_jail_factory.get_snapshot_components(
+            f"{base_jail_factory.SNAPSHOT_NAME}_lib32_src__profile_minimal") == [Component.BASE, Component.LIB32,
+                                                                                   Component.SRC]
+        assert base_jail_factory.get_snapshot_profile_name(
+            f"{base_jail_factory.SNAPSHOT_NAME}_lib32_src__profile_minimal") == 'minimal'
+
+    def test_get_snapshot_name_with_debug_components(self):
+        base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+        components = [Component.BASE, Component.LIB32_DEBUG, Component.SRC]
+        snapshot_name = base_jail_factory.get_snapshot_name(components)
+        assert snapshot_name == f"{base_jail_factory.SNAPSHOT_NAME}_lib32-dbg_src"
+        assert base_jail_factory.get_snapshot_components(snapshot_name) == components
+        assert base_jail_factory.get_snapshot_profile_name(snapshot_name) is None
+
+        for profile_name in ['minimal', 'no-dbg', 'my__profile_x']:
+            snapshot_name = base_jail_factory.get_snapshot_name(components,
+                                                                profile=ExtractionProfile(name=profile_name))
+            assert base_jail_factory.get_snapshot_components(snapshot_name) == components
+            assert base_jail_factory.get_snapshot_profile_name(snapshot_name) == profile_name
 
     def test_list_base_jails(self):
         base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
@@ -41,4 +65,32 @@ class TestBaseJailFactoryGetters:
         finally:
             destroy_dummy_base_jail()
 
+        assert len(base_jail_factory.list_base_jails()) == 2
+        base_jail_factory.data_set_factory.refresh()
         assert not len(base_jail_factory.list_base_jails())
+
+    def test_list_base_jails_with_debug_components(self):
+        base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+        distribution = Distribution(
+            version=TEST_DISTRIBUTION.version,
+            architecture=TEST_DISTRIBUTION.architecture,
+            components=[Component.BASE, Component.LIB32_DEBUG, Component.SRC]
+        )
+        profile_distribution = Distribution(
+            version=TEST_DISTRIBUTION.version,
+            architecture=TEST_DISTRIBUTION.architecture,
+            components=[Component.BASE, Component.LIB32_DEBUG, Component.SRC],
+            profile=ExtractionProfile(name='minimal')
+        )
+
+        create_dummy_base_jail(distribution=distribution)
+        create_dummy_base_jail(distribution=profile_distribution)
+        try:
+            list_of_base_jails = base_jail_factory.list_base_jails()
+            assert len(list_of_base_jails) == 2
+            for base_jail in list_of_base_jails:
+                assert base_jail.components == distribution.components
+            assert sorted([str(base_jail.profile_name) for base_jail in list_of_base_jails]) == ['None', 'minimal']
+        finally:
+            destroy_dummy_base_jail(distribution)
+            base_jail_factory.data_set_factory.refresh()
@@ -0,0 +1,128 @@
+import shutil
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from jmanager.factories.base_jail_factory import BaseJailFactory
+from jmanager.models.distribution import Distribution, Component, Version
+from jmanager.models.jail import JailError
+from test.globals import get_mocking_base_jail_factory, TMP_PATH, TEST_DISTRIBUTION, create_dummy_tarball_in_folder, \
+    destroy_dummy_base_jail, MockingDataSetFactory, TEST_DATA_SET, MockingBaseJailFactory
+
+NEW_VERSION = Version.from_string('12.1-RELEASE')
+
+
+class RollbackRecordingDataSetFactory(MockingDataSetFactory):
+    def __init__(self, zfs_root_data_set: str):
+        super().__init__(zfs_root_data_set=zfs_root_data_set)
+        self.rollbacks = []
+
+    def rollback(self, data_set_name: str, snapshot_name: str):
+        self.rollbacks.append((data_set_name, snapshot_name))
+        super().rollback(data_set_name=data_set_name, snapshot_name=snapshot_name)
+
+
+class TestBaseJailFactoryUpdate:
+    def test_update_base_jail_to_another_version(self):
+        distribution = Distribution(version=TEST_DISTRIBUTION.version,
+                                    architecture=TEST_DISTRIBUTION.architecture,
+                                    components=[Component.LIB32])
+        new_distribution = Distribution(version=NEW_VERSION, architecture=TEST_DISTRIBUTION.architecture,
+                                        components=[Component.LIB32])
+        with TemporaryDirectory() as temp_dir:
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            shutil.rmtree(base_jail_factory.get_jail_mountpoint(BaseJailFactory.get_data_set_name(new_distribution)),
+                          ignore_errors=True)
+            try:
+                with pytest.raises(JailError, match=r"does not exist"):
+                    base_jail_factory.update_base_jail(distribution=distribution, version=NEW_VERSION,
+                                                       path_to_tarballs=PosixPath(temp_dir))
+
+                base_jail_factory.create_base_jail(distribution=distribution, path_to_tarballs=PosixPath(temp_dir))
+                summary = base_jail_factory.update_base_jail(distribution=distribution, version=NEW_VERSION,
+                                                             path_to_tarballs=PosixPath(temp_dir),
+                                                             upstream_modified=1000)
+
+                assert summary.written_files
+                assert base_jail_factory.base_jail_exists(distribution)
+                assert base_jail_factory.base_jail_exists(new_distribution)
+                assert not base_jail_factory.base_jail_exists(Distribution(version=NEW_VERSION,
+                                                                           architecture=distribution.architecture,
+                                                                           components=[]))
+                assert base_jail_factory.get_upstream_modification_time(
+                    data_set_name=BaseJailFactory.get_data_set_name(new_distribution),
+                    snapshot_name=base_jail_factory.get_snapshot_name(new_distribution.components)) == 1000
+                jail_path = base_jail_factory.get_jail_mountpoint(BaseJailFactory.get_data_set_name(new_distribution))
+                assert jail_path.joinpath('examples', 'jmanager.conf').is_file()
+
+                with pytest.raises(JailError, match=r"The data set for '12.1-RELEASE/amd64' exists"):
+                    base_jail_factory.update_base_jail(distribution=distribution, version=NEW_VERSION,
+                                                       path_to_tarballs=PosixPath(temp_dir))
+            finally:
+                destroy_dummy_base_jail(new_distribution)
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_refresh_base_jail(self):
+        data_set_name = BaseJailFactory.get_data_set_name(TEST_DISTRIBUTION)
+        with TemporaryDirectory() as temp_dir:
+            base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            shutil.rmtree(base_jail_factory.get_jail_mountpoint(data_set_name).as_posix(), ignore_errors=True)
+            try:
+                base_jail_factory.create_base_jail(distribution=TEST_DISTRIBUTION,
+                                                   path_to_tarballs=PosixPath(temp_dir), upstream_modified=1000)
+                summary = base_jail_factory.update_base_jail(distribution=TEST_DISTRIBUTION,
+                                                             version=TEST_DISTRIBUTION.version,
+                                                             path_to_tarballs=PosixPath(temp_dir),
+                                                             upstream_modified=2000)
+
+                assert summary.written_files == 0
+                assert summary.removed_files == 0
+                assert base_jail_factory.base_jail_exists(TEST_DISTRIBUTION)
+                assert base_jail_factory.get_upstream_modification_time(
+                    data_set_name=data_set_name, snapshot_name=base_jail_factory.SNAPSHOT_NAME) == 2000
+
+                base_jail_factory.data_set_factory.clone(data_set_name=data_set_name,
+                                                         snapshot_name=base_jail_factory.SNAPSHOT_NAME,
+                                                         clone_data_set_name='test_jail',
+                                                         options={})
+                try:
+                    with pytest.raises(JailError, match=r"There are jails cloned from the base jail"):
+                        base_jail_factory.update_base_jail(distribution=TEST_DISTRIBUTION,
+                                                           version=TEST_DISTRIBUTION.version,
+                                                           path_to_tarballs=PosixPath(temp_dir))
+                finally:
+                    base_jail_factory.data_set_factory.delete_data_set('test_jail')
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
+
+    def test_failed_refresh_is_rolled_back(self):
+        data_set_name = BaseJailFactory.get_data_set_name(TEST_DISTRIBUTION)
+        data_set_factory = RollbackRecordingDataSetFactory(zfs_root_data_set=TEST_DATA_SET)
+        base_jail_factory = MockingBaseJailFactory(jail_root_path=TMP_PATH, data_set_factory=data_set_factory)
+        updated_members = []
+
+        def _fail_midway(msg: str, value: int, total: int):
+            updated_members.append(msg)
+            if len(updated_members) > 3:
+                raise RuntimeError("Extraction failed")
+
+        with TemporaryDirectory() as temp_dir:
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            shutil.rmtree(base_jail_factory.get_jail_mountpoint(data_set_name).as_posix(), ignore_errors=True)
+            try:
+                base_jail_factory.create_base_jail(distribution=TEST_DISTRIBUTION,
+                                                   path_to_tarballs=PosixPath(temp_dir))
+                data_set_factory.rollbacks.clear()
+                with pytest.raises(RuntimeError, match=r"Extraction failed"):
+                    base_jail_factory.update_base_jail(distribution=TEST_DISTRIBUTION,
+                                                       version=TEST_DISTRIBUTION.version,
+                                                       path_to_tarballs=PosixPath(temp_dir),
+                                                       callback=_fail_midway)
+
+                assert data_set_factory.rollbacks == [(data_set_name, base_jail_factory.SNAPSHOT_NAME)] * 2
+                assert base_jail_factory.base_jail_exists(TEST_DISTRIBUTION)
+            finally:
+                destroy_dummy_base_jail(TEST_DISTRIBUTION)
@@ -1,7 +1,12 @@
+import hashlib
 import os
 import shutil
 import tarfile
+from email.utils import parsedate_to_datetime
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import PosixPath
+from threading import Thread
 
 from jmanager.factories.base_jail_factory import BaseJailFactory
 from jmanager.factories.data_set_factory import DataSetFactory
@@ -66,7 +71,8 @@ def create_dummy_base_jail(distribution: Distribution = TEST_DISTRIBUTION):
 
 def get_dummy_snapshot_name(distribution):
     base_jail_factory = get_mocking_base_jail_factory(TMP_PATH)
-    snapshot_name = base_jail_factory.get_snapshot_name(component_list=distribution.components)
+    snapshot_name = base_jail_factory.get_snapshot_name(component_list=distribution.components,
+                                                       profile=distribution.profile)
     return snapshot_name
 
 
@@ -92,3 +98,107 @@ def remove_path(temp_dir: PosixPath = TMP_PATH):
             shutil.rmtree(temp_dir.as_posix())
         else:
             temp_dir.unlink()
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RangeHTTPRequestHandler(QuietHTTPRequestHandler):
+    """
+    Request handler honouring single 'Range' and 'If-Range' headers, like the FreeBSD mirrors do.
+    """
+
+    def do_GET(self):
+        self.send_file(send_body=True)
+
+    def do_HEAD(self):
+        self.send_file(send_body=False)
+
+    def send_file(self, send_body: bool):
+        path_to_file = self.translate_path(self.path)
+        if not os.path.isfile(path_to_file):
+            self.send_error(404)
+            return
+
+        with open(path_to_file, 'rb') as requested_file:
+            content = requested_file.read()
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        last_modified = self.date_time_string(int(os.path.getmtime(path_to_file)))
+
+        if self.is_not_modified(etag, modification_time=int(os.path.getmtime(path_to_file))):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            return
+
+        start, end = 0, len(content) - 1
+        range_header = self.headers.get('Range')
+        if_range_header = self.headers.get('If-Range')
+        if range_header and if_range_header in (None, etag, last_modified):
+            first_byte, last_byte = range_header.replace('bytes=', '').split('-')
+            start = int(first_byte)
+            end = min(int(last_byte), end) if last_byte else end
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(content)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(content)}")
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        if send_body:
+            self.write_body(content[start:end + 1])
+
+    def is_not_modified(self, etag: str, modification_time: int) -> bool:
+        if self.headers.get('If-None-Match') is not None:
+            return self.headers['If-None-Match'] == etag
+        if self.headers.get('If-Modified-Since') is not None:
+            return parsedate_to_datetime(self.headers['If-Modified-Since']).timestamp() >= modification_time
+        return False
+
+    def write_body(self, body: bytes):
+        self.wfile.write(body)
+
+
+class LocalHTTPServer:
+    """
+    Serves a local folder through HTTP in a background thread, standing in for a FreeBSD mirror.
+    """
+
+    def __init__(self, directory: PosixPath, handler_class=QuietHTTPRequestHandler):
+        self._directory = directory
+        self._handler_class = handler_class
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> 'LocalHTTPServer':
+        handler = partial(self._handler_class, directory=self._directory.as_posix())
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
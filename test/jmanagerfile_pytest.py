@@ -5,6 +5,7 @@ from typing import List, Dict
 import pytest
 import yaml
 
+from jmanager.models.extraction_profile import ExtractionProfile
 from jmanager.models.jmanagerfile import JManagerFile
 from jmanager.utils.configuration import parse_jmanagerfile
 from test.globals import RESOURCES_PATH, TEST_DISTRIBUTION
@@ -82,6 +83,13 @@ class TestJManagerFile:
         jmanager_file = parse_jmanagerfile(configuration)
         assert jmanager_file[0].provision_file_path is not None
 
+    def test_parsing_with_source(self):
+        configuration = [JAIL_CONFIGURATION_EXAMPLE[0].copy()]
+        assert parse_jmanagerfile(configuration)[0].source is None
+
+        configuration[0]['source'] = 'file:///mnt/freebsd'
+        assert parse_jmanagerfile(configuration)[0].source == 'file:///mnt/freebsd'
+
     def test_jmanagerfile_with_provision_file(self):
         with TemporaryDirectory() as temp_dir:
             provision_file_path = PosixPath(temp_dir).joinpath('provision')
@@ -147,3 +155,24 @@ class TestJManagerFile:
                 read_tasks = read_provision_file[index]['tasks']
                 for key, value in provision['provision'][index].items():
                     assert key in read_tasks[index] and read_tasks[index][key] == value
+
+    def test_parsing_with_profile(self):
+        extraction_profiles = {'minimal': ExtractionProfile(name='minimal', exclude=['usr/share/doc'])}
+        configuration = [JAIL_CONFIGURATION_EXAMPLE[0].copy()]
+        assert parse_jmanagerfile(configuration)[0].distribution.profile is None
+
+        configuration[0]['profile'] = 'minimal'
+        distribution = parse_jmanagerfile(configuration, extraction_profiles=extraction_profiles)[0].distribution
+        assert distribution.profile == extraction_profiles['minimal']
+
+        configuration[0]['profile'] = {'name': 'no_tests', 'exclude': ['usr/tests']}
+        distribution = parse_jmanagerfile(configuration)[0].distribution
+        assert distribution.profile == ExtractionProfile(name='no_tests', exclude=['usr/tests'])
+
+        configuration[0]['profile'] = 'unknown'
+        with pytest.raises(ValueError, match=r"Unknown extraction profile 'unknown'"):
+            parse_jmanagerfile(configuration, extraction_profiles=extraction_profiles)
+
+        configuration[0]['profile'] = ['minimal']
+        with pytest.raises(ValueError, match=r"Property profile must be of type 'str' or 'dict' not 'list'"):
+            parse_jmanagerfile(configuration)
@@ -0,0 +1,68 @@
+import tarfile
+
+import pytest
+
+from jmanager.models.extraction_profile import ExtractionProfile
+
+
+def create_member(name: str, link_name: str = None) -> tarfile.TarInfo:
+    member = tarfile.TarInfo(name=name)
+    if link_name is not None:
+        member.type = tarfile.LNKTYPE
+        member.linkname = link_name
+    return member
+
+
+class TestModelExtractionProfile:
+    def test_prefix_rules(self):
+        profile = ExtractionProfile(name='minimal', exclude=['/usr/share/doc/', './usr/tests'])
+
+        assert profile.selects('usr/share/man/man1/ls.1.gz')
+        assert profile.selects('./usr/share/docs')
+        assert not profile.selects('usr/share/doc')
+        assert not profile.selects('./usr/share/doc/README')
+        assert not profile.selects('usr/tests/bin/ls/Kyuafile')
+
+    def test_glob_rules(self):
+        profile = ExtractionProfile(name='no_profiling', exclude=['usr/lib/*_p.a'])
+
+        assert not profile.selects('usr/lib/libc_p.a')
+        assert not profile.selects('usr/lib/private/libucl_p.a')
+        assert profile.selects('usr/lib/libc.a')
+
+    def test_include_rules_keep_parent_folders(self):
+        profile = ExtractionProfile(name='runtime', include=['bin', 'usr/lib'], exclude=['usr/lib/debug'])
+
+        assert profile.selects('.')
+        assert profile.selects('bin/sh')
+        assert profile.selects('usr')
+        assert profile.selects('usr/lib/libc.so')
+        assert not profile.selects('usr/lib/debug/bin/sh.debug')
+        assert not profile.selects('usr/share')
+        assert not profile.selects('sbin/init')
+
+    def test_filter_members_skips_hard_links_to_skipped_members(self):
+        profile = ExtractionProfile(name='minimal', exclude=['rescue'])
+        members = [create_member('rescue/sh'), create_member('rescue/ls', link_name='rescue/sh'),
+                   create_member('bin/sh'), create_member('usr/bin/sh', link_name='rescue/sh'),
+                   create_member('bin/csh', link_name='bin/sh')]
+
+        assert [member.name for member in profile.filter_members(members)] == ['bin/sh', 'bin/csh']
+
+    def test_invalid_name(self):
+        with pytest.raises(ValueError, match=r"Invalid extraction profile name 'a.b'"):
+            ExtractionProfile(name='a.b')
+
+    def test_digest_depends_on_the_rules(self):
+        profile = ExtractionProfile(name='minimal', exclude=['usr/share/doc'])
+
+        assert profile.digest == ExtractionProfile(name='minimal', exclude=['/usr/share/doc/']).digest
+        assert profile.digest != ExtractionProfile(name='minimal', exclude=['usr/share/man']).digest
+        assert profile.digest != ExtractionProfile(name='minimal', include=['usr/share/doc']).digest
+
+    def test_dictionary_conversion(self):
+        profile = ExtractionProfile(name='minimal', include=['usr'], exclude=['usr/share/doc'])
+
+        assert ExtractionProfile.from_dict(profile.to_dict()) == profile
+        with pytest.raises(ValueError, match=r"The 'exclude' rules of an extraction profile must be a list"):
+            ExtractionProfile.from_dict({'name': 'minimal', 'exclude': 'usr/share/doc'})
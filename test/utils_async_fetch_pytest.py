@@ -0,0 +1,203 @@
+import asyncio
+import os
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from time import sleep, perf_counter
+from urllib.error import URLError
+
+import pytest
+
+from jmanager.models.distribution import Component
+from jmanager.utils.async_fetch import AsyncHTTPFetcher
+from jmanager.utils.async_http_pool import AsyncConnectionPool
+from jmanager.utils.fetch import HTTPFetcher
+from jmanager.utils.manifest import ChecksumError
+from jmanager.utils.tarball_cache import TarballCache
+from test.globals import TEST_DISTRIBUTION, LocalHTTPServer, RangeHTTPRequestHandler
+from test.utils_fetch_pytest import create_mirror_folder, LocalServerFetcher, RecordingRangeHandler, \
+    ConcurrencyCountingHandler, TEMPORARY_RELEASE_FTP_DIR, TEST_COMPONENTS, TestMirrorFailover, unreachable_server, \
+    silent_server
+
+
+class StallingRangeHandler(RangeHTTPRequestHandler):
+    """
+    Sends half of every tarball and stalls.
+    """
+
+    def write_body(self, body: bytes):
+        if not self.path.endswith('.txz'):
+            super().write_body(body)
+            return
+        self.wfile.write(body[:len(body) // 2])
+        self.wfile.flush()
+        sleep(2)
+        self.close_connection = True
+
+
+def fetch_tarballs(backend: str, server_url: str, temp_dir: str, components=TEST_COMPONENTS,
+                   async_connection_pool: AsyncConnectionPool = None, **kwargs):
+    """
+    Fetches the components with either of the fetchers, so both share the same tests.
+    """
+    http_fetcher = LocalServerFetcher(server_url=server_url, **kwargs)
+    if backend == 'sync':
+        http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                         architecture=TEST_DISTRIBUTION.architecture,
+                                         components=components, temp_dir=PosixPath(temp_dir))
+        return
+
+    async_http_fetcher = AsyncHTTPFetcher(http_fetcher=http_fetcher, async_connection_pool=async_connection_pool)
+    asyncio.run(async_http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                 architecture=TEST_DISTRIBUTION.architecture,
+                                                 components=components, temp_dir=PosixPath(temp_dir)))
+
+
+@pytest.mark.parametrize('backend', ['sync', 'async'])
+class TestFetchBackends:
+    def test_fetch_components(self, backend):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                fetch_tarballs(backend, server.url, temp_dir)
+
+            for component in TEST_COMPONENTS:
+                original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, f"{component.value}.txz")
+                fetched_file = PosixPath(temp_dir).joinpath(f"{component.value}.txz")
+                assert fetched_file.read_bytes() == original_file.read_bytes()
+
+    def test_missing_component_raises(self, backend):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'lib32.txz').unlink()
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                with pytest.raises(URLError):
+                    fetch_tarballs(backend, server.url, temp_dir)
+
+    def test_corrupt_component_is_rejected(self, backend):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz').write_bytes(b'corrupt')
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                with pytest.raises(ChecksumError, match=r"Checksum mismatch for 'base.txz'"):
+                    fetch_tarballs(backend, server.url, temp_dir, components=[Component.BASE])
+
+            assert os.listdir(temp_dir) == []
+
+    def test_fetch_populates_cache(self, backend):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir, \
+                TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                fetch_tarballs(backend, server.url, temp_dir, tarball_cache=tarball_cache)
+
+            cached_components = [entry.component for entry in tarball_cache.list_entries()]
+            assert sorted(cached_components) == sorted([Component.MANIFEST, *TEST_COMPONENTS])
+            assert os.listdir(PosixPath(cache_dir).joinpath(TarballCache.DOWNLOADS_FOLDER).as_posix()) == []
+
+    def test_resume_after_connection_drop(self, backend):
+        RecordingRangeHandler.reset(drop_connection=True)
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RecordingRangeHandler) as server:
+                fetch_tarballs(backend, server.url, temp_dir, components=[Component.BASE])
+
+            assert PosixPath(temp_dir).joinpath('base.txz').read_bytes() == original_file.read_bytes()
+            assert RecordingRangeHandler.range_headers == [None, f"bytes={original_file.stat().st_size // 2}-"]
+
+    @pytest.mark.parametrize('dead_server', [unreachable_server, silent_server], ids=['refused', 'silent'])
+    def test_download_skips_a_dead_mirror(self, backend, dead_server, monkeypatch):
+        monkeypatch.setattr(LocalServerFetcher, 'TIMEOUT', 0.5)
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with dead_server() as dead_server_url, \
+                    LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                mirror_selector = TestMirrorFailover.get_mirror_selector([dead_server_url, server.url], temp_dir)
+                fetch_tarballs(backend, server.url, temp_dir, components=[Component.BASE],
+                               mirror_selector=mirror_selector)
+
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            assert PosixPath(temp_dir).joinpath('base.txz').read_bytes() == original_file.read_bytes()
+            assert mirror_selector.get_ranked_mirrors(probe_path='') == [server.url, dead_server_url]
+
+
+class SlowProbingFetcher(LocalServerFetcher):
+    """
+    Takes as long as probing the mirrors to give the base URLs.
+    """
+
+    def get_base_urls(self, architecture, version):
+        sleep(0.5)
+        return super().get_base_urls(architecture, version)
+
+
+class TestAsyncFetch:
+    def test_mirror_probing_does_not_block_the_event_loop(self):
+        ticks = []
+
+        async def _tick():
+            while True:
+                ticks.append(perf_counter())
+                await asyncio.sleep(0.01)
+
+        async def _fetch_while_ticking(http_fetcher: AsyncHTTPFetcher, temp_dir: str):
+            ticker = asyncio.ensure_future(_tick())
+            await asyncio.sleep(0)
+            try:
+                await http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                       architecture=TEST_DISTRIBUTION.architecture,
+                                                       components=[Component.BASE], temp_dir=PosixPath(temp_dir))
+            finally:
+                ticker.cancel()
+
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                http_fetcher = AsyncHTTPFetcher(http_fetcher=SlowProbingFetcher(server_url=server.url))
+                asyncio.run(_fetch_while_ticking(http_fetcher, temp_dir))
+
+        assert max([tick - previous_tick for previous_tick, tick in zip(ticks, ticks[1:])]) < 0.25
+
+    def test_downloads_share_the_event_loop(self):
+        ConcurrencyCountingHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=ConcurrencyCountingHandler) as server:
+                fetch_tarballs('async', server.url, temp_dir, max_workers=2)
+
+        assert ConcurrencyCountingHandler.max_active_requests == 2
+
+    def test_cancelled_download_is_resumed(self):
+        RecordingRangeHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=StallingRangeHandler) as server:
+                http_fetcher = AsyncHTTPFetcher(http_fetcher=LocalServerFetcher(server_url=server.url))
+                with pytest.raises(asyncio.TimeoutError):
+                    asyncio.run(asyncio.wait_for(
+                        http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                         architecture=TEST_DISTRIBUTION.architecture,
+                                                         components=[Component.BASE],
+                                                         temp_dir=PosixPath(temp_dir)),
+                        timeout=1))
+
+            partial_file = HTTPFetcher.get_partial_path(PosixPath(temp_dir).joinpath('base.txz'))
+            assert partial_file.stat().st_size == original_file.stat().st_size // 2
+
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RecordingRangeHandler) as server:
+                fetch_tarballs('async', server.url, temp_dir, components=[Component.BASE])
+
+            assert PosixPath(temp_dir).joinpath('base.txz').read_bytes() == original_file.read_bytes()
+            assert not partial_file.exists()
+
+    def test_connection_is_reused(self):
+        connection_pool = AsyncConnectionPool()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                fetch_tarballs('async', server.url, temp_dir, max_workers=1, async_connection_pool=connection_pool)
+
+        assert connection_pool.stats.requests == len(TEST_COMPONENTS)
+        assert connection_pool.stats.connections_opened == 1
@@ -0,0 +1,85 @@
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from time import monotonic
+
+import pytest
+
+from jmanager.models.distribution import Component
+from jmanager.utils.bandwidth import BandwidthScheduler
+from test.globals import LocalHTTPServer, RangeHTTPRequestHandler
+from test.utils_fetch_pytest import create_mirror_folder, LocalServerFetcher, TEMPORARY_RELEASE_FTP_DIR
+
+RATE = 1000
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestBandwidthScheduler:
+    def test_invalid_limits(self):
+        with pytest.raises(ValueError):
+            BandwidthScheduler(rate=0)
+        with pytest.raises(ValueError):
+            BandwidthScheduler(rate=RATE).get_flow(weight=0)
+
+    def test_bursts_and_rate(self):
+        bandwidth_scheduler = BandwidthScheduler(rate=RATE, burst_time=0.5, clock=FakeClock())
+        flow = bandwidth_scheduler.get_flow()
+
+        assert flow.max_block_size == 500
+        assert flow.reserve(500) == 0.0
+        assert flow.reserve(1000) == pytest.approx(1.0)
+        assert flow.reserve(1000) == pytest.approx(2.0)
+
+    def test_flows_share_the_rate_by_weight(self):
+        clock = FakeClock()
+        bandwidth_scheduler = BandwidthScheduler(rate=RATE, burst_time=0, clock=clock)
+        high_priority_flow = bandwidth_scheduler.get_flow(weight=3)
+        low_priority_flow = bandwidth_scheduler.get_flow(weight=1)
+
+        high_priority_flow.reserve(1)
+        assert low_priority_flow.reserve(250) == pytest.approx(1.0)
+        assert high_priority_flow.reserve(750) == pytest.approx(1.0, abs=0.01)
+
+        clock.now += 10
+        assert low_priority_flow.reserve(1000) == pytest.approx(1.0)
+
+    def test_state_file_is_shared(self):
+        clock = FakeClock()
+        with TemporaryDirectory() as temp_dir:
+            state_file = PosixPath(temp_dir).joinpath('bandwidth.state')
+            first_scheduler = BandwidthScheduler(rate=RATE, state_file=state_file, burst_time=0, clock=clock)
+            second_scheduler = BandwidthScheduler(rate=RATE, state_file=state_file, burst_time=0, clock=clock)
+            try:
+                assert first_scheduler.get_flow().reserve(1000) == pytest.approx(1.0)
+                assert second_scheduler.get_flow().reserve(1000) == pytest.approx(2.0)
+            finally:
+                first_scheduler.close()
+                second_scheduler.close()
+
+    def test_reservations_left_before_a_reboot(self):
+        clock = FakeClock()
+        bandwidth_scheduler = BandwidthScheduler(rate=RATE, burst_time=0, clock=clock)
+        bandwidth_scheduler.get_flow().reserve(1000 * RATE)
+
+        clock.now += 2
+        assert bandwidth_scheduler.get_flow().reserve(1000) == pytest.approx(1.0)
+
+    def test_fetch_is_throttled(self):
+        rate = 256 * 1024
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE], size=128 * 1024)
+            bandwidth_flow = BandwidthScheduler(rate=rate).get_flow()
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, bandwidth_flow=bandwidth_flow)
+                start_time = monotonic()
+                http_fetcher.fetch_file(url=f"{server.url}/{TEMPORARY_RELEASE_FTP_DIR}/base.txz",
+                                        destination=PosixPath(temp_dir).joinpath('base.txz'))
+                elapsed_time = monotonic() - start_time
+
+        assert elapsed_time >= 128 * 1024 / rate - BandwidthScheduler.BURST_TIME
@@ -0,0 +1,175 @@
+import io
+import os
+import tarfile
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from typing import Dict
+
+from jmanager.models.extraction_profile import ExtractionProfile
+from jmanager.utils import base_update
+from jmanager.utils.base_update import update_tree_from_tarballs, restore_tree_from_snapshot
+from jmanager.utils.file_utils import extract_tarball_into
+
+OLD_FILES = {
+    'bin/unchanged': b'unchanged',
+    'bin/same_size': b'version 1',
+    'bin/other_size': b'version 1',
+    'usr/share/removed/README': b'removed',
+}
+NEW_FILES = {
+    'bin/unchanged': b'unchanged',
+    'bin/same_size': b'version 2',
+    'bin/other_size': b'version 1.1',
+    'usr/share/added/README': b'added',
+}
+OLD_MTIME = 1600000000
+NEW_MTIME = 1700000000
+
+
+def create_tarball(path_to_tarball: PosixPath, files: Dict[str, bytes], symlink_target: str,
+                   mtime: int = OLD_MTIME):
+    with tarfile.open(path_to_tarball.as_posix(), mode='w:xz') as tar_file:
+        for name, content in files.items():
+            member = tarfile.TarInfo(name=f"./{name}")
+            member.size = len(content)
+            member.mode = 0o755
+            member.mtime = mtime
+            tar_file.addfile(member, fileobj=io.BytesIO(content))
+        link = tarfile.TarInfo(name='./bin/hard_link')
+        link.type = tarfile.LNKTYPE
+        link.linkname = './bin/same_size'
+        link.mtime = mtime
+        tar_file.addfile(link)
+        symlink = tarfile.TarInfo(name='./bin/symlink')
+        symlink.type = tarfile.SYMTYPE
+        symlink.linkname = symlink_target
+        tar_file.addfile(symlink)
+
+
+class TestBaseUpdate:
+    def test_update_tree_from_tarballs(self):
+        with TemporaryDirectory() as tarballs_dir, TemporaryDirectory() as jail_dir:
+            jail_path = PosixPath(jail_dir)
+            old_tarball = PosixPath(tarballs_dir).joinpath('old.txz')
+            new_tarball = PosixPath(tarballs_dir).joinpath('new.txz')
+            create_tarball(old_tarball, OLD_FILES, symlink_target='unchanged')
+            create_tarball(new_tarball, NEW_FILES, symlink_target='same_size', mtime=NEW_MTIME)
+            extract_tarball_into(jail_path=jail_path, path_to_tarball=old_tarball, callback=None)
+            unchanged_inode = jail_path.joinpath('bin', 'unchanged').stat().st_ino
+
+            summary = update_tree_from_tarballs(jail_path=jail_path, paths_to_tarballs=[new_tarball])
+
+            for name, content in NEW_FILES.items():
+                with open(jail_path.joinpath(name).as_posix(), 'rb') as updated_file:
+                    assert updated_file.read() == content
+            assert not jail_path.joinpath('usr', 'share', 'removed').exists()
+            assert jail_path.joinpath('bin', 'unchanged').stat().st_ino == unchanged_inode
+            assert os.path.samefile(jail_path.joinpath('bin', 'hard_link').as_posix(),
+                                    jail_path.joinpath('bin', 'same_size').as_posix())
+            assert os.readlink(jail_path.joinpath('bin', 'symlink').as_posix()) == 'same_size'
+
+            assert summary.unchanged_files == 1
+            assert summary.written_files == 5
+            assert summary.written_bytes == sum(len(content) for content in NEW_FILES.values()
+                                                if content != b'unchanged')
+            assert summary.removed_files == 1
+
+            summary = update_tree_from_tarballs(jail_path=jail_path, paths_to_tarballs=[new_tarball])
+            assert summary.written_files == 0
+            assert summary.removed_files == 0
+
+    def test_update_files_larger_than_a_block(self, monkeypatch):
+        monkeypatch.setattr(base_update, 'STREAM_BUFFER_SIZE', 4)
+        old_files = {
+            'bin/first_block': b'0123456789',
+            'bin/last_block': b'0123456789',
+            'bin/unchanged': b'0123456789',
+            'bin/same_size': b'link',
+        }
+        new_files = {
+            'bin/first_block': b'x123456789',
+            'bin/last_block': b'012345678x',
+            'bin/unchanged': b'0123456789',
+            'bin/same_size': b'link',
+        }
+        with TemporaryDirectory() as tarballs_dir, TemporaryDirectory() as jail_dir:
+            jail_path = PosixPath(jail_dir)
+            old_tarball = PosixPath(tarballs_dir).joinpath('old.txz')
+            new_tarball = PosixPath(tarballs_dir).joinpath('new.txz')
+            create_tarball(old_tarball, old_files, symlink_target='unchanged')
+            create_tarball(new_tarball, new_files, symlink_target='unchanged', mtime=NEW_MTIME)
+            extract_tarball_into(jail_path=jail_path, path_to_tarball=old_tarball, callback=None)
+
+            summary = update_tree_from_tarballs(jail_path=jail_path, paths_to_tarballs=[new_tarball])
+
+            for name, content in new_files.items():
+                with open(jail_path.joinpath(name).as_posix(), 'rb') as updated_file:
+                    assert updated_file.read() == content
+            assert summary.written_files == 2
+            assert summary.unchanged_files == 4
+            assert summary.removed_files == 0
+
+    def test_update_tree_with_profile(self):
+        profile = ExtractionProfile(name='no_share', exclude=['usr/share'])
+        with TemporaryDirectory() as tarballs_dir, TemporaryDirectory() as jail_dir:
+            jail_path = PosixPath(jail_dir)
+            old_tarball = PosixPath(tarballs_dir).joinpath('old.txz')
+            new_tarball = PosixPath(tarballs_dir).joinpath('new.txz')
+            create_tarball(old_tarball, OLD_FILES, symlink_target='unchanged')
+            create_tarball(new_tarball, NEW_FILES, symlink_target='unchanged')
+            extract_tarball_into(jail_path=jail_path, path_to_tarball=old_tarball, callback=None, profile=profile)
+
+            summary = update_tree_from_tarballs(jail_path=jail_path, paths_to_tarballs=[new_tarball], profile=profile)
+            assert not jail_path.joinpath('usr', 'share').exists()
+            assert jail_path.joinpath('bin', 'unchanged').is_file()
+            assert summary.removed_files == 0
+
+    def test_restore_tree_from_snapshot(self):
+        with TemporaryDirectory() as tarballs_dir, TemporaryDirectory() as jail_dir:
+            jail_path = PosixPath(jail_dir)
+            snapshot_path = jail_path.joinpath('.zfs', 'snapshot', 'old')
+            old_tarball = PosixPath(tarballs_dir).joinpath('old.txz')
+            new_tarball = PosixPath(tarballs_dir).joinpath('new.txz')
+            create_tarball(old_tarball, OLD_FILES, symlink_target='unchanged')
+            create_tarball(new_tarball, NEW_FILES, symlink_target='same_size', mtime=NEW_MTIME)
+            os.makedirs(snapshot_path.as_posix())
+            extract_tarball_into(jail_path=snapshot_path, path_to_tarball=old_tarball, callback=None)
+            extract_tarball_into(jail_path=jail_path, path_to_tarball=new_tarball, callback=None)
+            unchanged_inode = jail_path.joinpath('bin', 'unchanged').stat().st_ino
+
+            summary = restore_tree_from_snapshot(jail_path=jail_path, snapshot_path=snapshot_path)
+
+            for name, content in OLD_FILES.items():
+                with open(jail_path.joinpath(name).as_posix(), 'rb') as restored_file:
+                    assert restored_file.read() == content
+            assert not jail_path.joinpath('usr', 'share', 'added').exists()
+            assert jail_path.joinpath('bin', 'unchanged').stat().st_ino == unchanged_inode
+            assert os.path.samefile(jail_path.joinpath('bin', 'hard_link').as_posix(),
+                                    jail_path.joinpath('bin', 'same_size').as_posix())
+            assert os.readlink(jail_path.joinpath('bin', 'symlink').as_posix()) == 'unchanged'
+            assert snapshot_path.joinpath('bin', 'unchanged').is_file()
+            assert summary.removed_files == 1
+
+            summary = restore_tree_from_snapshot(jail_path=jail_path, snapshot_path=snapshot_path)
+            assert summary.written_files == 0
+            assert summary.removed_files == 0
+
+    def test_files_with_the_same_size_and_time_are_not_read(self, monkeypatch):
+        with TemporaryDirectory() as tarballs_dir, TemporaryDirectory() as jail_dir:
+            jail_path = PosixPath(jail_dir)
+            snapshot_path = jail_path.joinpath('.zfs', 'snapshot', 'old')
+            tarball = PosixPath(tarballs_dir).joinpath('base.txz')
+            create_tarball(tarball, OLD_FILES, symlink_target='unchanged')
+            os.makedirs(snapshot_path.as_posix())
+            extract_tarball_into(jail_path=snapshot_path, path_to_tarball=tarball, callback=None)
+            extract_tarball_into(jail_path=jail_path, path_to_tarball=tarball, callback=None)
+
+            def fail(*args, **kwargs):
+                raise AssertionError("The content of an unchanged file was read")
+
+            monkeypatch.setattr(base_update, 'write_if_changed', fail)
+            monkeypatch.setattr(base_update, 'has_same_content', fail)
+            summary = update_tree_from_tarballs(jail_path=jail_path, paths_to_tarballs=[tarball])
+            assert summary.written_files == 0
+            summary = restore_tree_from_snapshot(jail_path=jail_path, snapshot_path=snapshot_path)
+            assert summary.written_files == 0
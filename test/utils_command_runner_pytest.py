@@ -0,0 +1,74 @@
+from subprocess import CalledProcessError
+from typing import List, Dict, Optional
+
+import pytest
+
+from jmanager.utils.command_runner import CommandRunner, CommandError, SpawnStrategy, CommandResult, \
+    SubprocessSpawnStrategy, split_command
+
+
+class RecordingSpawnStrategy(SpawnStrategy):
+    def __init__(self, return_code: int = 0):
+        self.return_code = return_code
+        self.calls = []
+
+    def spawn(self, args: List[str], capture: bool, environment: Optional[Dict[str, str]]) -> CommandResult:
+        self.calls.append((args, capture, environment))
+        return CommandResult(args=args, return_code=self.return_code, stdout='out', stderr='err')
+
+
+class TestCommandRunner:
+    @pytest.mark.parametrize('spawn_strategy', [SubprocessSpawnStrategy(), SubprocessSpawnStrategy(close_fds=False)],
+                             ids=['argv', 'argv_no_close_fds'])
+    def test_arguments_are_not_interpreted(self, spawn_strategy: SpawnStrategy):
+        argument = "it's $HOME; `true` *"
+        result = CommandRunner(spawn_strategy).run(['printf', '%s', argument])
+        assert result.return_code == 0
+        assert result.stdout == argument
+        assert result.stderr == ''
+
+    def test_stdout_and_stderr_are_captured_apart(self):
+        result = CommandRunner().run(['sh', '-c', 'echo output; echo error >&2; exit 3'], check=False)
+        assert result.return_code == 3
+        assert result.stdout == 'output\n'
+        assert result.stderr == 'error\n'
+
+    def test_failed_command(self):
+        with pytest.raises(CommandError) as error:
+            CommandRunner().run(['sh', '-c', 'echo error >&2; exit 2'])
+        assert isinstance(error.value, CalledProcessError)
+        assert error.value.result.return_code == 2
+        assert error.value.returncode == 2
+        assert 'error' in str(error.value)
+
+    def test_output_not_captured(self):
+        result = CommandRunner().run(['true'], capture=False)
+        assert result.stdout is None
+        assert result.stderr is None
+
+    def test_environment(self):
+        result = CommandRunner().run(['sh', '-c', 'echo "${JMANAGER_TEST}:${PATH}"'],
+                                     environment={'JMANAGER_TEST': 'value'})
+        assert result.stdout.startswith('value:')
+        assert result.stdout.strip() != 'value:'
+
+    def test_pluggable_spawn_strategy(self):
+        spawn_strategy = RecordingSpawnStrategy()
+        result = CommandRunner(spawn_strategy).run(['zfs', 'list'], capture=False)
+        assert spawn_strategy.calls == [(['zfs', 'list'], False, None)]
+        assert result.stdout == 'out'
+
+        spawn_strategy.return_code = 1
+        with pytest.raises(CommandError):
+            CommandRunner(spawn_strategy).run(['zfs', 'list'])
+        assert CommandRunner(spawn_strategy).run(['zfs', 'list'], check=False).return_code == 1
+
+    def test_incomplete_spawn_strategy(self):
+        with pytest.raises(TypeError):
+            SpawnStrategy()
+
+    def test_split_command(self):
+        assert split_command('sh scripts/zfs.sh') == ['sh', 'scripts/zfs.sh']
+        assert split_command("sh 'path with spaces/zfs.sh'") == ['sh', 'path with spaces/zfs.sh']
+        split_command('zfs').append('list')
+        assert split_command('zfs') == ['zfs']
@@ -0,0 +1,176 @@
+import os
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from threading import Event, Timer
+from time import sleep, perf_counter
+from urllib.error import URLError
+
+import pytest
+
+from jmanager.models.distribution import Component
+from jmanager.utils.distribution_source import create_distribution_source, HTTPDistributionSource, \
+    LocalDistributionSource, TarballFolder, DistributionSource
+from jmanager.utils.manifest import ChecksumError
+from test.globals import TEST_DISTRIBUTION, LocalHTTPServer, RangeHTTPRequestHandler
+from test.utils_fetch_pytest import create_mirror_folder, LocalServerFetcher, TEMPORARY_RELEASE_FTP_DIR, \
+    TEST_COMPONENTS
+
+
+class HeldBackRangeHandler(RangeHTTPRequestHandler):
+    """
+    Holds lib32 back until it is released.
+    """
+    release = Event()
+
+    def send_file(self, send_body: bool):
+        if self.path.endswith('lib32.txz'):
+            self.release.wait(timeout=5)
+        super().send_file(send_body)
+
+
+class TricklingRangeHandler(RangeHTTPRequestHandler):
+    """
+    Sends the tarballs a kibibyte at a time, like a very slow mirror.
+    """
+
+    def write_body(self, body: bytes):
+        if not self.path.endswith('.txz'):
+            super().write_body(body)
+            return
+        for start in range(0, len(body), 1024):
+            self.wfile.write(body[start:start + 1024])
+            self.wfile.flush()
+            sleep(0.1)
+
+
+class SmallBlockFetcher(LocalServerFetcher):
+    BLOCK_SIZE = 1024
+    MAX_BLOCK_SIZE = 1024
+
+
+class TestDistributionSource:
+    def test_create_distribution_source(self):
+        http_fetcher = LocalServerFetcher(server_url='http://localhost')
+        assert isinstance(create_distribution_source('http', http_fetcher=http_fetcher), HTTPDistributionSource)
+
+        distribution_source = create_distribution_source('file:///mnt/freebsd%20dist', http_fetcher=http_fetcher)
+        assert isinstance(distribution_source, LocalDistributionSource)
+        assert distribution_source.root_path == PosixPath('/mnt/freebsd dist')
+
+        distribution_source = create_distribution_source('/mnt/dist', http_fetcher=http_fetcher, verify=True)
+        assert distribution_source.root_path == PosixPath('/mnt/dist')
+        assert distribution_source.verify
+
+        with pytest.raises(ValueError, match=r"Unsupported distribution source 'ftp://localhost'"):
+            create_distribution_source('ftp://localhost', http_fetcher=http_fetcher)
+
+    def test_incomplete_distribution_source(self):
+        class StreamOnlySource(DistributionSource):
+            def open_tarball_stream(self, version, architecture, component):
+                pass
+
+        with pytest.raises(TypeError):
+            StreamOnlySource()
+
+    def test_local_tarballs_are_not_copied(self):
+        with TemporaryDirectory() as mirror_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            distribution_source = LocalDistributionSource(root_path=PosixPath(mirror_dir), verify=True)
+            with distribution_source.provide_tarballs(TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture,
+                                                      components=TEST_COMPONENTS) as tarball_folder:
+                tarball_folder.wait_for(Component.BASE)
+                path_to_tarballs = tarball_folder.path
+                assert path_to_tarballs == PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR)
+
+            assert distribution_source.get_upstream_modification_time(
+                TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture) == \
+                path_to_tarballs.joinpath('MANIFEST').stat().st_mtime
+
+    def test_local_missing_component_raises(self):
+        with TemporaryDirectory() as mirror_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            distribution_source = LocalDistributionSource(root_path=PosixPath(mirror_dir))
+            with pytest.raises(FileNotFoundError, match=r"Component 'lib32' not found"):
+                with distribution_source.provide_tarballs(TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture,
+                                                          components=[Component.BASE, Component.LIB32]):
+                    pass
+
+    def test_local_corrupt_component_is_rejected(self):
+        with TemporaryDirectory() as mirror_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz').write_bytes(b'corrupt')
+
+            with LocalDistributionSource(root_path=PosixPath(mirror_dir)).open_tarball_stream(
+                    TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture, Component.BASE) as tarball_stream:
+                assert tarball_stream.read() == b'corrupt'
+
+            with pytest.raises(ChecksumError, match=r"Checksum mismatch for 'base.txz'"):
+                with LocalDistributionSource(root_path=PosixPath(mirror_dir), verify=True).open_tarball_stream(
+                        TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture, Component.BASE):
+                    pass
+
+    def test_http_tarballs_are_removed(self):
+        with TemporaryDirectory() as mirror_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                distribution_source = HTTPDistributionSource(http_fetcher=LocalServerFetcher(server_url=server.url))
+                with distribution_source.provide_tarballs(TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture,
+                                                          components=TEST_COMPONENTS) as tarball_folder:
+                    for component in TEST_COMPONENTS:
+                        tarball_folder.wait_for(component)
+                    assert sorted(os.listdir(tarball_folder.path.as_posix())) == \
+                        sorted(f"{component.value}.txz" for component in TEST_COMPONENTS)
+
+            assert not tarball_folder.path.exists()
+
+    def test_http_tarballs_are_provided_as_they_arrive(self):
+        HeldBackRangeHandler.release.clear()
+        with TemporaryDirectory() as mirror_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=HeldBackRangeHandler) as server:
+                distribution_source = HTTPDistributionSource(http_fetcher=LocalServerFetcher(server_url=server.url))
+                with distribution_source.provide_tarballs(TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture,
+                                                          components=TEST_COMPONENTS) as tarball_folder:
+                    tarball_folder.wait_for(Component.BASE)
+                    assert tarball_folder.path.joinpath('base.txz').is_file()
+                    assert not tarball_folder.path.joinpath('lib32.txz').exists()
+
+                    HeldBackRangeHandler.release.set()
+                    tarball_folder.wait_for(Component.LIB32)
+                    assert tarball_folder.path.joinpath('lib32.txz').is_file()
+
+    def test_http_fetch_errors_are_raised_on_wait(self):
+        with TemporaryDirectory() as mirror_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'lib32.txz').unlink()
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                distribution_source = HTTPDistributionSource(http_fetcher=LocalServerFetcher(server_url=server.url))
+                with distribution_source.provide_tarballs(TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture,
+                                                          components=TEST_COMPONENTS) as tarball_folder:
+                    with pytest.raises(URLError):
+                        tarball_folder.wait_for(Component.LIB32)
+
+    def test_http_download_is_cancelled_when_the_consumer_fails(self):
+        with TemporaryDirectory() as mirror_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=TricklingRangeHandler) as server:
+                distribution_source = HTTPDistributionSource(http_fetcher=SmallBlockFetcher(server_url=server.url))
+                start = perf_counter()
+                with pytest.raises(RuntimeError, match=r"Extraction failed"):
+                    with distribution_source.provide_tarballs(TEST_DISTRIBUTION.version,
+                                                              TEST_DISTRIBUTION.architecture,
+                                                              components=TEST_COMPONENTS):
+                        sleep(0.5)
+                        raise RuntimeError("Extraction failed")
+                assert perf_counter() - start < 2
+
+    def test_tarball_folder(self):
+        tarball_folder = TarballFolder(path=PosixPath('/tmp'), pending_components=[Component.BASE, Component.SRC])
+        timer = Timer(0.1, tarball_folder.set_ready, args=[Component.BASE])
+        timer.start()
+        tarball_folder.wait_for(Component.BASE)
+        timer.join()
+
+        tarball_folder.finish()
+        with pytest.raises(FileNotFoundError, match=r"Component 'src' not found in /tmp"):
+            tarball_folder.wait_for(Component.SRC)
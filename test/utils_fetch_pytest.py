@@ -1,14 +1,29 @@
+import hashlib
+import io
 import os
 import shutil
+import socket
+from contextlib import contextmanager
 from pathlib import PosixPath
 from tempfile import TemporaryDirectory, mkdtemp
+from threading import Lock
+from time import sleep, time
+from typing import List, Iterator
 from urllib.error import URLError
 
 import pytest
 
 from jmanager.models.distribution import Architecture, Version, VersionType, Component
+from jmanager.utils.bandwidth import BandwidthFlow
 from jmanager.utils.fetch import HTTPFetcher
-from test.globals import TEST_DISTRIBUTION
+from jmanager.utils.file_utils import extract_tarball_stream_into
+from jmanager.utils.http_pool import ConnectionPool, HTTP_CONNECTION_POOL
+from jmanager.utils.manifest import ChecksumError
+from jmanager.utils.mirrors import MirrorSelector
+from jmanager.utils.tarball_cache import TarballCache
+from jmanager.utils.tarball_codec import TarballCodec
+from test.globals import TEST_DISTRIBUTION, LocalHTTPServer, QuietHTTPRequestHandler, RangeHTTPRequestHandler, \
+    create_dummy_tarball_in_folder
 
 TEMPORARY_RELEASE_FTP_DIR = "releases/amd64/12.0-RELEASE"
 TEMPORARY_SNAPSHOT_FTP_DIR = "snapshots/amd64/12.0-STABLE"
@@ -18,6 +33,7 @@ class MockingFetcher(HTTPFetcher):
     FTP_BASE_DIRECTORY = PosixPath()
 
     def __init__(self):
+        super().__init__()
         self.tmp_dir = mkdtemp()
         self.SERVER_URL = f"file://{self.tmp_dir}"
 
@@ -28,6 +44,8 @@ class MockingFetcher(HTTPFetcher):
 
             with open(f"{temporary_folder}/base.txz", "w") as base_file:
                 base_file.write("base.txz")
+            with open(f"{temporary_folder}/MANIFEST", "w") as manifest_file:
+                manifest_file.write(f"base.txz\t{hashlib.sha256(b'base.txz').hexdigest()}\t1\tbase\t\"base\"\ton\n")
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -91,3 +109,776 @@ class TestFetchUtils:
                     components=[Component.BASE],
                     temp_dir=PosixPath('/tmp'),
                     callback=callback_function)
+
+
+class ConcurrencyCountingHandler(QuietHTTPRequestHandler):
+    lock = Lock()
+    active_requests = 0
+    max_active_requests = 0
+
+    def do_GET(self):
+        with ConcurrencyCountingHandler.lock:
+            ConcurrencyCountingHandler.active_requests += 1
+            ConcurrencyCountingHandler.max_active_requests = max(ConcurrencyCountingHandler.max_active_requests,
+                                                                 ConcurrencyCountingHandler.active_requests)
+        try:
+            sleep(0.2)
+            super().do_GET()
+        finally:
+            with ConcurrencyCountingHandler.lock:
+                ConcurrencyCountingHandler.active_requests -= 1
+
+    @staticmethod
+    def reset():
+        ConcurrencyCountingHandler.active_requests = 0
+        ConcurrencyCountingHandler.max_active_requests = 0
+
+
+TEST_COMPONENTS = [Component.BASE, Component.LIB32, Component.SRC]
+
+
+def create_mirror_folder(path_to_mirror: PosixPath, directory: str = TEMPORARY_RELEASE_FTP_DIR,
+                         components=TEST_COMPONENTS, size: int = 64 * 1024):
+    os.makedirs(path_to_mirror.joinpath(directory).as_posix(), exist_ok=True)
+    manifest_lines = []
+    for component in components:
+        content = os.urandom(size)
+        with open(path_to_mirror.joinpath(directory, f"{component.value}.txz").as_posix(), 'wb') as tarball:
+            tarball.write(content)
+        manifest_lines.append(f"{component.value}.txz\t{hashlib.sha256(content).hexdigest()}\t1\t"
+                              f"{component.value}\t\"{component.value}\"\ton")
+
+    with open(path_to_mirror.joinpath(directory, 'MANIFEST').as_posix(), 'w') as manifest_file:
+        manifest_file.write('\n'.join(manifest_lines) + '\n')
+
+
+class LocalServerFetcher(HTTPFetcher):
+    FTP_BASE_DIRECTORY = PosixPath()
+
+    def __init__(self, server_url: str, max_workers: int = HTTPFetcher.MAX_WORKERS,
+                 tarball_cache: TarballCache = None, segments: int = HTTPFetcher.SEGMENTS,
+                 segment_threshold: int = HTTPFetcher.SEGMENT_THRESHOLD, mirror_selector: MirrorSelector = None,
+                 connection_pool: ConnectionPool = HTTP_CONNECTION_POOL, bandwidth_flow: BandwidthFlow = None,
+                 download_dir: PosixPath = None):
+        super().__init__(max_workers=max_workers, tarball_cache=tarball_cache, segments=segments,
+                         segment_threshold=segment_threshold, mirror_selector=mirror_selector,
+                         connection_pool=connection_pool, bandwidth_flow=bandwidth_flow, download_dir=download_dir)
+        self.SERVER_URL = server_url
+
+
+class TestParallelFetch:
+    def test_invalid_number_of_workers(self):
+        with pytest.raises(ValueError):
+            HTTPFetcher(max_workers=0)
+
+    def test_invalid_number_of_segments(self):
+        with pytest.raises(ValueError):
+            HTTPFetcher(segments=0)
+
+    def test_fetch_components_from_local_server(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir)) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url)
+                http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                 architecture=TEST_DISTRIBUTION.architecture,
+                                                 components=TEST_COMPONENTS,
+                                                 temp_dir=PosixPath(temp_dir))
+
+            for component in TEST_COMPONENTS:
+                tarball_name = f"{component.value}.txz"
+                with open(PosixPath(temp_dir).joinpath(tarball_name).as_posix(), 'rb') as fetched_file, \
+                        open(PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, tarball_name).as_posix(),
+                             'rb') as original_file:
+                    assert fetched_file.read() == original_file.read()
+
+    @pytest.mark.parametrize('max_workers', [1, 2, 3])
+    def test_concurrency_limit(self, max_workers: int):
+        ConcurrencyCountingHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=ConcurrencyCountingHandler) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, max_workers=max_workers)
+                http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                 architecture=TEST_DISTRIBUTION.architecture,
+                                                 components=TEST_COMPONENTS,
+                                                 temp_dir=PosixPath(temp_dir))
+        assert ConcurrencyCountingHandler.max_active_requests == max_workers
+
+    def test_progress_per_file(self):
+        progress = {}
+
+        def _callback(msg: str, received_bytes: int, total_bytes: int, speed: float):
+            progress[msg] = (received_bytes, total_bytes)
+
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir)) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, max_workers=3)
+                http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                 architecture=TEST_DISTRIBUTION.architecture,
+                                                 components=TEST_COMPONENTS,
+                                                 temp_dir=PosixPath(temp_dir),
+                                                 callback=_callback)
+        assert len(progress) == len(TEST_COMPONENTS)
+        for received_bytes, total_bytes in progress.values():
+            assert received_bytes == total_bytes
+
+    def test_missing_component_raises(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'lib32.txz').unlink()
+            with LocalHTTPServer(PosixPath(mirror_dir)) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url)
+                with pytest.raises(URLError):
+                    http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                     architecture=TEST_DISTRIBUTION.architecture,
+                                                     components=TEST_COMPONENTS,
+                                                     temp_dir=PosixPath(temp_dir))
+
+    def test_corrupt_component_is_rejected(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz').write_bytes(b'corrupt')
+            with LocalHTTPServer(PosixPath(mirror_dir)) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url)
+                with pytest.raises(ChecksumError, match=r"Checksum mismatch for 'base.txz'"):
+                    http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                     architecture=TEST_DISTRIBUTION.architecture,
+                                                     components=[Component.BASE],
+                                                     temp_dir=PosixPath(temp_dir))
+
+            assert os.listdir(temp_dir) == []
+
+
+class TestCachedFetch:
+    def test_fetch_populates_cache(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir, \
+                TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir)) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, tarball_cache=tarball_cache)
+                http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                 architecture=TEST_DISTRIBUTION.architecture,
+                                                 components=TEST_COMPONENTS,
+                                                 temp_dir=PosixPath(temp_dir))
+
+            cached_components = [entry.component for entry in tarball_cache.list_entries()]
+            assert sorted(cached_components) == sorted([Component.MANIFEST, *TEST_COMPONENTS])
+
+    def test_cache_hits_do_not_use_the_network(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir)) as server:
+                server_url = server.url
+                with TemporaryDirectory() as temp_dir:
+                    LocalServerFetcher(server_url=server_url, tarball_cache=tarball_cache).fetch_tarballs_into(
+                        version=TEST_DISTRIBUTION.version, architecture=TEST_DISTRIBUTION.architecture,
+                        components=TEST_COMPONENTS, temp_dir=PosixPath(temp_dir))
+
+            with TemporaryDirectory() as temp_dir:
+                LocalServerFetcher(server_url=server_url, tarball_cache=tarball_cache).fetch_tarballs_into(
+                    version=TEST_DISTRIBUTION.version, architecture=TEST_DISTRIBUTION.architecture,
+                    components=TEST_COMPONENTS, temp_dir=PosixPath(temp_dir))
+
+                for component in TEST_COMPONENTS:
+                    tarball_name = f"{component.value}.txz"
+                    fetched_file = PosixPath(temp_dir).joinpath(tarball_name)
+                    original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, tarball_name)
+                    assert fetched_file.read_bytes() == original_file.read_bytes()
+
+    def test_checksum_mismatch(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir, \
+                TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz').write_bytes(b'corrupted')
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir)) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, tarball_cache=tarball_cache)
+                with pytest.raises(ChecksumError):
+                    http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                     architecture=TEST_DISTRIBUTION.architecture,
+                                                     components=[Component.BASE],
+                                                     temp_dir=PosixPath(temp_dir))
+            assert tarball_cache.lookup(TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture,
+                                        Component.BASE) is None
+
+    def test_cache_hits_use_the_fast_copy(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir:
+            create_tarball_mirror_folder(PosixPath(mirror_dir))
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir), codec=TarballCodec.GZIP)
+            with LocalHTTPServer(PosixPath(mirror_dir)) as server:
+                for extension in ['txz', 'tgz']:
+                    with TemporaryDirectory() as temp_dir:
+                        LocalServerFetcher(server_url=server.url, tarball_cache=tarball_cache).fetch_tarballs_into(
+                            version=TEST_DISTRIBUTION.version, architecture=TEST_DISTRIBUTION.architecture,
+                            components=TEST_COMPONENTS, temp_dir=PosixPath(temp_dir))
+
+                        assert sorted(os.listdir(temp_dir)) == sorted(f"{component.value}.{extension}"
+                                                                      for component in TEST_COMPONENTS)
+                    tarball_cache.wait_for_fast_copies()
+
+
+class TestReadBlocks:
+    def test_block_size_grows_up_to_the_maximum(self):
+        data = os.urandom(2 * HTTPFetcher.MAX_BLOCK_SIZE + 123)
+        blocks = []
+        buffers = set()
+        for block in HTTPFetcher().read_blocks(io.BytesIO(data)):
+            blocks.append(bytes(block))
+            buffers.add(id(block.obj))
+
+        assert b''.join(blocks) == data
+        assert len(blocks[0]) == HTTPFetcher.BLOCK_SIZE
+        assert max([len(block) for block in blocks]) == HTTPFetcher.MAX_BLOCK_SIZE
+        assert len(buffers) < len(blocks)
+
+    def test_read_size_limit(self):
+        data = os.urandom(HTTPFetcher.BLOCK_SIZE * 3)
+        response = io.BytesIO(data)
+        blocks = [bytes(block) for block in HTTPFetcher().read_blocks(response, size=HTTPFetcher.BLOCK_SIZE + 10)]
+
+        assert b''.join(blocks) == data[:HTTPFetcher.BLOCK_SIZE + 10]
+        assert response.tell() == HTTPFetcher.BLOCK_SIZE + 10
+
+
+class StatusRecordingHandler(RangeHTTPRequestHandler):
+    statuses = []
+
+    def send_response(self, code, message=None):
+        StatusRecordingHandler.statuses.append((self.command, PosixPath(self.path).name, code))
+        super().send_response(code, message)
+
+
+class TestSnapshotRevalidation:
+    SNAPSHOT_VERSION = Version(major=12, minor=0, version_type=VersionType.STABLE)
+
+    def fetch_snapshot(self, server_url: str, tarball_cache: TarballCache) -> PosixPath:
+        temp_dir = PosixPath(mkdtemp())
+        LocalServerFetcher(server_url=server_url, tarball_cache=tarball_cache).fetch_tarballs_into(
+            version=self.SNAPSHOT_VERSION, architecture=Architecture.AMD64, components=[Component.BASE],
+            temp_dir=temp_dir)
+        return temp_dir
+
+    def test_unchanged_manifest_costs_a_round_trip(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir:
+            create_mirror_folder(PosixPath(mirror_dir), directory=TEMPORARY_SNAPSHOT_FTP_DIR)
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=StatusRecordingHandler) as server:
+                shutil.rmtree(self.fetch_snapshot(server.url, tarball_cache).as_posix())
+                manifest_entry = tarball_cache.get_entry(self.SNAPSHOT_VERSION, Architecture.AMD64,
+                                                         Component.MANIFEST)
+                assert manifest_entry.etag is not None and manifest_entry.last_modified is not None
+
+                StatusRecordingHandler.statuses = []
+                shutil.rmtree(self.fetch_snapshot(server.url, tarball_cache).as_posix())
+                assert StatusRecordingHandler.statuses == [('GET', 'MANIFEST', 304)]
+
+    def test_changed_manifest_is_fetched_again(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir:
+            create_mirror_folder(PosixPath(mirror_dir), directory=TEMPORARY_SNAPSHOT_FTP_DIR)
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=StatusRecordingHandler) as server:
+                shutil.rmtree(self.fetch_snapshot(server.url, tarball_cache).as_posix())
+
+                create_mirror_folder(PosixPath(mirror_dir), directory=TEMPORARY_SNAPSHOT_FTP_DIR)
+                StatusRecordingHandler.statuses = []
+                temp_dir = self.fetch_snapshot(server.url, tarball_cache)
+                try:
+                    assert ('GET', 'MANIFEST', 200) in StatusRecordingHandler.statuses
+                    assert ('GET', 'base.txz', 200) in StatusRecordingHandler.statuses
+                    assert temp_dir.joinpath('base.txz').read_bytes() == \
+                        PosixPath(mirror_dir).joinpath(TEMPORARY_SNAPSHOT_FTP_DIR, 'base.txz').read_bytes()
+                finally:
+                    shutil.rmtree(temp_dir.as_posix())
+
+    def test_upstream_modification_time(self):
+        with TemporaryDirectory() as mirror_dir:
+            create_mirror_folder(PosixPath(mirror_dir), directory=TEMPORARY_SNAPSHOT_FTP_DIR)
+            manifest_path = PosixPath(mirror_dir).joinpath(TEMPORARY_SNAPSHOT_FTP_DIR, 'MANIFEST')
+            os.utime(manifest_path.as_posix(), (1600000000, 1600000000))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url)
+                assert http_fetcher.get_upstream_modification_time(self.SNAPSHOT_VERSION,
+                                                                   Architecture.AMD64) == 1600000000
+                assert http_fetcher.get_upstream_modification_time(Version(13, 0, VersionType.CURRENT),
+                                                                   Architecture.AMD64) is None
+
+
+class RecordingRangeHandler(RangeHTTPRequestHandler):
+    lock = Lock()
+    range_headers = []
+    drop_connection = False
+
+    def do_GET(self):
+        self.drop_this_connection = False
+        if self.path.endswith('.txz'):
+            with RecordingRangeHandler.lock:
+                RecordingRangeHandler.range_headers.append(self.headers.get('Range'))
+                self.drop_this_connection = RecordingRangeHandler.drop_connection
+                RecordingRangeHandler.drop_connection = False
+        super().do_GET()
+
+    def write_body(self, body: bytes):
+        if self.drop_this_connection:
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        super().write_body(body)
+
+    @staticmethod
+    def reset(drop_connection: bool = False):
+        RecordingRangeHandler.range_headers = []
+        RecordingRangeHandler.drop_connection = drop_connection
+
+
+class TestResumableFetch:
+    def test_resume_after_connection_drop(self):
+        RecordingRangeHandler.reset(drop_connection=True)
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RecordingRangeHandler) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url)
+                destination = PosixPath(temp_dir).joinpath('base.txz')
+                http_fetcher.fetch_file(url=f"{server.url}/{TEMPORARY_RELEASE_FTP_DIR}/base.txz",
+                                        destination=destination)
+
+            assert destination.read_bytes() == original_file.read_bytes()
+            assert RecordingRangeHandler.range_headers == [None, f"bytes={original_file.stat().st_size // 2}-"]
+            assert [path.name for path in PosixPath(temp_dir).iterdir()] == ['base.txz']
+
+    def test_resume_partial_file_from_previous_process(self):
+        RecordingRangeHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            destination = PosixPath(temp_dir).joinpath('base.txz')
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RecordingRangeHandler) as server:
+                url = f"{server.url}/{TEMPORARY_RELEASE_FTP_DIR}/base.txz"
+                partial_file = HTTPFetcher.get_partial_path(destination)
+                partial_file.write_bytes(original_file.read_bytes()[:1000])
+                HTTPFetcher.write_partial_state(HTTPFetcher.get_partial_state_path(partial_file),
+                                                {'url': url, 'size': original_file.stat().st_size})
+
+                LocalServerFetcher(server_url=server.url).fetch_file(url=url, destination=destination)
+
+            assert destination.read_bytes() == original_file.read_bytes()
+            assert RecordingRangeHandler.range_headers == ["bytes=1000-"]
+
+    def test_resume_from_download_folder_without_cache(self):
+        RecordingRangeHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as download_dir, \
+                TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RecordingRangeHandler) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, download_dir=PosixPath(download_dir))
+                download_path = http_fetcher.get_component_download_path(
+                    TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture, Component.BASE,
+                    destination=PosixPath(temp_dir).joinpath('base.txz'))
+                assert download_path.parent == PosixPath(download_dir)
+                partial_file = HTTPFetcher.get_partial_path(download_path)
+                partial_file.write_bytes(original_file.read_bytes()[:1000])
+                HTTPFetcher.write_partial_state(HTTPFetcher.get_partial_state_path(partial_file), {
+                    'url': f"{server.url}/{TEMPORARY_RELEASE_FTP_DIR}/base.txz",
+                    'size': original_file.stat().st_size
+                })
+
+                http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                 architecture=TEST_DISTRIBUTION.architecture,
+                                                 components=[Component.BASE],
+                                                 temp_dir=PosixPath(temp_dir))
+
+            assert PosixPath(temp_dir).joinpath('base.txz').read_bytes() == original_file.read_bytes()
+            assert RecordingRangeHandler.range_headers == ["bytes=1000-"]
+            assert os.listdir(download_dir) == []
+
+    def test_full_refetch_when_validator_changed(self):
+        RecordingRangeHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            destination = PosixPath(temp_dir).joinpath('base.txz')
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RecordingRangeHandler) as server:
+                url = f"{server.url}/{TEMPORARY_RELEASE_FTP_DIR}/base.txz"
+                partial_file = HTTPFetcher.get_partial_path(destination)
+                partial_file.write_bytes(b'stale content')
+                HTTPFetcher.write_partial_state(HTTPFetcher.get_partial_state_path(partial_file),
+                                                {'url': url, 'etag': '"outdated"'})
+
+                LocalServerFetcher(server_url=server.url).fetch_file(url=url, destination=destination)
+
+            assert destination.read_bytes() == original_file.read_bytes()
+
+    def test_full_refetch_without_range_support(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            destination = PosixPath(temp_dir).joinpath('base.txz')
+            with LocalHTTPServer(PosixPath(mirror_dir)) as server:
+                url = f"{server.url}/{TEMPORARY_RELEASE_FTP_DIR}/base.txz"
+                partial_file = HTTPFetcher.get_partial_path(destination)
+                partial_file.write_bytes(original_file.read_bytes()[:1000])
+                HTTPFetcher.write_partial_state(HTTPFetcher.get_partial_state_path(partial_file), {'url': url})
+
+                LocalServerFetcher(server_url=server.url).fetch_file(url=url, destination=destination)
+
+            assert destination.read_bytes() == original_file.read_bytes()
+
+    def test_cached_download_cleans_download_folder(self):
+        RecordingRangeHandler.reset(drop_connection=True)
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir, \
+                TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RecordingRangeHandler) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, tarball_cache=tarball_cache)
+                http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                 architecture=TEST_DISTRIBUTION.architecture,
+                                                 components=[Component.BASE],
+                                                 temp_dir=PosixPath(temp_dir))
+
+            assert PosixPath(temp_dir).joinpath('base.txz').is_file()
+            assert not list(PosixPath(cache_dir).joinpath(TarballCache.DOWNLOADS_FOLDER).iterdir())
+
+
+class RangeIgnoringHandler(RecordingRangeHandler):
+    """
+    Advertises range requests, but answers all of them with the whole file.
+    """
+
+    def send_file(self, send_body: bool):
+        del self.headers['Range']
+        super().send_file(send_body=send_body)
+
+
+class TestSegmentedFetch:
+    @staticmethod
+    def fetch_base_tarball(mirror_dir: str, temp_dir: str, handler_class=RecordingRangeHandler,
+                           segments: int = 4, callback=None) -> PosixPath:
+        destination = PosixPath(temp_dir).joinpath('base.txz')
+        with LocalHTTPServer(PosixPath(mirror_dir), handler_class=handler_class) as server:
+            http_fetcher = LocalServerFetcher(server_url=server.url, segments=segments, segment_threshold=1024)
+            http_fetcher.fetch_file(url=f"{server.url}/{TEMPORARY_RELEASE_FTP_DIR}/base.txz",
+                                    destination=destination, callback=callback)
+        return destination
+
+    def test_segmented_download(self):
+        RecordingRangeHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE], size=64 * 1024 + 3)
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            destination = self.fetch_base_tarball(mirror_dir, temp_dir)
+
+            assert destination.read_bytes() == original_file.read_bytes()
+            assert sorted(RecordingRangeHandler.range_headers) == sorted([
+                "bytes=0-16384", "bytes=16385-32769", "bytes=32770-49154", "bytes=49155-65538"
+            ])
+            assert [path.name for path in PosixPath(temp_dir).iterdir()] == ['base.txz']
+
+    def test_segmented_download_progress(self):
+        progress = []
+
+        def _callback(msg: str, received_bytes: int, total_bytes: int, speed: float):
+            progress.append((received_bytes, total_bytes))
+
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            self.fetch_base_tarball(mirror_dir, temp_dir, callback=_callback)
+
+        assert progress[-1] == (64 * 1024, 64 * 1024)
+        assert [received for received, _ in progress] == sorted([received for received, _ in progress])
+
+    def test_segmented_download_resumes_dropped_segment(self):
+        RecordingRangeHandler.reset(drop_connection=True)
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            destination = self.fetch_base_tarball(mirror_dir, temp_dir)
+
+            assert destination.read_bytes() == original_file.read_bytes()
+            first_byte, last_byte = RecordingRangeHandler.range_headers[0].replace('bytes=', '').split('-')
+            resumed_segment = f"bytes={int(first_byte) + 8192}-{last_byte}"
+            assert resumed_segment in RecordingRangeHandler.range_headers[4:]
+
+    def test_segmented_download_is_verified(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE], size=256 * 1024 + 7)
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            checksum = hashlib.sha256(original_file.read_bytes()).hexdigest()
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, segments=4, segment_threshold=1024)
+                state = http_fetcher.fetch_file(url=f"{server.url}/{TEMPORARY_RELEASE_FTP_DIR}/base.txz",
+                                                destination=PosixPath(temp_dir).joinpath('base.txz'),
+                                                checksum=checksum)
+                assert state['sha256'] == checksum
+
+                with pytest.raises(ChecksumError):
+                    http_fetcher.fetch_file(url=f"{server.url}/{TEMPORARY_RELEASE_FTP_DIR}/base.txz",
+                                            destination=PosixPath(temp_dir).joinpath('copy.txz'),
+                                            checksum='0' * 64)
+            assert sorted(os.listdir(temp_dir)) == ['base.txz']
+
+    def test_small_file_is_not_segmented(self):
+        RecordingRangeHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE], size=512)
+            self.fetch_base_tarball(mirror_dir, temp_dir)
+
+        assert RecordingRangeHandler.range_headers == [None]
+
+    def test_server_without_range_support(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            destination = self.fetch_base_tarball(mirror_dir, temp_dir, handler_class=QuietHTTPRequestHandler)
+
+            assert destination.read_bytes() == original_file.read_bytes()
+
+    def test_server_ignoring_range_requests(self):
+        RecordingRangeHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeIgnoringHandler) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, segments=4, segment_threshold=1024)
+                url = f"{server.url}/{TEMPORARY_RELEASE_FTP_DIR}/base.txz"
+                destination = PosixPath(temp_dir).joinpath('base.txz')
+                http_fetcher.fetch_file(url=url, destination=destination)
+                assert destination.read_bytes() == original_file.read_bytes()
+                assert RecordingRangeHandler.range_headers[-1] is None
+                assert len(RecordingRangeHandler.range_headers) <= 5
+
+                RecordingRangeHandler.reset()
+                http_fetcher.fetch_file(url=url, destination=PosixPath(temp_dir).joinpath('copy.txz'))
+                assert RecordingRangeHandler.range_headers == [None]
+            assert sorted(os.listdir(temp_dir)) == ['base.txz', 'copy.txz']
+
+
+def create_tarball_mirror_folder(path_to_mirror: PosixPath) -> PosixPath:
+    release_folder = path_to_mirror.joinpath(TEMPORARY_RELEASE_FTP_DIR)
+    create_dummy_tarball_in_folder(release_folder)
+    with open(release_folder.joinpath('MANIFEST').as_posix(), 'w') as manifest_file:
+        for component in TEST_COMPONENTS:
+            tarball = release_folder.joinpath(f"{component.value}.txz")
+            checksum = hashlib.sha256(tarball.read_bytes()).hexdigest()
+            manifest_file.write(f"{tarball.name}\t{checksum}\t1\t{component.value}\t\"{component.value}\"\ton\n")
+    return release_folder
+
+
+class TestStreamingFetch:
+    @staticmethod
+    def extract_stream(http_fetcher: HTTPFetcher, component: Component, jail_dir: str):
+        with http_fetcher.open_tarball_stream(TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture,
+                                              component) as tarball_stream:
+            extract_tarball_stream_into(jail_path=PosixPath(jail_dir), tarball_stream=tarball_stream,
+                                        tarball_name=f"{component.value}.txz", callback=None)
+
+    def test_stream_and_extract(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as jail_dir:
+            create_tarball_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                self.extract_stream(LocalServerFetcher(server_url=server.url), Component.BASE, jail_dir)
+
+            assert PosixPath(jail_dir).joinpath('jmanager', 'models', 'distribution.py').is_file()
+
+    def test_stream_resumes_dropped_connection(self):
+        RecordingRangeHandler.reset(drop_connection=True)
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as jail_dir:
+            release_folder = create_tarball_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RecordingRangeHandler) as server:
+                self.extract_stream(LocalServerFetcher(server_url=server.url), Component.SRC, jail_dir)
+
+            assert PosixPath(jail_dir).joinpath('jmanager', 'utils', 'fetch.py').is_file()
+            tarball_size = release_folder.joinpath('src.txz').stat().st_size
+            assert RecordingRangeHandler.range_headers == [None, f"bytes={tarball_size // 2}-"]
+
+    def test_stream_populates_cache(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir, \
+                TemporaryDirectory() as jail_dir:
+            release_folder = create_tarball_mirror_folder(PosixPath(mirror_dir))
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                server_url = server.url
+                self.extract_stream(LocalServerFetcher(server_url=server_url, tarball_cache=tarball_cache),
+                                    Component.BASE, jail_dir)
+
+            cached_file = tarball_cache.lookup(TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture,
+                                               Component.BASE)
+            assert cached_file.read_bytes() == release_folder.joinpath('base.txz').read_bytes()
+
+            with TemporaryDirectory() as second_jail_dir:
+                self.extract_stream(LocalServerFetcher(server_url=server_url, tarball_cache=tarball_cache),
+                                    Component.BASE, second_jail_dir)
+                assert PosixPath(second_jail_dir).joinpath('jmanager', 'models', 'distribution.py').is_file()
+
+    def test_stream_checksum_mismatch(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir, \
+                TemporaryDirectory() as jail_dir:
+            release_folder = create_tarball_mirror_folder(PosixPath(mirror_dir))
+            shutil.copyfile(release_folder.joinpath('lib32.txz').as_posix(),
+                            release_folder.joinpath('base.txz').as_posix())
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                with pytest.raises(ChecksumError):
+                    self.extract_stream(LocalServerFetcher(server_url=server.url, tarball_cache=tarball_cache),
+                                        Component.BASE, jail_dir)
+
+            assert tarball_cache.lookup(TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture,
+                                        Component.BASE) is None
+            assert not list(PosixPath(cache_dir).joinpath(TarballCache.DOWNLOADS_FOLDER).iterdir())
+
+    def test_stream_cache_hit_reads_the_fast_copy(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as cache_dir, \
+                TemporaryDirectory() as jail_dir:
+            create_tarball_mirror_folder(PosixPath(mirror_dir))
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir), codec=TarballCodec.TAR)
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, tarball_cache=tarball_cache)
+                self.extract_stream(http_fetcher, Component.BASE, jail_dir)
+            tarball_cache.wait_for_fast_copies()
+
+            with http_fetcher.open_tarball_stream(TEST_DISTRIBUTION.version, TEST_DISTRIBUTION.architecture,
+                                                  Component.BASE) as tarball_stream:
+                assert tarball_stream.codec == TarballCodec.TAR
+                extract_tarball_stream_into(jail_path=PosixPath(jail_dir), tarball_stream=tarball_stream,
+                                            tarball_name='base.tar', callback=None)
+            assert PosixPath(jail_dir).joinpath('jmanager', 'models', 'distribution.py').is_file()
+
+
+class FailingMirrorHandler(RangeHTTPRequestHandler):
+    """
+    Sends half of every tarball, then either closes the connection or stalls.
+    """
+    stall = 0.0
+
+    def write_body(self, body: bytes):
+        if not self.path.endswith('.txz'):
+            super().write_body(body)
+            return
+        self.wfile.write(body[:len(body) // 2])
+        self.wfile.flush()
+        sleep(self.stall)
+        self.close_connection = True
+
+
+class StallingMirrorHandler(FailingMirrorHandler):
+    stall = 2.0
+
+
+@contextmanager
+def unreachable_server() -> Iterator[str]:
+    """
+    URL of a port nothing listens on, so connections to it are refused.
+    """
+    with socket.socket() as server_socket:
+        server_socket.bind(('127.0.0.1', 0))
+        host, port = server_socket.getsockname()
+    yield f"http://{host}:{port}"
+
+
+@contextmanager
+def silent_server() -> Iterator[str]:
+    """
+    URL of a server accepting connections but never answering the requests.
+    """
+    with socket.socket() as server_socket:
+        server_socket.bind(('127.0.0.1', 0))
+        server_socket.listen(16)
+        host, port = server_socket.getsockname()
+        yield f"http://{host}:{port}"
+
+
+
+class TestMirrorFailover:
+    @staticmethod
+    def get_mirror_selector(mirrors: List[str], temp_dir: str) -> MirrorSelector:
+        ranking_file = PosixPath(temp_dir).joinpath('mirrors.yaml')
+        mirror_selector = MirrorSelector(mirrors=mirrors, ranking_file=ranking_file)
+        mirror_selector.write_ranking_file({'ranked_at': time(), 'mirrors': mirrors})
+        return mirror_selector
+
+    @pytest.mark.parametrize('handler_class', [FailingMirrorHandler, StallingMirrorHandler])
+    def test_download_moves_to_the_next_mirror(self, handler_class):
+        RecordingRangeHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=handler_class) as failing_server, \
+                    LocalHTTPServer(PosixPath(mirror_dir), handler_class=RecordingRangeHandler) as server:
+                mirror_selector = self.get_mirror_selector([failing_server.url, server.url], temp_dir)
+                http_fetcher = LocalServerFetcher(server_url=server.url, mirror_selector=mirror_selector)
+                http_fetcher.TIMEOUT = 0.5
+                http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                 architecture=TEST_DISTRIBUTION.architecture,
+                                                 components=[Component.BASE],
+                                                 temp_dir=PosixPath(temp_dir))
+
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            assert PosixPath(temp_dir).joinpath('base.txz').read_bytes() == original_file.read_bytes()
+            if handler_class == FailingMirrorHandler:
+                assert RecordingRangeHandler.range_headers == [f"bytes={original_file.stat().st_size // 2}-"]
+            else:
+                resumed_offsets = [int(header[len('bytes='):-1]) if header else 0
+                                   for header in RecordingRangeHandler.range_headers]
+                assert len(resumed_offsets) == 1 and resumed_offsets[0] <= original_file.stat().st_size // 2
+            assert mirror_selector.get_ranked_mirrors(probe_path='') == [server.url, failing_server.url]
+
+    @pytest.mark.parametrize('dead_server', [unreachable_server, silent_server], ids=['refused', 'silent'])
+    def test_download_skips_a_dead_mirror(self, dead_server):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with dead_server() as dead_server_url, \
+                    LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                mirror_selector = self.get_mirror_selector([dead_server_url, server.url], temp_dir)
+                http_fetcher = LocalServerFetcher(server_url=server.url, mirror_selector=mirror_selector)
+                http_fetcher.TIMEOUT = 0.5
+                http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                 architecture=TEST_DISTRIBUTION.architecture,
+                                                 components=[Component.BASE],
+                                                 temp_dir=PosixPath(temp_dir))
+
+            original_file = PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz')
+            assert PosixPath(temp_dir).joinpath('base.txz').read_bytes() == original_file.read_bytes()
+            assert mirror_selector.get_ranked_mirrors(probe_path='') == [server.url, dead_server_url]
+
+    def test_http_errors_are_not_retried_on_other_mirrors(self):
+        RecordingRangeHandler.reset()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            PosixPath(mirror_dir).joinpath(TEMPORARY_RELEASE_FTP_DIR, 'base.txz').unlink()
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as failing_server, \
+                    LocalHTTPServer(PosixPath(mirror_dir), handler_class=RecordingRangeHandler) as server:
+                mirror_selector = self.get_mirror_selector([failing_server.url, server.url], temp_dir)
+                http_fetcher = LocalServerFetcher(server_url=server.url, mirror_selector=mirror_selector)
+                with pytest.raises(URLError) as error:
+                    http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                     architecture=TEST_DISTRIBUTION.architecture,
+                                                     components=[Component.BASE],
+                                                     temp_dir=PosixPath(temp_dir))
+            assert error.value.code == 404
+            assert RecordingRangeHandler.range_headers == []
+
+    def test_stream_moves_to_the_next_mirror(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_tarball_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=FailingMirrorHandler) as failing_server, \
+                    LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                mirror_selector = self.get_mirror_selector([failing_server.url, server.url], temp_dir)
+                http_fetcher = LocalServerFetcher(server_url=server.url, mirror_selector=mirror_selector)
+                TestStreamingFetch.extract_stream(http_fetcher, Component.BASE, temp_dir)
+
+            assert PosixPath(temp_dir).joinpath('jmanager', 'models', 'distribution.py').is_file()
+
+    def test_stream_skips_an_unreachable_mirror(self):
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_tarball_mirror_folder(PosixPath(mirror_dir))
+            with unreachable_server() as dead_server_url, \
+                    LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                mirror_selector = self.get_mirror_selector([dead_server_url, server.url], temp_dir)
+                http_fetcher = LocalServerFetcher(server_url=server.url, mirror_selector=mirror_selector)
+                TestStreamingFetch.extract_stream(http_fetcher, Component.BASE, temp_dir)
+
+            assert PosixPath(temp_dir).joinpath('jmanager', 'models', 'distribution.py').is_file()
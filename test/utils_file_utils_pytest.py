@@ -7,7 +7,11 @@ from tempfile import TemporaryDirectory
 
 import pytest
 
-from jmanager.utils.file_utils import set_flags_to_folder_recursively
+from jmanager.models.extraction_profile import ExtractionProfile
+from jmanager.utils.file_utils import set_flags_to_folder_recursively, TarballStream, extract_tarball_stream_into, \
+    extract_tarball_into, remove_immutable_path
+from jmanager.utils.tarball_codec import TarballCodec, encode_tarball
+from test.globals import create_dummy_tarball_in_folder
 
 
 def create_immutable_folder(temp_dir: str):
@@ -50,3 +54,84 @@ class TestFileUtils:
             set_flags_to_folder_recursively(path=PosixPath(temp_dir), flags=not UF_HIDDEN)
             assert_folder_mutable(f"{temp_dir}/sub_dir")
             assert_folder_mutable(temp_dir)
+
+
+class TestRemoveImmutablePath:
+    def test_remove_tree_without_following_links(self):
+        with TemporaryDirectory() as temp_dir, TemporaryDirectory() as outside_dir:
+            tree_path = PosixPath(temp_dir).joinpath('tree')
+            deep_path = tree_path.joinpath(*['folder'] * 50)
+            os.makedirs(deep_path.as_posix())
+            open(deep_path.joinpath('file').as_posix(), 'w').close()
+            open(PosixPath(outside_dir).joinpath('file').as_posix(), 'w').close()
+            os.symlink(outside_dir, tree_path.joinpath('link').as_posix())
+
+            remove_immutable_path(tree_path)
+            assert not tree_path.exists()
+            assert PosixPath(outside_dir).joinpath('file').is_file()
+
+
+class TestTarballStream:
+    def test_observers_and_position(self):
+        with TemporaryDirectory() as temp_dir:
+            path_to_file = PosixPath(temp_dir).joinpath('file')
+            path_to_file.write_bytes(b'0123456789')
+            observed_data = bytearray()
+
+            with TarballStream(raw_stream=open(path_to_file.as_posix(), 'rb'), size=10,
+                               observers=[observed_data.extend]) as tarball_stream:
+                assert tarball_stream.read(4) == b'0123'
+                assert tarball_stream.position == 4
+                tarball_stream.drain()
+                assert tarball_stream.position == tarball_stream.size
+
+            assert observed_data == b'0123456789'
+
+    def test_extract_tarball_stream(self):
+        progress = []
+
+        def _callback(msg: str, iteration: int, total: int):
+            assert msg == "Extracting base.txz"
+            progress.append((iteration, total))
+
+        with TemporaryDirectory() as tarballs_dir, TemporaryDirectory() as jail_dir:
+            create_dummy_tarball_in_folder(PosixPath(tarballs_dir))
+            path_to_tarball = PosixPath(tarballs_dir).joinpath('base.txz')
+            with TarballStream(raw_stream=open(path_to_tarball.as_posix(), 'rb'),
+                               size=path_to_tarball.stat().st_size) as tarball_stream:
+                extract_tarball_stream_into(jail_path=PosixPath(jail_dir), tarball_stream=tarball_stream,
+                                            tarball_name='base.txz', callback=_callback)
+
+            assert PosixPath(jail_dir).joinpath('jmanager', 'models', 'distribution.py').is_file()
+            assert progress[-1] == (path_to_tarball.stat().st_size, path_to_tarball.stat().st_size)
+            assert all(iteration <= total for iteration, total in progress)
+
+    @pytest.mark.parametrize('codec', list(TarballCodec))
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_extract_encoded_tarball(self, codec: TarballCodec, workers: int):
+        with TemporaryDirectory() as tarballs_dir, TemporaryDirectory() as jail_dir:
+            create_dummy_tarball_in_folder(PosixPath(tarballs_dir))
+            path_to_tarball = PosixPath(tarballs_dir).joinpath(f"encoded.{codec.extension}")
+            encode_tarball(PosixPath(tarballs_dir).joinpath('base.txz'), path_to_tarball, codec=codec)
+            assert TarballCodec.from_path(path_to_tarball) == codec
+
+            extract_tarball_into(jail_path=PosixPath(jail_dir), path_to_tarball=path_to_tarball, callback=None,
+                                 workers=workers)
+            assert PosixPath(jail_dir).joinpath('jmanager', 'models', 'distribution.py').is_file()
+
+    @pytest.mark.parametrize('codec', list(TarballCodec))
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_extract_tarball_with_profile(self, codec: TarballCodec, workers: int):
+        profile = ExtractionProfile(name='models', include=['jmanager/models'], exclude=['*/jail*.py'])
+        with TemporaryDirectory() as tarballs_dir, TemporaryDirectory() as jail_dir:
+            create_dummy_tarball_in_folder(PosixPath(tarballs_dir))
+            path_to_tarball = PosixPath(tarballs_dir).joinpath(f"encoded.{codec.extension}")
+            encode_tarball(PosixPath(tarballs_dir).joinpath('src.txz'), path_to_tarball, codec=codec)
+
+            extract_tarball_into(jail_path=PosixPath(jail_dir), path_to_tarball=path_to_tarball, callback=None,
+                                 workers=workers, profile=profile)
+            jail_path = PosixPath(jail_dir).joinpath('jmanager')
+            assert jail_path.joinpath('models', 'distribution.py').is_file()
+            assert not jail_path.joinpath('models', 'jail.py').exists()
+            assert not jail_path.joinpath('utils').exists()
+            assert not jail_path.joinpath('jail_manager.py').exists()
@@ -0,0 +1,133 @@
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from urllib.error import HTTPError
+
+import pytest
+
+from jmanager.utils.http_pool import ConnectionPool, parse_response_head, get_redirection, get_connection_key
+from test.globals import LocalHTTPServer, RangeHTTPRequestHandler, TEST_DISTRIBUTION
+from test.utils_fetch_pytest import create_mirror_folder, LocalServerFetcher, TEMPORARY_RELEASE_FTP_DIR, \
+    TEST_COMPONENTS
+
+BASE_PATH = f"{TEMPORARY_RELEASE_FTP_DIR}/base.txz"
+
+
+class ClosingRangeHandler(RangeHTTPRequestHandler):
+    """
+    Closes the connection after every response without telling the client.
+    """
+
+    def write_body(self, body: bytes):
+        super().write_body(body)
+        self.close_connection = True
+
+
+class RedirectingHandler(RangeHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/redirect/'):
+            self.send_response(302)
+            self.send_header('Location', self.path[len('/redirect'):])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        super().do_GET()
+
+
+class TestConnectionPool:
+    def test_connection_is_reused(self):
+        connection_pool = ConnectionPool()
+        with TemporaryDirectory() as mirror_dir, LocalHTTPServer(PosixPath(mirror_dir),
+                                                                 handler_class=RangeHTTPRequestHandler) as server:
+            create_mirror_folder(PosixPath(mirror_dir))
+            for _ in range(3):
+                with connection_pool.urlopen(f"{server.url}/{BASE_PATH}") as response:
+                    assert len(response.read()) == 64 * 1024
+
+            assert connection_pool.stats.requests == 3
+            assert connection_pool.stats.connections_opened == 1
+            assert connection_pool.stats.connections_reused == 2
+            assert connection_pool.idle_connections == 1
+            connection_pool.clear()
+            assert connection_pool.idle_connections == 0
+
+    def test_unfinished_response_is_not_reused(self):
+        connection_pool = ConnectionPool()
+        with TemporaryDirectory() as mirror_dir, LocalHTTPServer(PosixPath(mirror_dir),
+                                                                 handler_class=RangeHTTPRequestHandler) as server:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with connection_pool.urlopen(f"{server.url}/{BASE_PATH}") as response:
+                response.read(1024)
+            assert connection_pool.idle_connections == 0
+
+            with connection_pool.urlopen(f"{server.url}/{BASE_PATH}") as response:
+                assert len(response.read()) == 64 * 1024
+            assert connection_pool.stats.connections_opened == 2
+
+    def test_connection_closed_by_the_server(self):
+        connection_pool = ConnectionPool()
+        with TemporaryDirectory() as mirror_dir, LocalHTTPServer(PosixPath(mirror_dir),
+                                                                 handler_class=ClosingRangeHandler) as server:
+            create_mirror_folder(PosixPath(mirror_dir))
+            for _ in range(2):
+                with connection_pool.urlopen(f"{server.url}/{BASE_PATH}") as response:
+                    assert len(response.read()) == 64 * 1024
+
+            assert connection_pool.stats.connections_opened == 2
+            assert connection_pool.stats.connections_reused + connection_pool.stats.stale_connections <= 1
+
+    def test_errors_and_redirections(self):
+        connection_pool = ConnectionPool()
+        with TemporaryDirectory() as mirror_dir, LocalHTTPServer(PosixPath(mirror_dir),
+                                                                 handler_class=RedirectingHandler) as server:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with pytest.raises(HTTPError, match='404'):
+                connection_pool.urlopen(f"{server.url}/missing.txz")
+            with connection_pool.urlopen(f"{server.url}/redirect/{BASE_PATH}") as response:
+                assert response.url == f"{server.url}/{BASE_PATH}"
+                assert len(response.read()) == 64 * 1024
+
+            assert connection_pool.stats.connections_opened == 2
+            assert connection_pool.stats.connections_reused == 1
+
+    def test_parse_response_head(self):
+        head = parse_response_head(b"HTTP/1.1 206 Partial Content\r\nContent-Length: 10\r\n"
+                                   b"Content-Range: bytes 0-9/20\r\n\r\n", method='GET')
+        assert (head.status, head.reason) == (206, 'Partial Content')
+        assert head.headers['content-range'] == 'bytes 0-9/20'
+        assert (head.length, head.chunked, head.will_close) == (10, False, False)
+
+        head = parse_response_head(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n", method='GET')
+        assert (head.length, head.chunked, head.will_close) == (None, True, False)
+        head = parse_response_head(b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n", method='HEAD')
+        assert head.length == 0
+        head = parse_response_head(b"HTTP/1.0 200 OK\r\n\r\n", method='GET')
+        assert (head.length, head.will_close) == (None, True)
+
+    def test_redirections_and_connection_keys(self):
+        head = parse_response_head(b"HTTP/1.1 303 See Other\r\nLocation: /other?a=1\r\n\r\n", method='POST')
+        assert get_redirection('http://host/path', method='POST', status=head.status, headers=head.headers) == \
+            ('http://host/other?a=1', 'GET')
+        assert get_connection_key('http://host/other?a=1') == (('http', 'host', 80), '/other?a=1')
+        assert get_connection_key('https://host:8443') == (('https', 'host', 8443), '/')
+
+    def test_other_schemes_use_urllib(self):
+        with TemporaryDirectory() as temp_dir:
+            path_to_file = PosixPath(temp_dir).joinpath('file')
+            path_to_file.write_bytes(b'content')
+            with ConnectionPool().urlopen(f"file://{path_to_file.as_posix()}") as response:
+                assert response.read() == b'content'
+
+    def test_components_share_the_connection(self):
+        connection_pool = ConnectionPool()
+        with TemporaryDirectory() as mirror_dir, TemporaryDirectory() as temp_dir:
+            create_mirror_folder(PosixPath(mirror_dir))
+            with LocalHTTPServer(PosixPath(mirror_dir), handler_class=RangeHTTPRequestHandler) as server:
+                http_fetcher = LocalServerFetcher(server_url=server.url, max_workers=1,
+                                                  connection_pool=connection_pool)
+                for _ in range(2):
+                    http_fetcher.fetch_tarballs_into(version=TEST_DISTRIBUTION.version,
+                                                     architecture=TEST_DISTRIBUTION.architecture,
+                                                     components=TEST_COMPONENTS, temp_dir=PosixPath(temp_dir))
+
+            assert connection_pool.stats.connections_opened == 1
+            assert connection_pool.stats.connections_reused == connection_pool.stats.requests - 1
@@ -0,0 +1,67 @@
+import hashlib
+import os
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from jmanager.models.distribution import Component
+from jmanager.utils.manifest import parse_manifest, get_file_checksum, verify_file_checksum, ChecksumError, \
+    BackgroundHasher
+
+BASE_CHECKSUM = 'a' * 64
+SRC_CHECKSUM = 'b' * 64
+MANIFEST_CONTENT = f"base.txz\t{BASE_CHECKSUM}\t26\tbase\t\"Base system (MANDATORY)\"\ton\n" \
+                   f"src.txz\t{SRC_CHECKSUM.upper()}\t86\tsrc\t\"System source tree\"\toff\n" \
+                   f"unknown.txz\t{'c' * 64}\t1\tunknown\t\"Unknown component\"\toff\n"
+
+
+class TestManifest:
+    def test_parse_manifest(self):
+        checksums = parse_manifest(MANIFEST_CONTENT)
+
+        assert checksums == {Component.BASE: BASE_CHECKSUM, Component.SRC: SRC_CHECKSUM}
+
+    def test_parse_empty_manifest(self):
+        assert parse_manifest('') == {}
+
+    def test_file_checksum(self):
+        with TemporaryDirectory() as temp_dir:
+            path_to_file = PosixPath(temp_dir).joinpath('base.txz')
+            path_to_file.write_bytes(b'base.txz')
+
+            assert get_file_checksum(path_to_file) == hashlib.sha256(b'base.txz').hexdigest()
+            verify_file_checksum(path_to_file, hashlib.sha256(b'base.txz').hexdigest())
+
+    def test_file_checksum_mismatch(self):
+        with TemporaryDirectory() as temp_dir:
+            path_to_file = PosixPath(temp_dir).joinpath('base.txz')
+            path_to_file.write_bytes(b'base.txz')
+
+            with pytest.raises(ChecksumError, match=r"Checksum mismatch for 'base.txz'"):
+                verify_file_checksum(path_to_file, BASE_CHECKSUM)
+
+    def test_background_hasher_follows_the_written_prefix(self):
+        content = os.urandom(3 * 1024 * 1024 + 5)
+        with TemporaryDirectory() as temp_dir:
+            path_to_file = PosixPath(temp_dir).joinpath('base.txz')
+            with open(path_to_file.as_posix(), 'wb') as written_file:
+                written_file.write(content[:1024])
+                written_file.flush()
+                with BackgroundHasher(path_to_file, size=len(content), available=1024) as hasher:
+                    for position in range(1024, len(content), 256 * 1024):
+                        written_file.write(content[position:position + 256 * 1024])
+                        written_file.flush()
+                        hasher.update(min(position + 256 * 1024, len(content)))
+
+            assert hasher.hexdigest() == hashlib.sha256(content).hexdigest()
+
+    def test_background_hasher_of_a_short_file(self):
+        with TemporaryDirectory() as temp_dir:
+            path_to_file = PosixPath(temp_dir).joinpath('base.txz')
+            path_to_file.write_bytes(b'base')
+            with BackgroundHasher(path_to_file, size=8) as hasher:
+                hasher.update(4)
+
+            with pytest.raises(ChecksumError, match=r"The checksum of 'base.txz' was not computed"):
+                hasher.hexdigest()
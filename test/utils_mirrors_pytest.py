@@ -0,0 +1,105 @@
+from contextlib import ExitStack
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+from time import sleep
+
+import pytest
+
+from jmanager.models.distribution import Component
+from jmanager.utils.mirrors import MirrorSelector
+from test.globals import LocalHTTPServer, RangeHTTPRequestHandler
+from test.utils_fetch_pytest import create_mirror_folder, TEMPORARY_RELEASE_FTP_DIR
+
+PROBE_PATH = f"{TEMPORARY_RELEASE_FTP_DIR}/base.txz"
+
+
+class DelayedRangeHandler(RangeHTTPRequestHandler):
+    delay = 0.0
+    requests = []
+
+    def do_GET(self):
+        DelayedRangeHandler.requests.append(self.path)
+        sleep(self.delay)
+        super().do_GET()
+
+
+def get_delayed_handler(delay: float):
+    return type('DelayedRangeHandler', (DelayedRangeHandler,), {'delay': delay})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestMirrorSelector:
+    def test_without_mirrors(self):
+        with pytest.raises(ValueError):
+            MirrorSelector(mirrors=[])
+
+    def test_ranking_by_latency(self):
+        with TemporaryDirectory() as mirror_dir, ExitStack() as stack:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            slow, fast, medium = [stack.enter_context(LocalHTTPServer(PosixPath(mirror_dir),
+                                                                      handler_class=get_delayed_handler(delay))).url
+                                  for delay in [0.4, 0.0, 0.2]]
+            mirror_selector = MirrorSelector(mirrors=[slow, f"{fast}/", medium, "http://127.0.0.1:1"])
+
+            assert mirror_selector.get_ranked_mirrors(probe_path=PROBE_PATH) == [fast, medium, slow,
+                                                                                 "http://127.0.0.1:1"]
+
+    def test_ranking_is_kept_for_its_ttl(self):
+        clock = FakeClock()
+        with TemporaryDirectory() as mirror_dir, LocalHTTPServer(PosixPath(mirror_dir),
+                                                                 handler_class=DelayedRangeHandler) as server:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            ranking_file = PosixPath(mirror_dir).joinpath('mirrors.yaml')
+            DelayedRangeHandler.requests = []
+
+            MirrorSelector(mirrors=[server.url], ranking_file=ranking_file, ranking_ttl=60,
+                           clock=clock).get_ranked_mirrors(probe_path=PROBE_PATH)
+            assert ranking_file.is_file()
+            assert len(DelayedRangeHandler.requests) == 1
+
+            clock.now += 30
+            mirror_selector = MirrorSelector(mirrors=[server.url], ranking_file=ranking_file, ranking_ttl=60,
+                                             clock=clock)
+            assert mirror_selector.get_ranked_mirrors(probe_path=PROBE_PATH) == [server.url]
+            assert len(DelayedRangeHandler.requests) == 1
+
+            clock.now += 31
+            assert mirror_selector.get_ranked_mirrors(probe_path=PROBE_PATH) == [server.url]
+            assert len(DelayedRangeHandler.requests) == 2
+
+    def test_changed_mirror_list_is_probed_again(self):
+        clock = FakeClock()
+        with TemporaryDirectory() as mirror_dir, LocalHTTPServer(PosixPath(mirror_dir),
+                                                                 handler_class=DelayedRangeHandler) as server:
+            create_mirror_folder(PosixPath(mirror_dir), components=[Component.BASE])
+            ranking_file = PosixPath(mirror_dir).joinpath('mirrors.yaml')
+            MirrorSelector(mirrors=["http://127.0.0.1:1"], ranking_file=ranking_file,
+                           clock=clock).get_ranked_mirrors(probe_path=PROBE_PATH)
+
+            mirror_selector = MirrorSelector(mirrors=[server.url, "http://127.0.0.1:1"], ranking_file=ranking_file,
+                                             clock=clock)
+            assert mirror_selector.get_ranked_mirrors(probe_path=PROBE_PATH) == [server.url, "http://127.0.0.1:1"]
+
+    def test_demote(self):
+        clock = FakeClock()
+        with TemporaryDirectory() as temp_dir:
+            ranking_file = PosixPath(temp_dir).joinpath('mirrors.yaml')
+            mirrors = ["http://mirror1", "http://mirror2", "http://mirror3"]
+            MirrorSelector(mirrors=mirrors, ranking_file=ranking_file).write_ranking_file({'ranked_at': clock.now,
+                                                                                         'mirrors': mirrors})
+            mirror_selector = MirrorSelector(mirrors=mirrors, ranking_file=ranking_file, clock=clock)
+
+            assert mirror_selector.get_mirror("http://mirror2/pub/FreeBSD/base.txz") == "http://mirror2"
+            mirror_selector.get_ranked_mirrors(probe_path=PROBE_PATH)
+            mirror_selector.demote("http://mirror1")
+            assert mirror_selector.get_ranked_mirrors(probe_path=PROBE_PATH) == ["http://mirror2", "http://mirror3",
+                                                                                 "http://mirror1"]
+            assert MirrorSelector(mirrors=mirrors, ranking_file=ranking_file, clock=clock).get_ranked_mirrors(
+                probe_path=PROBE_PATH)[-1] == "http://mirror1"
@@ -0,0 +1,102 @@
+import io
+import os
+import tarfile
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from jmanager.utils.parallel_extract import ParallelTarExtractor
+
+
+def add_file(tar_file: tarfile.TarFile, name: str, content: bytes, mode: int = 0o644, mtime: int = 1500000000):
+    member = tarfile.TarInfo(name=name)
+    member.size = len(content)
+    member.mode = mode
+    member.mtime = mtime
+    tar_file.addfile(member, fileobj=io.BytesIO(content))
+
+
+def add_member(tar_file: tarfile.TarFile, name: str, member_type: bytes, mode: int = 0o755, linkname: str = ''):
+    member = tarfile.TarInfo(name=name)
+    member.type = member_type
+    member.mode = mode
+    member.linkname = linkname
+    member.mtime = 1500000000
+    tar_file.addfile(member)
+
+
+def create_test_tarball(path_to_tarball: PosixPath):
+    with tarfile.open(path_to_tarball.as_posix(), mode='w:xz') as tar_file:
+        add_member(tar_file, 'bin', tarfile.DIRTYPE)
+        add_member(tar_file, 'etc', tarfile.DIRTYPE, mode=0o700)
+        add_member(tar_file, 'usr', tarfile.DIRTYPE)
+        add_member(tar_file, 'usr/share', tarfile.DIRTYPE)
+        for index in range(50):
+            add_file(tar_file, f"usr/share/file_{index}", os.urandom(index * 1024))
+        add_file(tar_file, 'bin/sh', b'#!/bin/sh\n', mode=0o555)
+        add_file(tar_file, 'etc/rc.conf', b'first version\n', mode=0o600)
+        add_file(tar_file, 'etc/rc.conf', b'second version\n', mode=0o640)
+        add_member(tar_file, 'bin/csh', tarfile.LNKTYPE, linkname='bin/sh')
+        add_member(tar_file, 'usr/lib', tarfile.SYMTYPE, linkname='share')
+        add_file(tar_file, 'usr/lib/libc.so', b'library\n')
+
+
+def get_tree(path: PosixPath):
+    tree = {}
+    for root, folders, files in os.walk(path.as_posix()):
+        for name in folders + files:
+            node = os.path.join(root, name)
+            node_stat = os.lstat(node)
+            content = None
+            if os.path.islink(node):
+                content = os.readlink(node)
+            elif os.path.isfile(node):
+                content = open(node, 'rb').read()
+            tree[os.path.relpath(node, path.as_posix())] = (node_stat.st_mode, node_stat.st_nlink, content)
+            if not os.path.islink(node):
+                tree[os.path.relpath(node, path.as_posix())] += (int(node_stat.st_mtime),)
+    return tree
+
+
+class TestParallelTarExtractor:
+    def test_invalid_number_of_workers(self):
+        with pytest.raises(ValueError):
+            ParallelTarExtractor(workers=0)
+
+    def test_extraction_matches_tarfile(self):
+        with TemporaryDirectory() as temp_dir:
+            path_to_tarball = PosixPath(temp_dir).joinpath('base.txz')
+            create_test_tarball(path_to_tarball)
+
+            tarfile_path = PosixPath(temp_dir).joinpath('tarfile')
+            with tarfile.open(path_to_tarball.as_posix(), mode='r:xz') as tar_file:
+                tar_file.extractall(path=tarfile_path.as_posix())
+
+            parallel_path = PosixPath(temp_dir).joinpath('parallel')
+            parallel_path.mkdir()
+            ParallelTarExtractor(workers=4).extract_tarball(jail_path=parallel_path, path_to_tarball=path_to_tarball)
+
+            assert get_tree(parallel_path) == get_tree(tarfile_path)
+            assert os.path.samefile(parallel_path.joinpath('bin', 'sh'), parallel_path.joinpath('bin', 'csh'))
+            assert parallel_path.joinpath('etc', 'rc.conf').read_bytes() == b'second version\n'
+            assert not any(node.name.endswith('.tar') for node in PosixPath(temp_dir).iterdir())
+
+    def test_progress_reports_written_bytes(self):
+        progress = []
+
+        def _callback(msg: str, iteration: int, total: int):
+            assert msg == "Extracting base.txz"
+            progress.append((iteration, total))
+
+        with TemporaryDirectory() as temp_dir:
+            path_to_tarball = PosixPath(temp_dir).joinpath('base.txz')
+            create_test_tarball(path_to_tarball)
+            jail_path = PosixPath(temp_dir).joinpath('jail')
+            jail_path.mkdir()
+            ParallelTarExtractor(workers=3).extract_tarball(jail_path=jail_path, path_to_tarball=path_to_tarball,
+                                                            callback=_callback)
+
+        assert progress[0][0] == 0
+        assert progress[-1][0] == progress[-1][1]
+        assert all(iteration <= total for iteration, total in progress)
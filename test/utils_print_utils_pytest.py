@@ -1,4 +1,4 @@
-from jmanager.utils.print_utils import get_progress_text
+from jmanager.utils.print_utils import get_progress_text, ThroughputMeter, ProgressReporter
 
 PROGRESS_TEXT = "test |=========================                         | 50.0%"
 
@@ -6,3 +6,32 @@ PROGRESS_TEXT = "test |=========================                         | 50.0%
 class TestPrintUtils:
     def test_get_progress_text(self):
         assert get_progress_text(msg="test", iteration=1, total=2) == PROGRESS_TEXT
+
+    def test_throughput_meter_sliding_window(self):
+        now = [0.0]
+        throughput_meter = ThroughputMeter(window=2.0, clock=lambda: now[0])
+        assert throughput_meter.rate == 0.0
+
+        for second in range(5):
+            now[0] = float(second)
+            throughput_meter.update(total_bytes=second * 1000)
+        assert throughput_meter.rate == 1000.0
+
+        now[0] = 5.0
+        throughput_meter.update(total_bytes=4000)
+        now[0] = 6.0
+        throughput_meter.update(total_bytes=4000)
+        assert throughput_meter.rate == 0.0
+
+    def test_progress_reporter_throttles_callbacks(self):
+        now = [0.0]
+        calls = []
+        progress_reporter = ProgressReporter(callback=lambda msg, received, total, speed: calls.append(received),
+                                             msg="base.txz ", total=1000, interval=0.1, clock=lambda: now[0])
+        for received_bytes in range(10, 1001, 10):
+            now[0] += 0.01
+            progress_reporter.update(received_bytes)
+
+        assert calls[0] == 10
+        assert calls[-1] == 1000
+        assert len(calls) <= 12
@@ -0,0 +1,169 @@
+import gzip
+import hashlib
+import lzma
+import os
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+
+from jmanager.models.distribution import Component, Architecture
+from jmanager.utils.tarball_cache import TarballCache
+from jmanager.utils.tarball_codec import TarballCodec
+from test.globals import TEST_DISTRIBUTION, create_dummy_tarball_in_folder
+
+VERSION = TEST_DISTRIBUTION.version
+ARCHITECTURE = TEST_DISTRIBUTION.architecture
+
+
+def create_file(temp_dir: str, name: str, size: int = 1024) -> (PosixPath, str):
+    path_to_file = PosixPath(temp_dir).joinpath(name)
+    content = os.urandom(size)
+    path_to_file.write_bytes(content)
+    return path_to_file, hashlib.sha256(content).hexdigest()
+
+
+class TestTarballCache:
+    def test_lookup_missing_entry(self):
+        with TemporaryDirectory() as cache_dir:
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            assert tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE) is None
+
+    def test_insert_and_lookup(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            path_to_file, checksum = create_file(temp_dir, 'base.txz')
+            tarball_cache.insert(VERSION, ARCHITECTURE, Component.BASE, path_to_file=path_to_file, checksum=checksum)
+
+            cached_file = tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE, checksum=checksum)
+            assert cached_file.read_bytes() == path_to_file.read_bytes()
+            assert cached_file.name == checksum
+            assert tarball_cache.lookup(VERSION, Architecture.I386, Component.BASE) is None
+
+    def test_index_is_persistent(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+            path_to_file, checksum = create_file(temp_dir, 'base.txz')
+            TarballCache(cache_dir=PosixPath(cache_dir)).insert(VERSION, ARCHITECTURE, Component.BASE,
+                                                                path_to_file=path_to_file, checksum=checksum)
+
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            assert tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE, checksum=checksum) is not None
+            assert len(tarball_cache.list_entries()) == 1
+
+    def test_validators_are_persistent(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+            path_to_file, checksum = create_file(temp_dir, 'MANIFEST')
+            TarballCache(cache_dir=PosixPath(cache_dir)).insert(VERSION, ARCHITECTURE, Component.MANIFEST,
+                                                                path_to_file=path_to_file, checksum=checksum,
+                                                                etag='"1234"',
+                                                                last_modified='Sat, 12 Sep 2020 10:00:00 GMT')
+
+            entry = TarballCache(cache_dir=PosixPath(cache_dir)).get_entry(VERSION, ARCHITECTURE, Component.MANIFEST)
+            assert entry.etag == '"1234"'
+            assert entry.last_modified == 'Sat, 12 Sep 2020 10:00:00 GMT'
+
+    def test_lookup_with_different_checksum(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            path_to_file, checksum = create_file(temp_dir, 'base.txz')
+            cached_file = tarball_cache.insert(VERSION, ARCHITECTURE, Component.BASE,
+                                               path_to_file=path_to_file, checksum=checksum)
+
+            assert tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE, checksum='0' * 64) is None
+            assert not cached_file.exists()
+            assert not tarball_cache.list_entries()
+
+    def test_lookup_corrupted_object(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            path_to_file, checksum = create_file(temp_dir, 'base.txz')
+            cached_file = tarball_cache.insert(VERSION, ARCHITECTURE, Component.BASE,
+                                               path_to_file=path_to_file, checksum=checksum)
+            os.truncate(cached_file.as_posix(), 10)
+
+            assert tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE, checksum=checksum) is None
+
+    def test_content_addressed_objects_are_shared(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            path_to_file, checksum = create_file(temp_dir, 'base.txz')
+            tarball_cache.insert(VERSION, ARCHITECTURE, Component.BASE, path_to_file=path_to_file, checksum=checksum)
+            tarball_cache.insert(VERSION, Architecture.I386, Component.BASE,
+                                 path_to_file=path_to_file, checksum=checksum)
+
+            assert tarball_cache.size == 1024
+            tarball_cache.remove(VERSION, ARCHITECTURE, Component.BASE)
+            assert tarball_cache.lookup(VERSION, Architecture.I386, Component.BASE, checksum=checksum).is_file()
+
+    def test_lru_eviction(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir), max_size=2048)
+            base_file, base_checksum = create_file(temp_dir, 'base.txz')
+            src_file, src_checksum = create_file(temp_dir, 'src.txz')
+            lib32_file, lib32_checksum = create_file(temp_dir, 'lib32.txz')
+
+            tarball_cache.insert(VERSION, ARCHITECTURE, Component.BASE, path_to_file=base_file,
+                                 checksum=base_checksum)
+            tarball_cache.insert(VERSION, ARCHITECTURE, Component.SRC, path_to_file=src_file, checksum=src_checksum)
+            assert tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE) is not None
+            tarball_cache.insert(VERSION, ARCHITECTURE, Component.LIB32, path_to_file=lib32_file,
+                                 checksum=lib32_checksum)
+
+            assert tarball_cache.size <= 2048
+            assert tarball_cache.lookup(VERSION, ARCHITECTURE, Component.SRC) is None
+            assert tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE) is not None
+            assert tarball_cache.lookup(VERSION, ARCHITECTURE, Component.LIB32) is not None
+
+    def test_prune(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir))
+            base_file, base_checksum = create_file(temp_dir, 'base.txz')
+            src_file, src_checksum = create_file(temp_dir, 'src.txz')
+            tarball_cache.insert(VERSION, ARCHITECTURE, Component.BASE, path_to_file=base_file,
+                                 checksum=base_checksum)
+            tarball_cache.insert(VERSION, ARCHITECTURE, Component.SRC, path_to_file=src_file, checksum=src_checksum)
+
+            evicted_entries = tarball_cache.prune(max_size=1024)
+            assert [entry.component for entry in evicted_entries] == [Component.BASE]
+            evicted_entries = tarball_cache.prune(max_size=0)
+            assert [entry.component for entry in evicted_entries] == [Component.SRC]
+            assert tarball_cache.size == 0
+            assert not list(PosixPath(cache_dir).joinpath(TarballCache.OBJECTS_FOLDER).glob('*/*'))
+
+    def test_fast_copy(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir), codec=TarballCodec.GZIP)
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            path_to_file = PosixPath(temp_dir).joinpath('base.txz')
+            checksum = hashlib.sha256(path_to_file.read_bytes()).hexdigest()
+            tarball_cache.insert(VERSION, ARCHITECTURE, Component.BASE, path_to_file=path_to_file, checksum=checksum)
+            tarball_cache.wait_for_fast_copies()
+
+            assert tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE).name == checksum
+            fast_copy = tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE, fast_copy=True)
+            assert fast_copy.name == f"{checksum}.tgz"
+            assert gzip.decompress(fast_copy.read_bytes()) == lzma.decompress(path_to_file.read_bytes())
+            assert tarball_cache.size == path_to_file.stat().st_size + fast_copy.stat().st_size
+
+            tarball_cache.remove(VERSION, ARCHITECTURE, Component.BASE)
+            assert not list(PosixPath(cache_dir).joinpath(TarballCache.OBJECTS_FOLDER).glob('*/*'))
+
+    def test_fast_copy_of_older_entries(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+            create_dummy_tarball_in_folder(PosixPath(temp_dir))
+            path_to_file = PosixPath(temp_dir).joinpath('base.txz')
+            checksum = hashlib.sha256(path_to_file.read_bytes()).hexdigest()
+            TarballCache(cache_dir=PosixPath(cache_dir)).insert(VERSION, ARCHITECTURE, Component.BASE,
+                                                                path_to_file=path_to_file, checksum=checksum)
+
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir), codec=TarballCodec.TAR)
+            original = tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE, checksum=checksum, fast_copy=True)
+            assert original.name == checksum
+            tarball_cache.wait_for_fast_copies()
+            fast_copy = tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE, checksum=checksum, fast_copy=True)
+            assert fast_copy.read_bytes() == lzma.decompress(path_to_file.read_bytes())
+            assert tarball_cache.get_entry(VERSION, ARCHITECTURE, Component.BASE).fast_copy_codec == TarballCodec.TAR
+
+            tarball_cache = TarballCache(cache_dir=PosixPath(cache_dir), codec=TarballCodec.GZIP)
+            tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE, fast_copy=True)
+            tarball_cache.wait_for_fast_copies()
+            assert tarball_cache.lookup(VERSION, ARCHITECTURE, Component.BASE, fast_copy=True).suffix == '.tgz'
+            assert not fast_copy.exists()
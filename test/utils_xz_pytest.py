@@ -0,0 +1,102 @@
+import lzma
+import os
+import shutil
+import subprocess
+import tarfile
+from pathlib import PosixPath
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from jmanager.utils.file_utils import extract_tarball_into
+from jmanager.utils.xz import read_xz_blocks, is_multi_block_xz, XZBlockReader, open_xz_file, XZFormatError
+
+BLOCK_SIZE = 64 * 1024
+
+
+def create_multi_stream_file(path_to_file: PosixPath, data: bytes, block_size: int = BLOCK_SIZE):
+    with open(path_to_file.as_posix(), 'wb') as xz_file:
+        for offset in range(0, len(data), block_size):
+            xz_file.write(lzma.compress(data[offset:offset + block_size], check=lzma.CHECK_CRC64))
+            xz_file.write(b'\x00' * 8)
+
+
+def read_all(reader: XZBlockReader) -> bytes:
+    data = bytearray()
+    buffer = bytearray(10000)
+    while True:
+        read_bytes = reader.readinto(buffer)
+        if not read_bytes:
+            return bytes(data)
+        data += buffer[:read_bytes]
+
+
+class TestXZ:
+    def test_single_block_file(self):
+        with TemporaryDirectory() as temp_dir:
+            path_to_file = PosixPath(temp_dir).joinpath('file.xz')
+            path_to_file.write_bytes(lzma.compress(b'single block'))
+
+            assert len(read_xz_blocks(path_to_file)) == 1
+            assert not is_multi_block_xz(path_to_file)
+            with open_xz_file(path_to_file, workers=4) as xz_file:
+                assert isinstance(xz_file, lzma.LZMAFile)
+                assert xz_file.read() == b'single block'
+
+    def test_invalid_file(self):
+        with TemporaryDirectory() as temp_dir:
+            path_to_file = PosixPath(temp_dir).joinpath('file.xz')
+            path_to_file.write_bytes(b'not an xz file at all')
+
+            with pytest.raises(XZFormatError):
+                read_xz_blocks(path_to_file)
+            assert not is_multi_block_xz(path_to_file)
+
+    def test_multi_stream_file(self):
+        data = os.urandom(BLOCK_SIZE) * 3 + b'tail'
+        with TemporaryDirectory() as temp_dir:
+            path_to_file = PosixPath(temp_dir).joinpath('file.xz')
+            create_multi_stream_file(path_to_file, data)
+
+            blocks = read_xz_blocks(path_to_file)
+            assert [block.uncompressed_size for block in blocks] == [BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE, 4]
+            with XZBlockReader(path_to_file, workers=3) as reader:
+                assert read_all(reader) == data
+                assert reader.position == reader.size
+
+    @pytest.mark.skipif(shutil.which('xz') is None, reason="the xz utility is not installed")
+    def test_multi_block_stream(self):
+        data = os.urandom(BLOCK_SIZE * 5 + 123)
+        with TemporaryDirectory() as temp_dir:
+            path_to_file = PosixPath(temp_dir).joinpath('file')
+            path_to_file.write_bytes(data)
+            subprocess.run(['xz', '-T2', f"--block-size={BLOCK_SIZE}", path_to_file.as_posix()], check=True)
+            path_to_file = path_to_file.with_suffix('.xz')
+
+            blocks = read_xz_blocks(path_to_file)
+            assert len(blocks) == 6
+            assert len({block.stream_flags for block in blocks}) == 1
+            with open_xz_file(path_to_file, workers=2) as xz_file:
+                assert xz_file.read() == data
+
+    def test_extract_multi_block_tarball(self):
+        progress = []
+
+        def _callback(msg: str, iteration: int, total: int):
+            progress.append((iteration, total))
+
+        with TemporaryDirectory() as temp_dir:
+            path_to_tar = PosixPath(temp_dir).joinpath('base.tar')
+            with tarfile.open(path_to_tar.as_posix(), mode='w') as tar_file:
+                tar_file.add('jmanager', recursive=True)
+            path_to_tarball = PosixPath(temp_dir).joinpath('base.txz')
+            create_multi_stream_file(path_to_tarball, path_to_tar.read_bytes())
+
+            jail_path = PosixPath(temp_dir).joinpath('jail')
+            extract_tarball_into(jail_path=jail_path, path_to_tarball=path_to_tarball, callback=_callback,
+                                 decompression_workers=4)
+            assert jail_path.joinpath('jmanager', 'utils', 'xz.py').read_bytes() == \
+                PosixPath('jmanager', 'utils', 'xz.py').read_bytes()
+
+        assert progress[-1] == (progress[-1][1], progress[-1][1])
+        assert all(iteration <= total for iteration, total in progress)
@@ -0,0 +1,74 @@
+from pathlib import PosixPath
+from typing import List
+
+from jmanager.factories.data_set_factory import DataSetFactory
+from jmanager.utils.zfs_cache import ZFSStateCache
+from test.globals import TEST_DATA_SET, MockingZFS
+
+CACHE_DATA_SET = f"{TEST_DATA_SET}/zfs_cache"
+
+
+class CountingZFS(MockingZFS):
+    def __init__(self):
+        self.commands: List[str] = []
+        self.arguments: List[List[str]] = []
+
+    def zfs_cmd(self, cmd: str, arguments: List[str], options, data_set: str, operands: List[str] = ()):
+        self.commands.append(cmd)
+        self.arguments.append(list(arguments))
+        return super().zfs_cmd(cmd=cmd, arguments=arguments, options=options, data_set=data_set, operands=operands)
+
+
+class CountingDataSetFactory(DataSetFactory):
+    ZFS_FACTORY = CountingZFS()
+
+
+class TestZFSStateCache:
+    def test_queries_are_answered_from_memory(self):
+        zfs = CountingZFS()
+        zfs.zfs_create(data_set=f"{CACHE_DATA_SET}/data_set", options={})
+        zfs.zfs_snapshot(data_set=f"{CACHE_DATA_SET}/data_set", snapshot_name='first')
+        zfs.zfs_snapshot(data_set=f"{CACHE_DATA_SET}/data_set", snapshot_name='second')
+        zfs.commands.clear()
+        zfs.arguments.clear()
+        try:
+            zfs_state = ZFSStateCache(zfs=zfs, root_data_set=TEST_DATA_SET)
+            assert not zfs_state.is_loaded
+            for _ in range(10):
+                assert zfs_state.data_set_exists(f"{CACHE_DATA_SET}/data_set")
+                assert zfs_state.snapshot_exists(f"{CACHE_DATA_SET}/data_set", 'first')
+                assert not zfs_state.snapshot_exists(f"{CACHE_DATA_SET}/data_set", 'third')
+                assert not zfs_state.data_set_exists(f"{CACHE_DATA_SET}/missing")
+            assert zfs_state.list_snapshots(f"{CACHE_DATA_SET}/data_set") == ['first', 'second']
+            assert f"{CACHE_DATA_SET}/data_set@second" in zfs_state.list_all_snapshots()
+            assert zfs.commands == ['list']
+            assert zfs.arguments[0][zfs.arguments[0].index('-s') + 1] == 'createtxg'
+        finally:
+            zfs.zfs_destroy(data_set=CACHE_DATA_SET, arguments=['-r'])
+
+    def test_changes_patch_the_cache(self):
+        data_set_factory = CountingDataSetFactory(zfs_root_data_set=CACHE_DATA_SET)
+        zfs = data_set_factory.ZFS_FACTORY
+        zfs.zfs_create(data_set=CACHE_DATA_SET, options={})
+        try:
+            assert not data_set_factory.base_data_set_exists('base')
+            zfs.commands.clear()
+
+            data_set_factory.create_base_data_set('base', mountpoint=PosixPath('/tmp/jmanager_test_cache'))
+            data_set_factory.create_snapshot('base', snapshot='first')
+            data_set_factory.create_snapshot('base', snapshot='second')
+            data_set_factory.clone('base', snapshot_name='first', clone_data_set_name='clone', options={})
+            assert data_set_factory.base_data_set_exists('clone')
+            assert data_set_factory.get_latest_snapshot('base') == 'second'
+
+            data_set_factory.delete_data_set('clone')
+            data_set_factory.delete_snapshot('base', snapshot_name='second')
+            assert not data_set_factory.base_data_set_exists('clone')
+            assert data_set_factory.get_latest_snapshot('base') == 'first'
+            assert 'list' not in zfs.commands
+            patched_snapshots = data_set_factory.list_of_snapshots()
+
+            data_set_factory.refresh()
+            assert data_set_factory.list_of_snapshots() == patched_snapshots == ['base@first']
+        finally:
+            zfs.zfs_destroy(data_set=CACHE_DATA_SET, arguments=['-r'])
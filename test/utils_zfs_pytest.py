@@ -106,6 +106,17 @@ class TestZFS:
         finally:
             zfs.zfs_destroy(data_set=f"{TEST_DATA_SET}/a", arguments=['-R'])
 
+    def test_zfs_rollback(self, zfs: ZFS):
+        snapshot_name = "rollback_snap"
+        zfs.zfs_snapshot(data_set=TEST_DATA_SET, snapshot_name=snapshot_name)
+
+        try:
+            zfs.zfs_rollback(data_set=TEST_DATA_SET, snapshot_name=snapshot_name)
+            with pytest.raises(ZFSError):
+                zfs.zfs_rollback(data_set=TEST_DATA_SET, snapshot_name="missing_snap")
+        finally:
+            zfs.zfs_destroy(data_set=f"{TEST_DATA_SET}@{snapshot_name}")
+
     def test_zfs_clone_from_dataset(self, zfs: ZFS):
         with pytest.raises(ZFSError):
             zfs.zfs_clone(snapshot=f"{TEST_DATA_SET}", data_set=f"{TEST_DATA_SET}/clone", options={})